@@ -0,0 +1,209 @@
+"""
+Controle de admissão por classe de carga.
+
+Um único processo atende o /gold_api, webhooks de pagamento, páginas do jogador, o catálogo
+público e relatórios pesados do admin, todos sobre o mesmo pool de conexões. Cada requisição é
+classificada pelo path e só entra se a sua classe tiver vaga; caso contrário espera em uma fila
+FIFO da própria classe (limitada em tamanho e tempo) e, se a fila estiver cheia ou a espera
+estourar, recebe 503 com Retry-After (load shedding).
+
+Orçamento de conexões: cada requisição usa no máximo uma sessão do banco, então o limite de
+concorrência de uma classe é também o número máximo de conexões que ela ocupa. Os limites padrão
+das classes não-wallet somam menos que a capacidade do pool síncrono (POOL_SIZE + MAX_OVERFLOW),
+deixando conexões livres para o /gold_api e para as tarefas de fundo (write-behind de apostas,
+snapshots do ledger). A classe wallet não tem limite nem fila: callbacks do IGameWin nunca esperam
+atrás de um dashboard.
+
+Só passam pelo controle rotas que ocupam o banco. Ficam de fora: as listas de jogos e o lobby
+(servidos do snapshot em memória do catálogo), miniaturas e uploads (mmap/disco) e o CRUD do admin
+(poucas requisições, feitas por pessoas; o SPA dispara várias em paralelo). Do admin, só os
+relatórios pesados (/stats e /ggr) têm classe própria (reports).
+
+O launch de jogos tem classe própria (launch): segura a sessão do banco durante a chamada ao
+IGameWin (lenta, com retries e hedging), e uma rajada de launches com o provedor lento não pode
+ocupar as vagas de login, /api/auth/me e cadastro (player).
+
+Configuração por classe: ADMISSION_<CLASSE>_LIMIT (0 = sem limite), ADMISSION_<CLASSE>_QUEUE e
+ADMISSION_<CLASSE>_TIMEOUT (segundos). ADMISSION_CONTROL_ENABLED=false desliga o controle.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+import metrics
+from database import MAX_OVERFLOW, POOL_SIZE
+
+ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() not in ("0", "false", "no")
+
+WALLET = "wallet"
+WEBHOOKS = "webhooks"
+PLAYER = "player"
+LAUNCH = "launch"
+CATALOG = "catalog"
+REPORTS = "reports"
+
+_POOL_CAPACITY = POOL_SIZE + MAX_OVERFLOW
+
+# (fração da capacidade do pool, tamanho da fila, espera máxima em segundos)
+_DEFAULTS = {
+    WALLET: (0.0, 0, 0.0),
+    WEBHOOKS: (0.2, 200, 10.0),
+    PLAYER: (0.3, 200, 5.0),
+    LAUNCH: (0.15, 100, 5.0),
+    CATALOG: (0.15, 100, 3.0),
+    REPORTS: (0.1, 20, 15.0),
+}
+
+# Relatórios do admin que agregam tabelas inteiras (bets, transações)
+_REPORT_PREFIXES = ("/api/admin/stats", "/api/admin/ggr/")
+
+# GETs servidos da memória ou do disco, sem conexão do banco (fora do controle)
+_MEMORY_PREFIXES = ("/api/public/games", "/api/public/media/thumbnails/", "/api/public/media/uploads/")
+
+# GETs públicos de configuração e conteúdo que leem o banco (o restante de /api/public é tráfego
+# do jogador: pagamentos, cupons...)
+_CATALOG_PREFIXES = (
+    "/api/public/themes",
+    "/api/public/media/",
+    "/api/public/promotions",
+    "/api/public/tracking-config",
+    "/api/public/support-config",
+    "/api/public/minimums",
+)
+
+# Rotas internas fora do controle (monitoramento precisa responder mesmo sob carga)
+_EXEMPT_PATHS = ("/", "/metrics", "/api/health")
+
+
+class WorkloadClass:
+    """Limite de concorrência com fila FIFO limitada para uma classe de carga."""
+
+    def __init__(self, name: str, limit: int, max_queue: int, queue_timeout: float) -> None:
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.admitted = 0
+        self.queued = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.wait_seconds = 0.0
+
+    async def acquire(self) -> bool:
+        """Ocupa uma vaga (esperando na fila se preciso). False = requisição deve ser rejeitada."""
+        if self.limit <= 0 or (self.in_flight < self.limit and not self._waiters):
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.shed_queue_full += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                waiter.cancel()
+                self._waiters.remove(waiter)
+                self.shed_timeout += 1
+                return False
+            # A vaga chegou junto com o timeout: segue admitida
+        except asyncio.CancelledError:
+            # Cliente desconectou enquanto esperava: devolve a vaga se ela já tinha sido repassada
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            raise
+        self.wait_seconds += time.monotonic() - started
+        self.admitted += 1
+        return True
+
+    def release(self) -> None:
+        """Libera a vaga, repassando-a diretamente ao próximo da fila (in_flight não muda)."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+            "wait_seconds": round(self.wait_seconds, 3),
+        }
+
+
+def _build_classes() -> Dict[str, WorkloadClass]:
+    classes = {}
+    for name, (share, max_queue, timeout) in _DEFAULTS.items():
+        prefix = f"ADMISSION_{name.upper()}"
+        default_limit = int(_POOL_CAPACITY * share) if share else 0
+        classes[name] = WorkloadClass(
+            name,
+            limit=int(os.getenv(f"{prefix}_LIMIT", str(default_limit))),
+            max_queue=int(os.getenv(f"{prefix}_QUEUE", str(max_queue))),
+            queue_timeout=float(os.getenv(f"{prefix}_TIMEOUT", str(timeout))),
+        )
+    return classes
+
+
+classes: Dict[str, WorkloadClass] = _build_classes()
+
+
+def classify(method: str, path: str) -> Optional[WorkloadClass]:
+    """Classe de carga da requisição, ou None se ela não passa pelo controle de admissão."""
+    if not ENABLED or method == "OPTIONS" or path in _EXEMPT_PATHS:
+        return None
+    if path.endswith("/gold_api"):
+        return classes[WALLET]
+    if path.startswith("/api/webhooks"):
+        return classes[WEBHOOKS]
+    if path.startswith("/api/admin"):
+        return classes[REPORTS] if path.startswith(_REPORT_PREFIXES) else None
+    if method == "GET" and path.startswith(_MEMORY_PREFIXES):
+        return classes[LAUNCH] if path.endswith("/launch") else None
+    if method == "GET" and path.startswith(_CATALOG_PREFIXES):
+        return classes[CATALOG]
+    return classes[PLAYER]
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    return {name: workload.stats() for name, workload in classes.items()}
+
+
+def _metric_lines() -> List[str]:
+    snapshot = stats()
+
+    def samples(key: str):
+        return [({"class": name}, values[key]) for name, values in snapshot.items()]
+
+    shed = [({"class": name, "reason": "queue_full"}, values["shed_queue_full"]) for name, values in snapshot.items()]
+    shed += [({"class": name, "reason": "timeout"}, values["shed_timeout"]) for name, values in snapshot.items()]
+    return (
+        metrics.gauge("admission_limit", "Limite de concorrência da classe (0 = sem limite)", samples("limit"))
+        + metrics.gauge("admission_in_flight", "Requisições em execução na classe", samples("in_flight"))
+        + metrics.gauge("admission_waiting", "Requisições na fila da classe", samples("waiting"))
+        + metrics.counter_samples("admission_admitted_total", "Requisições admitidas", samples("admitted"))
+        + metrics.counter_samples("admission_shed_total", "Requisições rejeitadas com 503", shed)
+        + metrics.counter_samples("admission_wait_seconds_total", "Tempo total de espera na fila", samples("wait_seconds"))
+    )
+
+
+metrics.register_collector(_metric_lines)
@@ -0,0 +1,163 @@
+"""
+Cache em memória dos agentes IGameWin ativos para autenticação do /gold_api.
+
+Mantém um snapshot imutável {agent_code: CachedAgent} com o agent_secret já extraído do JSON
+de credentials. O snapshot é versionado: os endpoints de CRUD de agentes chamam invalidate(),
+que incrementa a versão, e a próxima leitura agenda a reconstrução com uma única query.
+Um TTL curto garante que outros processos (workers) também convirjam após alterações.
+
+A query roda numa thread em segundo plano (uma por vez); enquanto isso as leituras continuam
+usando o snapshot anterior, então o /gold_api nunca espera o banco no event loop. Só um
+agent_code desconhecido espera uma recarga (agente recém-criado), sem bloquear o loop.
+
+Alterações feitas pelo admin não esperam o TTL: reload() tira na hora os agentes alterados do
+snapshot (secret antigo ou agente desativado deixam de valer imediatamente) e só retorna depois
+de reconstruí-lo. Cada reconstrução tem um número de geração: uma recarga de fundo que começou
+antes da alteração e termina depois não sobrescreve o snapshot mais novo.
+"""
+import asyncio
+import hmac
+import json
+import os
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+from models import IGameWinAgent
+
+SNAPSHOT_TTL_SECONDS = float(os.getenv("AGENT_CACHE_TTL_SECONDS", "60"))
+# agent_code desconhecido força no máximo uma recarga por este intervalo (agent_codes inválidos não martelam o banco)
+MISS_REFRESH_SECONDS = 5.0
+
+
+class CachedAgent(NamedTuple):
+    id: int
+    agent_code: str
+    agent_key: str
+    api_url: str
+    secret: bytes  # agent_secret das credentials, ou agent_key se não houver
+
+
+_lock = threading.Lock()
+_snapshot: Dict[str, CachedAgent] = {}
+_version = 0
+_loaded_version = -1
+_loaded_at = 0.0
+_refresh_task: Optional[asyncio.Task] = None
+_generation = 0  # reconstruções iniciadas
+_installed_generation = 0  # geração do snapshot em uso
+
+
+def invalidate(*agent_codes: str) -> None:
+    """Marca o snapshot como desatualizado e tira dele os agent_codes informados (deixam de autenticar)."""
+    global _version, _snapshot
+    with _lock:
+        _version += 1
+        if agent_codes:
+            _snapshot = {code: agent for code, agent in _snapshot.items() if code not in agent_codes}
+
+
+def _build_snapshot() -> Dict[str, CachedAgent]:
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        agents = db.query(IGameWinAgent).filter(IGameWinAgent.is_active == True).all()
+        snapshot: Dict[str, CachedAgent] = {}
+        for agent in agents:
+            credentials_dict = {}
+            if agent.credentials:
+                try:
+                    credentials_dict = json.loads(agent.credentials)
+                except Exception:
+                    pass
+            if not isinstance(credentials_dict, dict):
+                credentials_dict = {}
+            # agent_secret pode estar em credentials ou ser o mesmo que agent_key
+            expected_secret = credentials_dict.get("agent_secret") or agent.agent_key or ""
+            snapshot[agent.agent_code] = CachedAgent(
+                id=agent.id,
+                agent_code=agent.agent_code,
+                agent_key=agent.agent_key,
+                api_url=agent.api_url,
+                secret=str(expected_secret).encode("utf-8"),
+            )
+        return snapshot
+    finally:
+        db.close()
+
+
+def _stale() -> bool:
+    return _loaded_version != _version or time.monotonic() - _loaded_at >= SNAPSHOT_TTL_SECONDS
+
+
+async def _refresh() -> Dict[str, CachedAgent]:
+    global _snapshot, _loaded_version, _loaded_at, _generation, _installed_generation
+    version = _version
+    _generation += 1
+    generation = _generation
+    try:
+        snapshot = await asyncio.to_thread(_build_snapshot)
+    except Exception as e:
+        # Mantém o snapshot anterior; a próxima leitura tenta de novo
+        print(f"[Agent Cache] Erro ao recarregar agentes: {e}")
+        return _snapshot
+    if generation < _installed_generation:
+        # Uma reconstrução iniciada depois (ex.: reload() do admin) já instalou dados mais novos
+        return _snapshot
+    _snapshot = snapshot
+    _installed_generation = generation
+    _loaded_version = version
+    _loaded_at = time.monotonic()
+    return snapshot
+
+
+def _schedule_refresh() -> asyncio.Task:
+    global _refresh_task
+    if _refresh_task is None or _refresh_task.done():
+        _refresh_task = asyncio.create_task(_refresh())
+    return _refresh_task
+
+
+async def reload(*agent_codes: str) -> None:
+    """
+    Após criar/alterar/remover agentes (depois do commit): tira os agent_codes afetados do snapshot
+    na hora e espera a reconstrução (numa thread). agent_codes desconhecidos esperam essa recarga.
+    """
+    global _refresh_task
+    invalidate(*agent_codes)
+    task = asyncio.create_task(_refresh())
+    _refresh_task = task
+    await asyncio.shield(task)
+
+
+async def start() -> None:
+    """Carrega o snapshot na inicialização (o primeiro /gold_api não espera o banco)."""
+    snapshot = await _schedule_refresh()
+    print(f"[Agent Cache] {len(snapshot)} agentes ativos carregados")
+
+
+async def get_agent(agent_code: Optional[str]) -> Optional[CachedAgent]:
+    """Agente ativo com este agent_code, ou None."""
+    if not agent_code:
+        return None
+    if _loaded_version < 0:
+        # Nada carregado ainda: não há versão anterior para servir
+        await asyncio.shield(_schedule_refresh())
+    elif _stale():
+        _schedule_refresh()
+    agent = _snapshot.get(agent_code)
+    if agent is None:
+        task = _refresh_task
+        if (task is None or task.done()) and time.monotonic() - _loaded_at >= MISS_REFRESH_SECONDS:
+            task = _schedule_refresh()
+        if task is not None and not task.done():
+            agent = (await asyncio.shield(task)).get(agent_code)
+    return agent
+
+
+def verify_secret(agent: CachedAgent, agent_secret: Optional[str]) -> bool:
+    """Compara o agent_secret recebido em tempo constante."""
+    if agent_secret is None:
+        return False
+    return hmac.compare_digest(agent.secret, str(agent_secret).encode("utf-8"))
@@ -0,0 +1,151 @@
+"""
+Cache em memória do saldo dos usuários para o método user_balance do /gold_api.
+
+Os clientes de jogo consultam o saldo o tempo todo; com o cache, a maioria dessas consultas não
+toca o banco. Chave: username (user_code do IGameWin).
+
+Consistência:
+- write-through: o /gold_api grava no cache o saldo retornado pelo motor de carteira após o commit;
+- invalidação: toda alteração de saldo fora do /gold_api passa pelo ledger (wallet_ledger.record),
+  que marca o usuário na sessão; após o commit dessa sessão a entrada é removida do cache
+  (webhooks de depósito/saque, aprovações do admin, bônus, comissões);
+- TTL (BALANCE_CACHE_TTL_SECONDS) limita a defasagem para outros processos/workers.
+
+Versão: cada entrada guarda o id da última WalletEntry do usuário refletida no saldo. O id é
+alocado com a linha do usuário travada, então cresce na ordem dos commits. put() recusa uma
+versão mais antiga que a já conhecida para o usuário, e a invalidação pós-commit deixa a versão
+da entrada do ledger como lápide: um preenchimento de cache miss que leu o saldo antes desse
+commit (versão menor) é descartado, assim como write-throughs concorrentes fora de ordem.
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+TTL_SECONDS = float(os.getenv("BALANCE_CACHE_TTL_SECONDS", "10"))
+MAX_ENTRIES = int(os.getenv("BALANCE_CACHE_MAX_ENTRIES", "50000"))
+
+_SESSION_KEY = "balance_cache_dirty_user_ids"
+
+
+class CachedBalance(NamedTuple):
+    user_id: int
+    balance: float
+    version: int  # id da última WalletEntry refletida em `balance`
+    expires_at: float
+
+
+_lock = threading.Lock()
+_entries: Dict[str, CachedBalance] = {}
+_usernames: Dict[int, str] = {}  # user_id -> username, para invalidar por id
+# user_id -> maior versão conhecida (de put ou de invalidação); limitado a MAX_ENTRIES
+_versions: Dict[int, int] = {}
+
+_stats: Dict[str, int] = {
+    "hits": 0,
+    "misses": 0,
+    "expired": 0,
+    "writes": 0,
+    "invalidations": 0,
+    "evictions": 0,
+    "stale_writes": 0,
+}
+
+
+def get(user_code: str) -> Optional[float]:
+    """Saldo em cache para o username, ou None (ausente/expirado)."""
+    entry = _entries.get(user_code)
+    if entry is None:
+        _stats["misses"] += 1
+        return None
+    if entry.expires_at <= time.monotonic():
+        _stats["expired"] += 1
+        _stats["misses"] += 1
+        return None
+    _stats["hits"] += 1
+    return entry.balance
+
+
+def _bump_version(user_id: int, version: int) -> None:
+    """Registra `version` como a maior conhecida do usuário (chamar com _lock)."""
+    _versions.pop(user_id, None)
+    _versions[user_id] = version
+    if len(_versions) > MAX_ENTRIES:
+        del _versions[next(iter(_versions))]
+
+
+def put(user_code: str, user_id: int, balance: float, version: int) -> bool:
+    """
+    Grava o saldo lido/produzido na `version` (id da última WalletEntry do usuário; 0 se nenhuma).
+    Chamar somente após o commit que o produziu. Recusa versões mais antigas que a já conhecida;
+    retorna False nesse caso.
+    """
+    version = int(version or 0)
+    with _lock:
+        if version < _versions.get(user_id, 0):
+            _stats["stale_writes"] += 1
+            return False
+        if user_code not in _entries and len(_entries) >= MAX_ENTRIES:
+            # Remove a entrada mais antiga (ordem de inserção)
+            oldest = next(iter(_entries))
+            _usernames.pop(_entries.pop(oldest).user_id, None)
+            _stats["evictions"] += 1
+        _entries[user_code] = CachedBalance(user_id, float(balance), version, time.monotonic() + TTL_SECONDS)
+        _usernames[user_id] = user_code
+        _bump_version(user_id, version)
+        _stats["writes"] += 1
+    return True
+
+
+def invalidate(user_code: str) -> None:
+    with _lock:
+        entry = _entries.pop(user_code, None)
+        if entry is not None:
+            _usernames.pop(entry.user_id, None)
+            _stats["invalidations"] += 1
+
+
+def invalidate_user(user_id: int, version: Optional[int] = None) -> None:
+    """Remove o saldo do usuário; com `version`, deixa a lápide que recusa puts mais antigos."""
+    with _lock:
+        user_code = _usernames.pop(user_id, None)
+        if user_code is not None and _entries.pop(user_code, None) is not None:
+            _stats["invalidations"] += 1
+        if version is not None and version > _versions.get(user_id, 0):
+            _bump_version(user_id, version)
+
+
+def mark_dirty(db: Session, user_id: int, entry: Any) -> None:
+    """
+    Agenda a invalidação do usuário para depois do commit da sessão (descartada em rollback).
+    O id da WalletEntry `entry`, alocado no flush, vira a versão da lápide.
+    """
+    db.info.setdefault(_SESSION_KEY, []).append((user_id, entry))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    for user_id, entry in session.info.pop(_SESSION_KEY, ()):
+        # identity vem da identity key: não recarrega atributos expirados pelo commit
+        identity = inspect(entry).identity
+        invalidate_user(user_id, identity[0] if identity else None)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_SESSION_KEY, None)
+
+
+def stats() -> Dict[str, Any]:
+    """Contadores de acerto/erro do cache de saldo."""
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        **_stats,
+        "hit_ratio": round(_stats["hits"] / lookups, 4) if lookups else None,
+        "entries": len(_entries),
+        "max_entries": MAX_ENTRIES,
+        "ttl_seconds": TTL_SECONDS,
+    }
@@ -0,0 +1,530 @@
+"""
+Teste de carga do modo Seamless (/gold_api) com um simulador local do IGameWin.
+
+Sobe a aplicação (uvicorn) contra um banco semeado e reproduz o tráfego que o IGameWin envia:
+consultas `user_balance` e `transaction` (debit, credit, debit_credit), com retries do mesmo
+txn_id e txn_ids enviados em duplicidade de forma concorrente. Cada jogador virtual joga em
+sequência (como um jogador real); muitos jogadores jogam ao mesmo tempo, e um marcapasso limita
+o total de rodadas por segundo à taxa alvo.
+
+O simulador mantém o saldo esperado de cada jogador e verifica os invariantes da carteira:
+- cada resposta de transação traz exatamente o saldo esperado (ou INSUFFICIENT_USER_FUNDS);
+- retries e duplicatas recebem a mesma resposta e são aplicados uma única vez;
+- o saldo nunca fica negativo;
+- ao final: users.balance == saldo esperado, soma do ledger == variação do saldo e
+  uma Bet por aposta.
+
+Uso (a partir de backend/):
+    python -m benchmarks.gold_api_load --users 50 --rate 200 --duration 30
+    python -m benchmarks.gold_api_load --database-url postgresql://... --json resultado.json
+
+Sem --database-url, usa um SQLite novo em diretório temporário.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+AGENT_CODE = "LOADTEST"
+AGENT_SECRET = "loadtest-secret"
+USER_PREFIX = "lt_user_"
+PROVIDER_CODE = "LOADTEST"
+GAME_CODES = ["lt_fortune_tiger", "lt_fortune_ox", "lt_gates_olympus", "lt_sweet_bonanza"]
+
+
+# ========== BANCO ==========
+
+def _database_module(database_url: str):
+    """Importa database/models apontando para o banco do teste (DATABASE_URL é lido no import)."""
+    os.environ["DATABASE_URL"] = database_url
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    import database
+
+    database.engine.echo = False
+    return database
+
+
+def seed(database_url: str, users: int, initial_balance: float) -> Dict[str, int]:
+    """Cria/zera o agente e os jogadores do teste. Retorna {username: user_id}."""
+    database = _database_module(database_url)
+    from auth import get_password_hash
+    from models import IGameWinAgent, User
+
+    database.init_db()
+    db = database.SessionLocal()
+    try:
+        agent = db.query(IGameWinAgent).filter(IGameWinAgent.agent_code == AGENT_CODE).first()
+        if not agent:
+            agent = IGameWinAgent(agent_code=AGENT_CODE, agent_key=AGENT_SECRET, api_url="http://127.0.0.1")
+            db.add(agent)
+        agent.is_active = True
+        agent.credentials = json.dumps({"agent_secret": AGENT_SECRET})
+
+        password_hash = get_password_hash(uuid.uuid4().hex)
+        existing = {
+            u.username: u for u in db.query(User).filter(User.username.like(f"{USER_PREFIX}%")).all()
+        }
+        for i in range(users):
+            username = f"{USER_PREFIX}{i}"
+            user = existing.get(username)
+            if not user:
+                user = User(username=username, email=f"{username}@loadtest.local", password_hash=password_hash)
+                db.add(user)
+            # Sem bônus nem rollover: o saldo esperado é exatamente saldo - apostas + ganhos
+            user.balance = initial_balance
+            user.bonus_balance = 0.0
+            user.bonus_wagering_remaining = 0.0
+            user.is_active = True
+        db.commit()
+        return {
+            u.username: u.id
+            for u in db.query(User).filter(User.username.like(f"{USER_PREFIX}%")).all()
+            if int(u.username[len(USER_PREFIX):]) < users
+        }
+    finally:
+        db.close()
+
+
+def ledger_marker(database_url: str) -> int:
+    """Maior id do ledger antes do teste (o teste só confere as entradas criadas depois)."""
+    database = _database_module(database_url)
+    from sqlalchemy import func
+    from models import WalletEntry
+
+    db = database.SessionLocal()
+    try:
+        return db.query(func.max(WalletEntry.id)).scalar() or 0
+    finally:
+        db.close()
+
+
+def verify_database(
+    database_url: str,
+    user_ids: Dict[str, int],
+    expected: Dict[str, float],
+    initial_balance: float,
+    ledger_from: int,
+    bet_txn_ids: List[str],
+) -> List[str]:
+    """Invariantes finais no banco. Retorna a lista de violações."""
+    database = _database_module(database_url)
+    from sqlalchemy import func, select
+    from models import Bet, User, WalletEntry
+
+    violations: List[str] = []
+    db = database.SessionLocal()
+    try:
+        balances = dict(
+            db.query(User.username, User.balance).filter(User.username.in_(list(user_ids))).all()
+        )
+        ledger = dict(
+            db.query(WalletEntry.user_id, func.sum(WalletEntry.balance_delta))
+            .filter(WalletEntry.id > ledger_from, WalletEntry.user_id.in_(list(user_ids.values())))
+            .group_by(WalletEntry.user_id)
+            .all()
+        )
+        for username, user_id in user_ids.items():
+            balance = float(balances.get(username, 0.0))
+            if abs(balance - expected[username]) > 0.005:
+                violations.append(f"saldo final de {username}: banco={balance:.2f} esperado={expected[username]:.2f}")
+            if balance < 0:
+                violations.append(f"saldo negativo de {username}: {balance:.2f}")
+            delta = float(ledger.get(user_id) or 0.0)
+            if abs(delta - (balance - initial_balance)) > 0.005:
+                violations.append(
+                    f"ledger de {username}: soma={delta:.2f} variação do saldo={balance - initial_balance:.2f}"
+                )
+
+        persisted = set()
+        for i in range(0, len(bet_txn_ids), 500):
+            chunk = bet_txn_ids[i:i + 500]
+            persisted.update(db.execute(select(Bet.external_id).where(Bet.external_id.in_(chunk))).scalars().all())
+        missing = [t for t in bet_txn_ids if t not in persisted]
+        if missing:
+            violations.append(f"{len(missing)} apostas sem registro em bets (ex.: {missing[:3]})")
+        duplicated = (
+            db.query(Bet.external_id)
+            .filter(Bet.external_id.in_(bet_txn_ids[:5000]))
+            .group_by(Bet.external_id)
+            .having(func.count(Bet.id) > 1)
+            .all()
+        ) if bet_txn_ids else []
+        if duplicated:
+            violations.append(f"{len(duplicated)} apostas gravadas em duplicidade (ex.: {[d[0] for d in duplicated[:3]]})")
+    finally:
+        db.close()
+    return violations
+
+
+# ========== SERVIDOR ==========
+
+def start_server(database_url: str, port: int, log_path: str) -> subprocess.Popen:
+    env = {**os.environ, "DATABASE_URL": database_url}
+    log = open(log_path, "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+
+async def wait_ready(base_url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                r = await client.get(f"{base_url}/gold_api", timeout=2.0)
+                if r.status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"Servidor não respondeu em {timeout:.0f}s ({base_url})")
+
+
+def stop_server(proc: subprocess.Popen) -> None:
+    # SIGTERM: o shutdown da aplicação drena o write-behind de apostas antes de sair
+    proc.terminate()
+    try:
+        proc.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+# ========== SIMULADOR DO IGAMEWIN ==========
+
+class Stats:
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.violations: List[str] = []
+        self.spins = 0
+        self.requests = 0
+        self.insufficient = 0
+        self.retries = 0
+        self.collisions = 0
+
+    def violation(self, message: str) -> None:
+        self.violations.append(message)
+
+
+class IGameWinStandIn:
+    """Faz o papel do servidor do IGameWin: chama o /gold_api do site como faria em produção."""
+
+    def __init__(self, client: httpx.AsyncClient, base_url: str, args: argparse.Namespace, stats: Stats) -> None:
+        self.client = client
+        self.url = f"{base_url}/gold_api"
+        self.args = args
+        self.stats = stats
+        self.run_id = uuid.uuid4().hex[:8]
+        self.bet_txn_ids: List[str] = []
+
+    async def _call(self, kind: str, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        body = {"agent_code": AGENT_CODE, "agent_secret": AGENT_SECRET, **payload}
+        started = time.perf_counter()
+        try:
+            r = await self.client.post(self.url, json=body, timeout=self.args.timeout)
+            data = r.json()
+        except (httpx.HTTPError, ValueError) as e:
+            self.stats.errors[f"{kind}:{type(e).__name__}"] += 1
+            return None
+        finally:
+            self.stats.requests += 1
+        self.stats.latencies[kind].append(time.perf_counter() - started)
+        if data.get("msg") not in (None, "INSUFFICIENT_USER_FUNDS"):
+            self.stats.errors[f"{kind}:{data.get('msg')}"] += 1
+        return data
+
+    async def _transaction(self, user: str, txn_type: str, txn_id: str, bet: float, win: float) -> Optional[Dict[str, Any]]:
+        payload = {
+            "method": "transaction",
+            "user_code": user,
+            "game_type": "slot",
+            "slot": {
+                "txn_type": txn_type,
+                "txn_id": txn_id,
+                "bet_money": bet,
+                "win_money": win,
+                "provider_code": PROVIDER_CODE,
+                "game_code": random.choice(GAME_CODES),
+                "type": "BASE",
+            },
+        }
+        if random.random() < self.args.collision_ratio:
+            # Mesmo txn_id enviado duas vezes ao mesmo tempo: só uma pode ser aplicada
+            self.stats.collisions += 1
+            first, second = await asyncio.gather(self._call(txn_type, payload), self._call(f"{txn_type}:collision", payload))
+            if first and second and first != second:
+                self.stats.violation(f"colisão {txn_type} {txn_id}: respostas diferentes {first} / {second}")
+            response = first or second
+        else:
+            response = await self._call(txn_type, payload)
+        if response is not None and random.random() < self.args.retry_ratio:
+            # Retry após a resposta (timeout do lado do IGameWin): deve receber a mesma resposta
+            self.stats.retries += 1
+            replay = await self._call(f"{txn_type}:retry", payload)
+            if replay is not None and replay != response:
+                self.stats.violation(f"retry {txn_type} {txn_id}: {replay} != {response}")
+        return response
+
+    def _check(self, user: str, txn_type: str, txn_id: str, response: Optional[Dict[str, Any]], expected: float, insufficient: bool) -> None:
+        if response is None:
+            return
+        if insufficient:
+            if response.get("msg") != "INSUFFICIENT_USER_FUNDS":
+                self.stats.violation(f"{txn_type} {txn_id} de {user}: esperado INSUFFICIENT_USER_FUNDS, recebido {response}")
+            return
+        if response.get("status") != 1:
+            self.stats.violation(f"{txn_type} {txn_id} de {user}: recusado {response}")
+            return
+        balance = float(response.get("user_balance", 0.0))
+        if abs(balance - expected) > 0.005:
+            self.stats.violation(f"{txn_type} {txn_id} de {user}: saldo {balance:.2f} esperado {expected:.2f}")
+        if balance < 0:
+            self.stats.violation(f"{txn_type} {txn_id} de {user}: saldo negativo {balance:.2f}")
+
+    async def spin(self, user: str, seq: int, balance: float) -> float:
+        """Uma rodada do jogador. Retorna o saldo esperado depois dela."""
+        args = self.args
+        for _ in range(args.balance_polls):
+            response = await self._call("user_balance", {"method": "user_balance", "user_code": user})
+            if response is not None and float(response.get("user_balance", 0.0)) < 0:
+                self.stats.violation(f"user_balance de {user} negativo: {response}")
+
+        txn_id = f"lt-{self.run_id}-{user}-{seq}"
+        insufficient = random.random() < args.insufficient_ratio
+        bet = round(balance + 1.0, 2) if insufficient else round(random.uniform(args.min_bet, args.max_bet), 2)
+        # RTP aproximado: ~40% das rodadas pagam algo
+        win = round(bet * random.choice([0, 0, 0, 0.5, 1.2, 2.0, 5.0]), 2) if random.random() < 0.4 else 0.0
+        if insufficient:
+            win = 0.0
+        if not insufficient and bet > balance:
+            bet = round(balance, 2)
+        self.stats.spins += 1
+
+        if random.random() < args.debit_credit_ratio:
+            response = await self._transaction(user, "debit_credit", txn_id, bet, win)
+            if insufficient:
+                self.stats.insufficient += 1
+                self._check(user, "debit_credit", txn_id, response, balance, True)
+                return balance
+            balance = balance - bet + win
+            self._check(user, "debit_credit", txn_id, response, balance, False)
+            if response is not None and bet > 0:
+                self.bet_txn_ids.append(txn_id)
+            return balance
+
+        response = await self._transaction(user, "debit", txn_id, bet, 0.0)
+        if insufficient:
+            self.stats.insufficient += 1
+            self._check(user, "debit", txn_id, response, balance, True)
+            return balance
+        balance = balance - bet
+        self._check(user, "debit", txn_id, response, balance, False)
+        if response is None:
+            # Estado desconhecido (erro de rede): a conferência final no banco resolve
+            return balance
+        if bet > 0:
+            self.bet_txn_ids.append(txn_id)
+        response = await self._transaction(user, "credit", txn_id, 0.0, win)
+        balance = balance + win
+        self._check(user, "credit", txn_id, response, balance, False)
+        return balance
+
+
+async def run_load(base_url: str, usernames: List[str], args: argparse.Namespace) -> Tuple[Stats, Dict[str, float], List[str], float]:
+    stats = Stats()
+    expected = {u: args.initial_balance for u in usernames}
+    limits = httpx.Limits(max_connections=len(usernames) * 2, max_keepalive_connections=len(usernames) * 2)
+    slots: asyncio.Queue = asyncio.Queue(maxsize=len(usernames) * 4)
+    stop = asyncio.Event()
+
+    async def pacer() -> None:
+        # Chegadas em taxa constante; se os jogadores não acompanham, a fila enche e a taxa real cai
+        interval = 1.0 / args.rate
+        next_at = time.monotonic()
+        deadline = next_at + args.duration
+        while time.monotonic() < deadline:
+            await slots.put(None)
+            next_at += interval
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        stop.set()
+
+    async with httpx.AsyncClient(limits=limits) as client:
+        stand_in = IGameWinStandIn(client, base_url, args, stats)
+
+        async def player(user: str) -> None:
+            seq = 0
+            while not (stop.is_set() and slots.empty()):
+                try:
+                    await asyncio.wait_for(slots.get(), timeout=0.2)
+                except asyncio.TimeoutError:
+                    continue
+                expected[user] = await stand_in.spin(user, seq, expected[user])
+                seq += 1
+
+        started = time.monotonic()
+        await asyncio.gather(pacer(), *(player(u) for u in usernames))
+        elapsed = time.monotonic() - started
+    return stats, expected, stand_in.bet_txn_ids, elapsed
+
+
+# ========== RELATÓRIO ==========
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def build_report(stats: Stats, elapsed: float, db_violations: List[str], args: argparse.Namespace) -> Dict[str, Any]:
+    latency = {}
+    all_values: List[float] = []
+    for kind, values in sorted(stats.latencies.items()):
+        values.sort()
+        all_values.extend(values)
+        latency[kind] = {
+            "count": len(values),
+            "p50_ms": round(_percentile(values, 50) * 1000, 2),
+            "p95_ms": round(_percentile(values, 95) * 1000, 2),
+            "p99_ms": round(_percentile(values, 99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2),
+        }
+    all_values.sort()
+    violations = stats.violations + db_violations
+    return {
+        "config": {
+            "users": args.users,
+            "target_rate": args.rate,
+            "duration_seconds": args.duration,
+            "debit_credit_ratio": args.debit_credit_ratio,
+            "retry_ratio": args.retry_ratio,
+            "collision_ratio": args.collision_ratio,
+            "insufficient_ratio": args.insufficient_ratio,
+            "balance_polls": args.balance_polls,
+        },
+        "elapsed_seconds": round(elapsed, 2),
+        "spins": stats.spins,
+        "requests": stats.requests,
+        "spins_per_second": round(stats.spins / elapsed, 1) if elapsed else 0.0,
+        "requests_per_second": round(stats.requests / elapsed, 1) if elapsed else 0.0,
+        "retries": stats.retries,
+        "collisions": stats.collisions,
+        "insufficient_funds": stats.insufficient,
+        "latency": {
+            "all": {
+                "count": len(all_values),
+                "p50_ms": round(_percentile(all_values, 50) * 1000, 2),
+                "p95_ms": round(_percentile(all_values, 95) * 1000, 2),
+                "p99_ms": round(_percentile(all_values, 99) * 1000, 2),
+            },
+            **latency,
+        },
+        "errors": dict(stats.errors),
+        "invariant_violations": len(violations),
+        "violation_samples": violations[:20],
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print("\n" + "=" * 80)
+    print("[Load Test /gold_api] RESULTADO")
+    print("=" * 80)
+    print(f"Duração: {report['elapsed_seconds']}s  |  Rodadas: {report['spins']}  |  Requisições: {report['requests']}")
+    print(f"Throughput: {report['spins_per_second']} rodadas/s  |  {report['requests_per_second']} req/s "
+          f"(alvo: {report['config']['target_rate']} rodadas/s)")
+    print(f"Retries: {report['retries']}  |  Colisões: {report['collisions']}  |  Saldo insuficiente: {report['insufficient_funds']}")
+    print(f"\n{'método':<28}{'n':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for kind, values in report["latency"].items():
+        print(f"{kind:<28}{values['count']:>8}{values['p50_ms']:>10}{values['p95_ms']:>10}{values['p99_ms']:>10}")
+    if report["errors"]:
+        print(f"\nErros: {report['errors']}")
+    print(f"\nViolações de invariantes: {report['invariant_violations']}")
+    for v in report["violation_samples"]:
+        print(f"  - {v}")
+    print("=" * 80 + "\n")
+
+
+# ========== CLI ==========
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Teste de carga do /gold_api (modo Seamless) com simulador do IGameWin")
+    parser.add_argument("--database-url", help="Banco a semear e usar (padrão: SQLite novo em diretório temporário)")
+    parser.add_argument("--base-url", help="Usar um servidor já em execução (mesmo banco de --database-url)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--users", type=int, default=50, help="Jogadores simultâneos")
+    parser.add_argument("--rate", type=float, default=100.0, help="Rodadas por segundo (alvo)")
+    parser.add_argument("--duration", type=float, default=20.0, help="Duração em segundos")
+    parser.add_argument("--initial-balance", type=float, default=1000.0)
+    parser.add_argument("--min-bet", type=float, default=0.5)
+    parser.add_argument("--max-bet", type=float, default=10.0)
+    parser.add_argument("--balance-polls", type=int, default=2, help="user_balance por rodada")
+    parser.add_argument("--debit-credit-ratio", type=float, default=0.5, help="Fração de rodadas em debit_credit (resto: debit + credit)")
+    parser.add_argument("--retry-ratio", type=float, default=0.05, help="Fração de transações reenviadas após a resposta")
+    parser.add_argument("--collision-ratio", type=float, default=0.02, help="Fração de transações enviadas em duplicidade simultânea")
+    parser.add_argument("--insufficient-ratio", type=float, default=0.01, help="Fração de apostas acima do saldo")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Timeout por requisição (s)")
+    parser.add_argument("--seed", type=int, help="Semente do gerador aleatório")
+    parser.add_argument("--json", dest="json_path", help="Grava o relatório em JSON neste caminho")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.seed is not None:
+        random.seed(args.seed)
+    workdir = tempfile.mkdtemp(prefix="gold_api_load_")
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'loadtest.db')}"
+
+    print(f"[Load Test /gold_api] Banco: {database_url.split('@')[-1]}")
+    user_ids = seed(database_url, args.users, args.initial_balance)
+    ledger_from = ledger_marker(database_url)
+
+    proc = None
+    base_url = args.base_url
+    if not base_url:
+        base_url = f"http://127.0.0.1:{args.port}"
+        log_path = os.path.join(workdir, "server.log")
+        print(f"[Load Test /gold_api] Iniciando servidor em {base_url} (log: {log_path})")
+        proc = start_server(database_url, args.port, log_path)
+    try:
+        asyncio.run(wait_ready(base_url))
+        print(f"[Load Test /gold_api] {args.users} jogadores, alvo {args.rate} rodadas/s por {args.duration}s")
+        stats, expected, bet_txn_ids, elapsed = asyncio.run(run_load(base_url, sorted(user_ids), args))
+    finally:
+        if proc is not None:
+            stop_server(proc)
+    if args.base_url:
+        # Servidor externo: dar tempo ao write-behind de gravar as apostas
+        time.sleep(2.0)
+
+    db_violations = verify_database(database_url, user_ids, expected, args.initial_balance, ledger_from, bet_txn_ids)
+    report = build_report(stats, elapsed, db_violations, args)
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return 1 if report["invariant_violations"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
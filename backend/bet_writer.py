@@ -0,0 +1,300 @@
+"""
+Write-behind das apostas (Bet) geradas pelo /gold_api.
+
+O /gold_api commita apenas o saldo e o journal (wallet_journal) e enfileira o registro da aposta
+aqui. Uma tarefa de fundo grava a fila em lotes: INSERT multi-linha para apostas novas e
+UPDATE executemany para liquidações (credit), por quantidade (BET_WRITER_BATCH_SIZE) ou por
+intervalo (BET_WRITER_FLUSH_INTERVAL_MS).
+
+Crash-safety: o registro da aposta também fica em gold_api_transactions.bet_json, commitado junto
+com o saldo. Ao gravar um lote, as linhas correspondentes do journal são marcadas como
+bet_persisted na mesma transação. No startup, recover() regrava o que ficou pendente.
+"""
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+
+import game_popularity
+from models import Bet, BetStatus, GoldApiTransaction
+
+BATCH_SIZE = int(os.getenv("BET_WRITER_BATCH_SIZE", "200"))
+FLUSH_INTERVAL_SECONDS = int(os.getenv("BET_WRITER_FLUSH_INTERVAL_MS", "250")) / 1000.0
+QUEUE_MAX_SIZE = int(os.getenv("BET_WRITER_QUEUE_MAX_SIZE", "10000"))
+
+# Operações de um registro de aposta
+OP_INSERT = "insert"  # debit: aposta nova, pendente
+OP_SETTLE = "settle"  # credit: liquida aposta existente (se houver)
+OP_UPSERT = "upsert"  # debit_credit: liquida se existir, senão cria já liquidada
+
+_queue: Optional[asyncio.Queue] = None
+_task: Optional[asyncio.Task] = None
+
+_stats: Dict[str, float] = {
+    "enqueued": 0,
+    "flushed": 0,
+    "batches": 0,
+    "failed": 0,
+    "recovered": 0,
+    "backpressure_waits": 0,
+    "max_queue_depth": 0,
+    "last_flush_seconds": 0.0,
+    "last_batch_size": 0,
+}
+
+
+def make_record(
+    op: str,
+    user_id: int,
+    txn_id: Optional[str],
+    game_code: Optional[str],
+    provider_code: Optional[str],
+    amount: float,
+    win_amount: float,
+    status: BetStatus,
+    transaction_id: str,
+    metadata: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Registro serializável (JSON) de uma aposta a gravar."""
+    return {
+        "op": op,
+        "user_id": user_id,
+        "game_id": game_code,
+        "game_name": game_code,  # Pode ser melhorado buscando nome do jogo
+        "provider": provider_code or "IGameWin",
+        "amount": amount,
+        "win_amount": win_amount,
+        "status": status.name,
+        "transaction_id": transaction_id,
+        "external_id": txn_id,
+        "metadata_json": json.dumps(metadata),
+        "created_at": datetime.utcnow().isoformat(),
+    }
+
+
+def _row(record: Dict[str, Any]) -> Dict[str, Any]:
+    created_at = datetime.fromisoformat(record["created_at"])
+    return {
+        "user_id": record["user_id"],
+        "game_id": record["game_id"],
+        "game_name": record["game_name"],
+        "provider": record["provider"],
+        "amount": record["amount"],
+        "win_amount": record["win_amount"],
+        "status": BetStatus[record["status"]],
+        "transaction_id": record["transaction_id"],
+        "external_id": record["external_id"],
+        "metadata_json": record["metadata_json"],
+        "created_at": created_at,
+        "updated_at": created_at,
+    }
+
+
+def _write_batch(db: Session, items: List[Tuple[Optional[int], Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Grava um lote em uma transação (sem commit). Preserva a ordem das operações do lote. Retorna as apostas novas."""
+    upsert_ids = {r["external_id"] for _, r in items if r["op"] == OP_UPSERT and r["external_id"]}
+    existing = set()
+    if upsert_ids:
+        existing = set(db.execute(
+            select(Bet.external_id).where(Bet.external_id.in_(upsert_ids))
+        ).scalars())
+
+    inserts: Dict[str, Dict[str, Any]] = {}
+    settles: Dict[str, Dict[str, Any]] = {}
+    for _, record in items:
+        op = record["op"]
+        ext = record["external_id"]
+        pending = inserts.get(ext) if ext else None
+        if op == OP_INSERT or (op == OP_UPSERT and ext not in existing and pending is None):
+            inserts[ext or record["transaction_id"]] = _row(record)
+        elif pending is not None:
+            # Liquidação de uma aposta que ainda está neste lote: ajusta antes de inserir
+            pending["win_amount"] = record["win_amount"]
+            pending["status"] = BetStatus[record["status"]]
+            pending["updated_at"] = datetime.fromisoformat(record["created_at"])
+        elif ext:
+            settles[ext] = {
+                "b_external_id": ext,
+                "b_win_amount": record["win_amount"],
+                "b_status": BetStatus[record["status"]],
+                "b_updated_at": datetime.fromisoformat(record["created_at"]),
+            }
+
+    table = Bet.__table__
+    if inserts:
+        db.execute(table.insert(), list(inserts.values()))
+    if settles:
+        db.execute(
+            table.update()
+            .where(table.c.external_id == bindparam("b_external_id"))
+            .values(
+                win_amount=bindparam("b_win_amount"),
+                status=bindparam("b_status"),
+                updated_at=bindparam("b_updated_at"),
+            ),
+            list(settles.values()),
+        )
+    journal_ids = [journal_id for journal_id, _ in items if journal_id is not None]
+    if journal_ids:
+        db.execute(
+            update(GoldApiTransaction)
+            .where(GoldApiTransaction.id.in_(journal_ids))
+            .values(bet_persisted=True)
+            .execution_options(synchronize_session=False)
+        )
+    return list(inserts.values())
+
+
+def _mark_persisted(db: Session, journal_id: Optional[int]) -> None:
+    """Tira do caminho da recuperação um registro rejeitado pelo banco (ex.: aposta duplicada)."""
+    if journal_id is None:
+        return
+    try:
+        db.execute(
+            update(GoldApiTransaction)
+            .where(GoldApiTransaction.id == journal_id)
+            .values(bet_persisted=True)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    except Exception:
+        # Banco indisponível: o registro continua pendente e será recuperado no próximo startup
+        db.rollback()
+
+
+def _flush_sync(items: List[Tuple[Optional[int], Dict[str, Any]]]) -> None:
+    from database import SessionLocal
+
+    started = time.monotonic()
+    db = SessionLocal()
+    inserted: List[Dict[str, Any]] = []
+    try:
+        try:
+            batch_inserted = _write_batch(db, items)
+            db.commit()
+            _stats["flushed"] += len(items)
+            inserted = batch_inserted
+        except Exception as e:
+            # Um registro ruim não pode derrubar o lote inteiro: regrava um a um
+            db.rollback()
+            print(f"[Bet Writer] Falha no lote de {len(items)} apostas ({e}); gravando individualmente")
+            for item in items:
+                try:
+                    item_inserted = _write_batch(db, [item])
+                    db.commit()
+                except Exception as item_error:
+                    db.rollback()
+                    _stats["failed"] += 1
+                    print(f"[Bet Writer] Aposta descartada (txn_id={item[1].get('external_id')}): {item_error}")
+                    _mark_persisted(db, item[0])
+                    continue
+                _stats["flushed"] += 1
+                inserted.extend(item_inserted)
+    finally:
+        db.close()
+    # Fora do try do lote: uma falha aqui não pode reprocessar apostas já commitadas
+    try:
+        game_popularity.record(inserted)
+    except Exception as e:
+        print(f"[Bet Writer] Erro ao contabilizar popularidade de {len(inserted)} apostas: {e}")
+    _stats["batches"] += 1
+    _stats["last_batch_size"] = len(items)
+    _stats["last_flush_seconds"] = time.monotonic() - started
+
+
+async def enqueue(record: Dict[str, Any], journal_id: Optional[int] = None) -> None:
+    """Enfileira uma aposta para gravação. Se a fila estiver cheia, aguarda (backpressure)."""
+    if _queue is None:
+        # Writer não iniciado (ex.: scripts): grava direto
+        await asyncio.to_thread(_flush_sync, [(journal_id, record)])
+        return
+    try:
+        _queue.put_nowait((journal_id, record))
+    except asyncio.QueueFull:
+        _stats["backpressure_waits"] += 1
+        await _queue.put((journal_id, record))
+    _stats["enqueued"] += 1
+    depth = _queue.qsize()
+    if depth > _stats["max_queue_depth"]:
+        _stats["max_queue_depth"] = depth
+
+
+async def _run() -> None:
+    assert _queue is not None
+    while True:
+        first = await _queue.get()
+        items = [first]
+        deadline = time.monotonic() + FLUSH_INTERVAL_SECONDS
+        while len(items) < BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        try:
+            await asyncio.to_thread(_flush_sync, items)
+        except Exception as e:
+            _stats["failed"] += len(items)
+            print(f"[Bet Writer] Erro ao gravar lote: {e}")
+        finally:
+            for _ in items:
+                _queue.task_done()
+
+
+def recover() -> int:
+    """Regrava apostas do journal que não chegaram a ser persistidas (ex.: crash do processo)."""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        pending = db.execute(
+            select(GoldApiTransaction.id, GoldApiTransaction.bet_json)
+            .where(GoldApiTransaction.bet_persisted == False, GoldApiTransaction.bet_json.isnot(None))
+            .order_by(GoldApiTransaction.id)
+        ).all()
+    finally:
+        db.close()
+    items = [(journal_id, json.loads(bet_json)) for journal_id, bet_json in pending]
+    for i in range(0, len(items), BATCH_SIZE):
+        _flush_sync(items[i:i + BATCH_SIZE])
+    _stats["recovered"] += len(items)
+    return len(items)
+
+
+async def start() -> None:
+    """Recupera pendências do journal e inicia a tarefa de gravação em lote."""
+    global _queue, _task
+    recovered = await asyncio.to_thread(recover)
+    if recovered:
+        print(f"[Bet Writer] {recovered} apostas recuperadas do journal")
+    _queue = asyncio.Queue(maxsize=QUEUE_MAX_SIZE)
+    _task = asyncio.create_task(_run())
+
+
+async def stop() -> None:
+    """Drena a fila e encerra a tarefa de gravação."""
+    global _queue, _task
+    if _queue is not None:
+        await _queue.join()
+    if _task is not None:
+        _task.cancel()
+    _queue = None
+    _task = None
+
+
+def stats() -> Dict[str, Any]:
+    """Métricas do write-behind (profundidade da fila, lotes, falhas, backpressure)."""
+    return {
+        **_stats,
+        "queue_depth": _queue.qsize() if _queue is not None else 0,
+        "queue_max_size": QUEUE_MAX_SIZE,
+        "batch_size": BATCH_SIZE,
+        "flush_interval_seconds": FLUSH_INTERVAL_SECONDS,
+    }
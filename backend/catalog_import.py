@@ -0,0 +1,299 @@
+"""
+Importação offline do catálogo a partir do dump igamewin_games_to_viper/games_vipers.sql.
+
+O dump é um script MySQL de outra plataforma: por provedor, `INSERT INTO providers ... SELECT ...
+WHERE NOT EXISTS`, seguido de `SET @provider_id = (SELECT id FROM providers WHERE code = ...)` e um
+`INSERT INTO games ... SELECT ...` por jogo. Em vez de executá-lo, o arquivo é lido em fluxo (linha
+a linha, um comando por vez, sem carregar o dump na memória) e os valores dos INSERTs viram
+upserts em lote nas nossas tabelas providers/games, com os mesmos campos que a sincronização com a
+IGameWin grava (game_catalog.apply_sync). O `cover` de cada jogo ('/igamewin/171.webp') vira o
+banner, que o catálogo troca pela URL com hash do pacote de miniaturas (thumbnail_pack).
+
+A importação só acrescenta/atualiza (nada é removido) e roda numa única transação, registrada como
+uma execução em catalog_sync_runs: os workers em execução recarregam o catálogo no próximo ciclo do
+game_catalog.sync_loop. Atenção: a sincronização seguinte com a IGameWin remove do catálogo os jogos
+que não estão na game_list do agente.
+
+Uso (a partir de backend/, com DATABASE_URL do ambiente):
+    python catalog_import.py
+    python catalog_import.py --sql ../igamewin_games_to_viper/games_vipers.sql --batch-size 1000
+    python catalog_import.py --dry-run   # só lê o dump e mostra as contagens
+"""
+import argparse
+import json
+import os
+import re
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import insert, tuple_, update
+from sqlalchemy.orm import Session
+
+import game_catalog
+import thumbnail_pack
+from models import CatalogChange, CatalogSyncRun, Game, Provider
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SQL_PATH = os.path.join(BACKEND_DIR, "..", "igamewin_games_to_viper", "games_vipers.sql")
+BATCH_SIZE = 1000
+
+# Fim de comando (;) só conta fora de strings; \x dentro da string é escape
+_SPECIAL = re.compile(r"\\.|'|;", re.S)
+_INSERT = re.compile(r"INSERT\s+INTO\s+`?(\w+)`?\s*\(([^)]*)\)\s*SELECT\s+(.*?)\s+WHERE\s", re.I | re.S)
+_SET_PROVIDER = re.compile(
+    r"SET\s+@provider_id\s*=\s*\(\s*SELECT\s+id\s+FROM\s+providers\s+WHERE\s+code\s*=\s*'((?:[^'\\]|\\.|'')*)'",
+    re.I | re.S,
+)
+_VALUE = re.compile(r"'((?:[^'\\]|\\.|'')*)'|(NULL)\b|(@\w+)|(-?\d+(?:\.\d+)?)", re.I | re.S)
+_ESCAPE = re.compile(r"\\(.)|''", re.S)
+_ESCAPES = {"n": "\n", "r": "\r", "t": "\t", "0": "\0"}
+
+
+def _unquote(value: str) -> str:
+    return _ESCAPE.sub(lambda m: _ESCAPES.get(m.group(1), m.group(1)) if m.group(1) is not None else "'", value)
+
+
+def iter_statements(lines: Iterable[str]) -> Iterator[str]:
+    """Comandos SQL do fluxo de linhas, um por vez (separados por ; fora de strings)."""
+    buffer: List[str] = []
+    in_quote = False
+    for line in lines:
+        start = 0
+        for m in _SPECIAL.finditer(line):
+            token = m.group()
+            if token == "'":
+                in_quote = not in_quote
+            elif token == ";" and not in_quote:
+                buffer.append(line[start:m.start()])
+                statement = "".join(buffer).strip()
+                buffer = []
+                start = m.end()
+                if statement:
+                    yield statement
+        buffer.append(line[start:])
+    statement = "".join(buffer).strip()
+    if statement:
+        yield statement
+
+
+def _values(text: str) -> List[Any]:
+    values: List[Any] = []
+    for quoted, null, variable, number in _VALUE.findall(text):
+        if null:
+            values.append(None)
+        elif variable:
+            values.append(variable)
+        elif number:
+            values.append(float(number) if "." in number else int(number))
+        else:
+            values.append(_unquote(quoted))
+    return values
+
+
+def iter_records(lines: Iterable[str]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    ("provider", colunas) e ("game", colunas) na ordem do dump; cada jogo recebe "provider_code"
+    do último `SET @provider_id` / INSERT de provedor.
+    """
+    provider_code: Optional[str] = None
+    for statement in iter_statements(lines):
+        m = _INSERT.search(statement)
+        if m is None:
+            s = _SET_PROVIDER.search(statement)
+            if s is not None:
+                provider_code = _unquote(s.group(1))
+            continue
+        table = m.group(1).lower()
+        columns = [c.strip().strip("`") for c in m.group(2).split(",")]
+        values = _values(m.group(3))
+        if len(values) != len(columns):
+            print(f"[Catalog Import] Comando ignorado ({len(columns)} colunas, {len(values)} valores): {statement[:120]}")
+            continue
+        row = dict(zip(columns, values))
+        row.pop("id", None)
+        if table == "providers":
+            provider_code = row.get("code")
+            yield "provider", row
+        elif table == "games":
+            row.pop("provider_id", None)
+            if provider_code:
+                yield "game", {**row, "provider_code": provider_code}
+
+
+class _Importer:
+    """Upserts em lote; contagens gravadas na execução (CatalogSyncRun) ao final."""
+
+    def __init__(self, db: Session, run: CatalogSyncRun, batch_size: int) -> None:
+        self.db = db
+        self.run = run
+        self.batch_size = batch_size
+        self.providers: List[Dict[str, Any]] = []
+        self.games: List[Dict[str, Any]] = []
+        self.provider_positions: Dict[str, int] = {}
+        self.game_positions: Dict[str, int] = {}
+        self.seen_games = set()
+        self.counts = {"providers": 0, "games": 0, "duplicates": 0, "thumbnails_linked": 0, "thumbnails_missing": 0}
+
+    def add(self, kind: str, row: Dict[str, Any]) -> None:
+        if kind == "provider":
+            code = str(row.get("code") or "").strip()
+            if code and code not in self.provider_positions:
+                self.provider_positions[code] = len(self.provider_positions)
+                self.providers.append(row)
+            return
+        code = row.get("game_code") or row.get("game_id")
+        key = (row["provider_code"], str(code) if code else None)
+        if not key[1] or key in self.seen_games:
+            self.counts["duplicates"] += 1
+            return
+        self.seen_games.add(key)
+        position = self.game_positions.get(key[0], 0)
+        self.game_positions[key[0]] = position + 1
+        self.games.append({**row, "_position": position})
+        if len(self.games) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.providers:
+            self._upsert_providers(self.providers)
+            self.providers = []
+        if self.games:
+            self._upsert_games(self.games)
+            self.games = []
+
+    def _upsert_providers(self, rows: List[Dict[str, Any]]) -> None:
+        existing = {p.code: p for p in self.db.query(Provider).filter(
+            Provider.code.in_([str(r["code"]).strip() for r in rows])
+        )}
+        for raw in rows:
+            code, name, is_active = game_catalog._provider_fields(raw)
+            row = existing.get(code)
+            if row is None:
+                row = Provider(code=code, is_active=is_active)
+                self.db.add(row)
+                game_catalog._change(self.db, self.run, "provider", game_catalog.CHANGE_ADDED, code)
+            elif row.removed_at is not None:
+                row.removed_at = None
+                row.is_active = is_active
+                game_catalog._change(self.db, self.run, "provider", game_catalog.CHANGE_ADDED, code)
+            else:
+                row.is_active = is_active
+            row.name = name
+            row.position = self.provider_positions[code]
+            row.raw_json = json.dumps(raw)
+            self.counts["providers"] += 1
+        self.db.flush()
+
+    def _upsert_games(self, rows: List[Dict[str, Any]]) -> None:
+        now = datetime.utcnow()
+        keys = [(r["provider_code"], str(r.get("game_code") or r.get("game_id"))) for r in rows]
+        existing = {
+            (g.provider_code, g.game_code): g
+            for g in self.db.query(Game.id, Game.provider_code, Game.game_code, Game.name, Game.banner,
+                                   Game.category, Game.is_active, Game.removed_at)
+            .filter(tuple_(Game.provider_code, Game.game_code).in_(keys))
+        }
+        inserts, updates, changes = [], [], []
+        for key, raw in zip(keys, rows):
+            position = raw.pop("_position")
+            game_code, name, banner, category, is_active = game_catalog._game_fields(
+                {**raw, "banner": raw.get("cover"), "game_code": key[1]}
+            )
+            if thumbnail_pack.loaded():
+                linked = thumbnail_pack.url_for(banner) is not None
+                self.counts["thumbnails_linked" if linked else "thumbnails_missing"] += 1
+            values = {
+                "name": name, "banner": banner, "category": category, "is_active": is_active,
+                "position": position, "raw_json": json.dumps(raw), "removed_at": None, "updated_at": now,
+            }
+            row = existing.get(key)
+            if row is None:
+                inserts.append({"provider_code": key[0], "game_code": key[1], "created_at": now, **values})
+                changes.append((game_catalog.CHANGE_ADDED, key, None))
+            else:
+                updates.append({"id": row.id, **values})
+                before = {"name": row.name, "banner": row.banner, "category": row.category}
+                after = {"name": name, "banner": banner, "category": category}
+                if row.removed_at is not None:
+                    changes.append((game_catalog.CHANGE_ADDED, key, None))
+                elif row.is_active != is_active:
+                    changes.append((game_catalog.CHANGE_ENABLED if is_active else game_catalog.CHANGE_DISABLED, key, None))
+                elif before != after:
+                    changes.append((game_catalog.CHANGE_UPDATED, key, {"before": before, "after": after}))
+        if inserts:
+            self.db.execute(insert(Game), inserts)
+        if updates:
+            self.db.execute(update(Game), updates)
+        if changes:
+            self.db.execute(insert(CatalogChange), [
+                {"sync_run_id": self.run.id, "entity": "game", "change": change, "provider_code": key[0],
+                 "game_code": key[1], "detail": json.dumps(detail) if detail else None, "created_at": now}
+                for change, key, detail in changes
+            ])
+            for change, _, _ in changes:
+                setattr(self.run, change, getattr(self.run, change) + 1)
+        self.counts["games"] += len(rows)
+
+
+def import_dump(db: Session, lines: Iterable[str], batch_size: int = BATCH_SIZE) -> Dict[str, Any]:
+    """Aplica o dump no catálogo numa transação. Retorna o resumo da execução + contagens."""
+    started = time.monotonic()
+    run = CatalogSyncRun(
+        status=game_catalog.RUN_SUCCESS,
+        added=0, removed=0, disabled=0, enabled=0, updated=0,
+        started_at=datetime.utcnow(),
+    )
+    db.add(run)
+    db.flush()
+    importer = _Importer(db, run, batch_size)
+    try:
+        for kind, row in iter_records(lines):
+            importer.add(kind, row)
+        importer.flush()
+        run.providers_total = db.query(Provider).filter(Provider.removed_at.is_(None)).count()
+        run.games_total = db.query(Game).filter(Game.removed_at.is_(None)).count()
+        run.finished_at = datetime.utcnow()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return {**game_catalog.run_dict(run), **importer.counts, "seconds": round(time.monotonic() - started, 2)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Importa o dump games_vipers.sql para o catálogo local")
+    parser.add_argument("--sql", default=DEFAULT_SQL_PATH, help="Arquivo .sql")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="Só lê o dump e mostra as contagens")
+    args = parser.parse_args()
+
+    if args.dry_run:
+        counts: Dict[str, int] = {}
+        with open(args.sql, encoding="utf-8") as f:
+            for kind, _ in iter_records(f):
+                counts[kind] = counts.get(kind, 0) + 1
+        print(f"[Catalog Import] {counts.get('provider', 0)} provedores, {counts.get('game', 0)} jogos em {args.sql}")
+        return
+
+    from database import SessionLocal, init_db
+
+    init_db()
+    thumbnail_pack.load()
+    db = SessionLocal()
+    try:
+        with open(args.sql, encoding="utf-8") as f:
+            summary = import_dump(db, f, args.batch_size)
+    finally:
+        db.close()
+    print(
+        f"[Catalog Import] Execução #{summary['id']}: {summary['providers']} provedores, {summary['games']} jogos "
+        f"lidos em {summary['seconds']}s | +{summary['added']} alterados={summary['updated']} "
+        f"desativados={summary['disabled']} reativados={summary['enabled']} duplicados={summary['duplicates']} | "
+        f"miniaturas no pacote: {summary['thumbnails_linked']} (sem: {summary['thumbnails_missing']}) | "
+        f"catálogo: {summary['providers_total']} provedores, {summary['games_total']} jogos"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Snapshot em memória das configurações do admin sobre o catálogo: customizações de jogos
+(GameCustomization: nome/provedor exibidos) e ordem dos provedores (ProviderOrder).
+
+O snapshot é imutável e trocado de uma vez: os endpoints de CRUD chamam refresh() após o commit e
+o catálogo é rematerializado com as customizações já aplicadas (game_catalog.apply_overrides), de
+modo que nenhuma requisição do catálogo consulta essas tabelas. Outros processos (workers)
+convergem pelo loop do catálogo, que chama refresh() periodicamente; se nada mudou a versão é
+mantida e nada é recalculado.
+"""
+import threading
+from typing import Any, Dict, FrozenSet, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import GameCustomization, ProviderOrder
+
+
+class Overrides(NamedTuple):
+    version: int
+    # game_code -> (nome, provedor exibido, provider_code normalizado como as chaves de catalog.games)
+    customizations: Dict[str, Tuple[Optional[str], Optional[str], Optional[str]]]
+    order_map: Dict[str, int]  # provider_code normalizado -> display_order
+    priority_providers: FrozenSet[str]  # provider_code normalizados prioritários
+
+
+_lock = threading.Lock()
+_snapshot = Overrides(version=0, customizations={}, order_map={}, priority_providers=frozenset())
+
+
+def get() -> Overrides:
+    return _snapshot
+
+
+def _load(db: Session) -> Tuple[Dict[str, Tuple[Optional[str], Optional[str], Optional[str]]], Dict[str, int], FrozenSet[str]]:
+    from game_catalog import normalize_code
+
+    customizations = {
+        c.game_code.strip(): (
+            c.custom_name or None,
+            c.custom_provider or None,
+            normalize_code(c.custom_provider) or None,
+        )
+        for c in db.query(GameCustomization).all()
+        if c.custom_name or normalize_code(c.custom_provider)
+    }
+    provider_orders = db.query(ProviderOrder).all()
+    order_map = {po.provider_code.upper().strip(): po.display_order for po in provider_orders}
+    priority_providers = frozenset(po.provider_code.upper().strip() for po in provider_orders if po.is_priority)
+    return customizations, order_map, priority_providers
+
+
+def refresh(db: Optional[Session] = None) -> bool:
+    """Relê as tabelas e troca o snapshot se algo mudou. True = snapshot novo."""
+    global _snapshot
+    if db is None:
+        from database import SessionLocal
+
+        session = SessionLocal()
+        try:
+            loaded = _load(session)
+        finally:
+            session.close()
+    else:
+        loaded = _load(db)
+    with _lock:
+        if loaded == _snapshot[1:] and _snapshot.version:
+            return False
+        _snapshot = Overrides(_snapshot.version + 1, *loaded)
+        return True
+
+
+def customize(game: Dict[str, Any], overrides: Overrides) -> Dict[str, Any]:
+    """O jogo com a customização aplicada (cópia), ou o próprio dict se não há customização."""
+    code = game.get("game_code") or game.get("code") or game.get("game_id") or game.get("id") or game.get("slug")
+    custom = overrides.customizations.get(str(code).strip()) if code else None
+    if custom is None:
+        return game
+    custom_name, custom_provider, custom_provider_code = custom
+    game = dict(game)
+    if custom_name:
+        # Nome do upstream preservado: a busca e os destaques/populares continuam encontrando o jogo por ele
+        game["original_name"] = game.get("game_name") or game.get("name")
+        game["name"] = custom_name
+        game["game_name"] = custom_name
+        game["title"] = custom_name
+        game["gameTitle"] = custom_name
+    if custom_provider_code:
+        # Códigos normalizados (mesma forma das chaves do catálogo e do lobby); nomes como o admin digitou
+        game["provider"] = custom_provider_code
+        game["provider_code"] = custom_provider_code
+        game["provider_name"] = custom_provider.strip()
+        game["vendor"] = custom_provider_code
+        game["vendor_name"] = custom_provider.strip()
+    return game
+
+
+def stats() -> Dict[str, Any]:
+    snapshot = _snapshot
+    return {
+        "version": snapshot.version,
+        "customizations": len(snapshot.customizations),
+        "provider_orders": len(snapshot.order_map),
+        "priority_providers": sorted(snapshot.priority_providers),
+    }
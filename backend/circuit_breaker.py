@@ -0,0 +1,167 @@
+"""
+Circuit breakers para dependências externas (hoje: um por método da API IGameWin).
+
+Cada breaker conta sucessos e falhas numa janela deslizante (baldes de 1s). Quando a janela tem
+pelo menos `min_requests` chamadas e a taxa de erro passa de `failure_rate`, o circuito abre: as
+chamadas falham na hora (sem ocupar conexão nem worker esperando timeout) durante `open_seconds`.
+Depois disso o circuito fica meio-aberto e deixa passar até `half_open_probes` chamadas de teste:
+um sucesso fecha o circuito (janela zerada), uma falha o abre de novo.
+
+Todos os breakers criados com create() aparecem em /metrics (circuit_breaker_state,
+circuit_breaker_rejected_total, circuit_breaker_opened_total, circuit_breaker_error_rate) e em stats().
+"""
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """Breaker por taxa de erro numa janela deslizante."""
+
+    def __init__(
+        self,
+        name: str,
+        window_seconds: int = 30,
+        min_requests: int = 10,
+        failure_rate: float = 0.5,
+        open_seconds: float = 15.0,
+        half_open_probes: int = 1,
+    ) -> None:
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._lock = threading.Lock()
+        self._buckets: Deque[List[int]] = deque()  # [segundo, sucessos, falhas]
+        self.state = CLOSED
+        self._opened_until = 0.0
+        self._probes = 0
+        self.rejected = 0
+        self.opened = 0
+
+    def _trim(self, now: float) -> None:
+        oldest = int(now) - self.window_seconds
+        while self._buckets and self._buckets[0][0] <= oldest:
+            self._buckets.popleft()
+
+    def _totals(self) -> List[int]:
+        successes = sum(b[1] for b in self._buckets)
+        failures = sum(b[2] for b in self._buckets)
+        return [successes, failures]
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self._opened_until = now + self.open_seconds
+        self._probes = 0
+        self.opened += 1
+        print(f"[Circuit Breaker] {self.name}: circuito ABERTO por {self.open_seconds:.0f}s")
+
+    def allow(self) -> bool:
+        """True se a chamada pode seguir; False = falhar na hora (circuito aberto)."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN and now >= self._opened_until:
+                self.state = HALF_OPEN
+                self._probes = 0
+            if self.state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, success: Optional[bool]) -> None:
+        """Resultado de uma chamada liberada por allow(); None = cancelada (não conta)."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == HALF_OPEN:
+                self._probes = max(self._probes - 1, 0)
+                if success:
+                    self.state = CLOSED
+                    self._buckets.clear()
+                    print(f"[Circuit Breaker] {self.name}: circuito FECHADO")
+                elif success is False:
+                    self._open(now)
+                return
+            if success is None or self.state == OPEN:
+                return
+            second = int(now)
+            if not self._buckets or self._buckets[-1][0] != second:
+                self._buckets.append([second, 0, 0])
+            self._buckets[-1][1 if success else 2] += 1
+            self._trim(now)
+            successes, failures = self._totals()
+            total = successes + failures
+            if total >= self.min_requests and failures / total >= self.failure_rate:
+                self._open(now)
+
+    def retry_after(self) -> float:
+        """Segundos até o circuito aceitar chamadas de teste (0 se não está aberto)."""
+        if self.state != OPEN:
+            return 0.0
+        return max(self._opened_until - time.monotonic(), 0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._trim(time.monotonic())
+            successes, failures = self._totals()
+        total = successes + failures
+        return {
+            "state": self.state,
+            "window_requests": total,
+            "window_failures": failures,
+            "error_rate": round(failures / total, 4) if total else 0.0,
+            "retry_after_seconds": round(self.retry_after(), 2),
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "min_requests": self.min_requests,
+            "failure_rate": self.failure_rate,
+            "open_seconds": self.open_seconds,
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def create(name: str, **config: Any) -> CircuitBreaker:
+    """Breaker registrado pelo nome (o mesmo objeto nas chamadas seguintes)."""
+    with _registry_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name, **config)
+        return breaker
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    return {name: breaker.stats() for name, breaker in list(_breakers.items())}
+
+
+def _metric_lines() -> List[str]:
+    snapshot = stats()
+
+    def samples(key: str, fn=lambda v: v):
+        return [({"breaker": name}, fn(values[key])) for name, values in snapshot.items()]
+
+    return (
+        metrics.gauge("circuit_breaker_state", "Estado do circuito (0 fechado, 1 meio-aberto, 2 aberto)",
+                      samples("state", _STATE_VALUES.get))
+        + metrics.gauge("circuit_breaker_error_rate", "Taxa de erro na janela deslizante", samples("error_rate"))
+        + metrics.counter_samples("circuit_breaker_opened_total", "Vezes que o circuito abriu", samples("opened"))
+        + metrics.counter_samples("circuit_breaker_rejected_total", "Chamadas recusadas com o circuito aberto",
+                                  samples("rejected"))
+    )
+
+
+metrics.register_collector(_metric_lines)
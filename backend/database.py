@@ -1,4 +1,5 @@
 from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
 from models import Base
 import os
@@ -16,13 +17,16 @@ if "sqlite" in DATABASE_URL:
 else:
     print(f"✅ Using PostgreSQL: {DATABASE_URL.split('@')[1] if '@' in DATABASE_URL else 'configured'}")
 
+# Configurações do pool para evitar esgotamento de conexões (total máximo: 30 conexões por engine)
+POOL_SIZE = 10  # Aumentar de 5 para 10
+MAX_OVERFLOW = 20  # Aumentar de 10 para 20
+
 engine = create_engine(
     DATABASE_URL,
     connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {},
     echo=True,
-    # Configurações do pool para evitar esgotamento de conexões
-    pool_size=10,  # Aumentar de 5 para 10
-    max_overflow=20,  # Aumentar de 10 para 20 (total máximo: 30 conexões)
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
     pool_pre_ping=True,  # Verificar conexões antes de usar
     pool_recycle=3600,  # Reciclar conexões após 1 hora
 )
@@ -30,6 +34,41 @@ engine = create_engine(
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def _async_database_url(url: str) -> str:
+    """URL equivalente com driver assíncrono: asyncpg no PostgreSQL, aiosqlite no SQLite."""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgresql"):
+        scheme, rest = url.split("://", 1)
+        # asyncpg não aceita sslmode (parâmetro do libpq); o equivalente é ssl
+        return "postgresql+asyncpg://" + rest.replace("sslmode=", "ssl=")
+    return url
+
+
+ASYNC_DATABASE_URL = _async_database_url(DATABASE_URL)
+
+# Engine assíncrono para as rotas quentes (/gold_api, webhooks de pagamento, /api/auth/me):
+# as queries não bloqueiam o event loop. As demais rotas continuam no engine síncrono acima.
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    # aiosqlite usa NullPool (uma conexão por sessão); o pool só se aplica ao PostgreSQL
+    **({} if "sqlite" in DATABASE_URL else {
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+        "pool_pre_ping": True,
+        "pool_recycle": 3600,
+    }),
+)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    # Objetos continuam utilizáveis após o commit sem um novo SELECT (lazy load não existe em async)
+    expire_on_commit=False,
+)
+
+
 def init_db():
     """Initialize database tables (only creates if they don't exist)"""
     # create_all() só cria tabelas que não existem, não deleta dados existentes
@@ -140,6 +179,29 @@ def init_db():
             conn.commit()
     except Exception:
         pass
+    # Migração: write-behind de apostas no journal do /gold_api
+    try:
+        with engine.connect() as conn:
+            if "sqlite" in DATABASE_URL:
+                conn.execute(text("ALTER TABLE gold_api_transactions ADD COLUMN bet_json TEXT"))
+            else:
+                conn.execute(text("ALTER TABLE gold_api_transactions ADD COLUMN IF NOT EXISTS bet_json TEXT"))
+            conn.commit()
+    except Exception:
+        pass
+    try:
+        with engine.connect() as conn:
+            if "sqlite" in DATABASE_URL:
+                conn.execute(text("ALTER TABLE gold_api_transactions ADD COLUMN bet_persisted INTEGER DEFAULT 0 NOT NULL"))
+            else:
+                conn.execute(
+                    text(
+                        "ALTER TABLE gold_api_transactions ADD COLUMN IF NOT EXISTS bet_persisted BOOLEAN DEFAULT FALSE NOT NULL"
+                    )
+                )
+            conn.commit()
+    except Exception:
+        pass
 
 
 def get_db():
@@ -154,3 +216,13 @@ def get_db():
     finally:
         # Sempre fechar a conexão, mesmo em caso de erro
         db.close()
+
+
+async def get_async_db():
+    """Dependency for getting an async DB session"""
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except Exception:
+            await db.rollback()
+            raise
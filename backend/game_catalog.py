@@ -0,0 +1,692 @@
+"""
+Catálogo local de provedores e jogos (tabelas providers/games), sincronizado do IGameWin.
+
+As rotas públicas de jogos leem apenas o snapshot em memória deste módulo; nenhuma requisição de
+jogador chama o IGameWin. A tarefa de fundo (sync_loop) baixa provider_list + game_list de cada
+provedor, aplica as diferenças no banco e registra cada uma em catalog_changes (jogo adicionado,
+removido, desativado, reativado ou alterado), com um resumo por execução em catalog_sync_runs.
+
+- Aquecimento: no startup o snapshot é carregado do banco antes de atender requisições; se o
+  catálogo estiver vazio ou velho, a primeira volta do loop sincroniza imediatamente.
+- Falhas parciais: as game_list são buscadas em paralelo (CATALOG_FETCH_CONCURRENCY) com timeout
+  por provedor; se a de um provedor falhar ou demorar demais, os jogos dele ficam como estão (nada
+  é marcado como removido por causa de um erro do upstream).
+- Vários workers: cada processo só sincroniza se a última execução bem-sucedida registrada no
+  banco for mais velha que CATALOG_SYNC_INTERVAL_SECONDS; caso contrário apenas recarrega o snapshot.
+- Falhas totais (sem agente ativo, upstream fora, circuito aberto): a próxima tentativa espera em
+  backoff exponencial (até CATALOG_SYNC_MAX_BACKOFF_SECONDS) e a mesma falha repetida atualiza a
+  linha de catalog_sync_runs da anterior em vez de gravar uma nova.
+"""
+import asyncio
+import base64
+import bisect
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+import catalog_overrides
+import metrics
+import thumbnail_pack
+from models import CatalogChange, CatalogSyncRun, Game, Provider
+
+SYNC_INTERVAL_SECONDS = int(os.getenv("CATALOG_SYNC_INTERVAL_SECONDS", "600"))
+_CHECK_INTERVAL_SECONDS = min(60, SYNC_INTERVAL_SECONDS)
+# Busca das game_list: provedores em paralelo, com limite de concorrência e timeout por provedor
+FETCH_CONCURRENCY = int(os.getenv("CATALOG_FETCH_CONCURRENCY", "8"))
+FETCH_TIMEOUT_SECONDS = float(os.getenv("CATALOG_FETCH_TIMEOUT_SECONDS", "20"))
+MAX_BACKOFF_SECONDS = int(os.getenv("CATALOG_SYNC_MAX_BACKOFF_SECONDS", "1800"))
+
+RUN_SUCCESS = "success"
+RUN_PARTIAL = "partial"
+RUN_FAILED = "failed"
+
+CHANGE_ADDED = "added"
+CHANGE_REMOVED = "removed"
+CHANGE_DISABLED = "disabled"
+CHANGE_ENABLED = "enabled"
+CHANGE_UPDATED = "updated"
+
+
+class Catalog(NamedTuple):
+    version: int  # id da execução de sync que gerou os dados (0 = catálogo vazio)
+    providers: List[Dict[str, Any]]  # Provedores na ordem do upstream (ativos e inativos)
+    games: Dict[str, List[Dict[str, Any]]]  # provider_code normalizado -> jogos na ordem do upstream
+    game_providers: Dict[str, str]  # Índice game_code -> provider_code (launch sem provider_code)
+    overrides_version: int = 0  # versão das customizações do admin aplicadas aos jogos
+    # Lobby: (chave, jogo) em ordem de chave = (provider_code efetivo normalizado, posição, game_code)
+    lobby: Tuple[Tuple[Tuple[str, int, str], Dict[str, Any]], ...] = ()
+    # provider_code efetivo normalizado -> (início, fim) da sua faixa contígua em `lobby`
+    lobby_ranges: Dict[str, Tuple[int, int]] = {}
+
+    def games_for(self, provider_code: Optional[str]) -> List[Dict[str, Any]]:
+        return self.games.get(normalize_code(provider_code), [])
+
+    @property
+    def revision(self) -> str:
+        """Muda quando os jogos ou as customizações mudam (chave dos caches das rotas públicas)."""
+        return f"{self.version}.{self.overrides_version}"
+
+
+# _raw: como está no banco; _catalog: com as customizações do admin aplicadas (o que as rotas leem)
+_raw = Catalog(version=0, providers=[], games={}, game_providers={})
+_catalog = _raw
+_materialize_lock = threading.Lock()
+_reload_listeners: List[Callable[[Catalog], None]] = []
+_sync_lock = asyncio.Lock()
+
+# Jogo fora do índice: no máximo uma busca pontual no upstream por intervalo, com prazo curto
+MISS_REFRESH_INTERVAL_SECONDS = int(os.getenv("CATALOG_MISS_REFRESH_SECONDS", "120"))
+MISS_LOOKUP_TIMEOUT_SECONDS = float(os.getenv("CATALOG_MISS_LOOKUP_TIMEOUT_SECONDS", "5"))
+_last_miss_lookup = 0.0
+# game_code -> provider_code resolvidos fora do snapshot (banco ou busca pontual); zerado a cada
+# novo catálogo do banco, que já os inclui. O snapshot publicado nunca é alterado.
+_index_overlay: Dict[str, str] = {}
+_index_stats: Dict[str, int] = {"hits": 0, "db_hits": 0, "misses": 0, "lookups": 0}
+# Falhas totais seguidas do sync_loop e quando pode ser a próxima tentativa (time.monotonic)
+_sync_failures = 0
+_next_sync_at = 0.0
+
+
+def normalize_code(code: Optional[str]) -> str:
+    return (code or "").upper().strip()
+
+
+def get_catalog() -> Catalog:
+    """Snapshot atual (imutável por convenção: quem precisar alterar jogos deve copiar os dicts)."""
+    return _catalog
+
+
+# ========== NORMALIZAÇÃO DO UPSTREAM ==========
+
+def _provider_fields(p: Dict[str, Any]) -> Tuple[str, str, bool]:
+    code = str(p.get("code") or p.get("provider_code") or "").strip()
+    name = p.get("name") or p.get("provider_name") or code
+    is_active = str(p.get("status", 1)) in ["1", "true", "True"]
+    return code, name, is_active
+
+
+def _game_fields(g: Dict[str, Any]) -> Tuple[Optional[str], Optional[str], Optional[str], Optional[str], bool]:
+    code = g.get("game_code") or g.get("code") or g.get("game_id") or g.get("id") or g.get("slug")
+    name = g.get("game_name") or g.get("name") or g.get("title") or g.get("gameTitle")
+    banner = g.get("banner") or g.get("image") or g.get("icon")
+    category = g.get("category") or g.get("game_type") or g.get("type")
+    status_val = g.get("status")
+    is_active = (status_val == 1) or (status_val is True) or (str(status_val).lower() == "active")
+    return (str(code) if code else None), name, banner, (str(category) if category else None), is_active
+
+
+def _provider_dict(row: Provider) -> Dict[str, Any]:
+    raw = json.loads(row.raw_json) if row.raw_json else {}
+    return {**raw, "code": row.code, "name": row.name, "status": 1 if row.is_active else 0}
+
+
+def _game_dict(row: Game) -> Dict[str, Any]:
+    raw = json.loads(row.raw_json) if row.raw_json else {}
+    return {
+        **raw,
+        "game_code": row.game_code,
+        "game_name": row.name,
+        "provider_code": row.provider_code,
+        "banner": row.banner,
+        "category": row.category,
+        "status": 1 if row.is_active else 0,
+    }
+
+
+# ========== SNAPSHOT ==========
+
+def load_catalog(db: Session) -> Catalog:
+    """Lê o catálogo do banco (provedores e jogos não removidos) e monta um novo snapshot."""
+    version = db.query(CatalogSyncRun.id).filter(
+        CatalogSyncRun.status != RUN_FAILED
+    ).order_by(CatalogSyncRun.id.desc()).limit(1).scalar() or 0
+    providers = [
+        _provider_dict(p)
+        for p in db.query(Provider).filter(Provider.removed_at.is_(None)).order_by(Provider.position, Provider.id)
+    ]
+    games: Dict[str, List[Dict[str, Any]]] = {}
+    for g in db.query(Game).filter(Game.removed_at.is_(None)).order_by(Game.provider_code, Game.position, Game.id):
+        games.setdefault(normalize_code(g.provider_code), []).append(_game_dict(g))
+    return Catalog(version=version, providers=providers, games=games, game_providers=_build_index(providers, games))
+
+
+def _build_index(providers: List[Dict[str, Any]], games: Dict[str, List[Dict[str, Any]]]) -> Dict[str, str]:
+    """
+    game_code -> provider_code. Se o mesmo código existe em mais de um provedor, vence o jogo ativo
+    de provedor ativo, na ordem da provider_list (mesma escolha da busca sequencial antiga).
+    """
+    index: Dict[str, str] = {}
+    ordered = sorted(providers, key=lambda p: 0 if p.get("status") == 1 else 1)
+    for active_only in (True, False):
+        for p in ordered:
+            for g in games.get(normalize_code(p["code"]), []):
+                if active_only and g.get("status") != 1:
+                    continue
+                index.setdefault(g["game_code"], p["code"])
+    return index
+
+
+def _lookup_provider(game_code: str) -> Optional[str]:
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return db.query(Game.provider_code).filter(
+            Game.game_code == game_code, Game.removed_at.is_(None)
+        ).order_by(Game.is_active.desc(), Game.id).limit(1).scalar()
+    finally:
+        db.close()
+
+
+async def _lookup_upstream(api, game_code: str) -> Optional[str]:
+    """
+    Busca pontual para o launch atual: game_list só dos provedores ativos que ainda não têm jogos
+    no snapshot (novos ou que falharam na última sincronização), com prazo total curto. Os jogos
+    encontrados entram no overlay do índice.
+    """
+    catalog = _catalog
+    codes = [
+        p["code"] for p in catalog.providers
+        if p.get("status") == 1 and not catalog.games_for(p["code"])
+    ]
+    if not codes:
+        return None
+    _index_stats["lookups"] += 1
+    try:
+        games, errors = await asyncio.wait_for(
+            api.get_games_for_providers(codes, concurrency=FETCH_CONCURRENCY, timeout=MISS_LOOKUP_TIMEOUT_SECONDS),
+            MISS_LOOKUP_TIMEOUT_SECONDS,
+        )
+    except asyncio.TimeoutError:
+        print(f"[Game Catalog] Busca pontual de {game_code} excedeu {MISS_LOOKUP_TIMEOUT_SECONDS:.0f}s")
+        return None
+    for provider_code, provider_games in games.items():
+        for g in provider_games:
+            code = _game_fields(g)[0]
+            if code:
+                _index_overlay.setdefault(code, provider_code)
+    print(f"[Game Catalog] Busca pontual de {game_code}: {len(games)} provedores consultados, {len(errors)} com erro")
+    return _index_overlay.get(game_code)
+
+
+async def resolve_provider(game_code: str, api=None) -> Optional[str]:
+    """
+    Provedor de um jogo: consulta O(1) no índice em memória. Na falta, uma consulta pontual ao
+    catálogo persistido (outro worker pode ter sincronizado) e, se o jogo não existe lá e `api` foi
+    informada, uma busca pontual no upstream (no máximo uma por CATALOG_MISS_REFRESH_SECONDS) cujo
+    resultado já vale para este launch.
+    """
+    global _last_miss_lookup
+    provider_code = _catalog.game_providers.get(game_code) or _index_overlay.get(game_code)
+    if provider_code:
+        _index_stats["hits"] += 1
+        return provider_code
+
+    provider_code = await asyncio.to_thread(_lookup_provider, game_code)
+    if provider_code:
+        _index_stats["db_hits"] += 1
+        _index_overlay[game_code] = provider_code
+        return provider_code
+
+    now = time.monotonic()
+    if api is not None and now - _last_miss_lookup >= MISS_REFRESH_INTERVAL_SECONDS:
+        _last_miss_lookup = now
+        provider_code = await _lookup_upstream(api, game_code)
+        if provider_code:
+            return provider_code
+    _index_stats["misses"] += 1
+    return None
+
+
+def on_reload(fn: Callable[[Catalog], None]) -> None:
+    """Registra uma função chamada com cada novo snapshot (ex.: índice de busca)."""
+    _reload_listeners.append(fn)
+
+
+def _with_thumbnail(game: Dict[str, Any]) -> Dict[str, Any]:
+    url = thumbnail_pack.url_for(game.get("banner"))
+    return {**game, "banner": url} if url else game
+
+
+def _materialize(raw: Catalog) -> Catalog:
+    """
+    Snapshot com as customizações aplicadas uma única vez e banners do pacote de miniaturas trocados
+    pelas URLs com hash (jogos sem alteração são compartilhados). A ordem do lobby usa o provedor já
+    customizado, então o filtro por provedor encontra o jogo sob o provedor que ele exibe.
+    """
+    overrides = catalog_overrides.get()
+    games = raw.games
+    if overrides.customizations or thumbnail_pack.loaded():
+        games = {
+            provider: [_with_thumbnail(catalog_overrides.customize(g, overrides)) for g in provider_games]
+            for provider, provider_games in raw.games.items()
+        }
+    # Provedor efetivo normalizado (customizado ou o da lista), na forma das chaves de catalog.games
+    lobby = sorted(
+        (
+            ((normalize_code(g.get("provider_code") or provider), position, str(g["game_code"])), g)
+            for provider, provider_games in games.items()
+            for position, g in enumerate(provider_games)
+        ),
+        key=lambda entry: entry[0],
+    )
+    lobby_ranges: Dict[str, Tuple[int, int]] = {}
+    for index, (key, _) in enumerate(lobby):
+        start, _ = lobby_ranges.get(key[0], (index, index))
+        lobby_ranges[key[0]] = (start, index + 1)
+    return raw._replace(
+        games=games, overrides_version=overrides.version, lobby=tuple(lobby), lobby_ranges=lobby_ranges,
+    )
+
+
+def _publish(raw: Optional[Catalog] = None) -> Catalog:
+    """Troca o snapshot publicado (novo catálogo do banco e/ou novas customizações) e avisa os ouvintes."""
+    global _raw, _catalog
+    # Ouvintes notificados dentro do lock: recebem os snapshots na ordem em que foram publicados
+    with _materialize_lock:
+        if raw is not None:
+            _raw = raw
+            _index_overlay.clear()
+        _catalog = catalog = _materialize(_raw)
+        for listener in list(_reload_listeners):
+            try:
+                listener(catalog)
+            except Exception as e:
+                print(f"[Game Catalog] Erro ao notificar recarga do catálogo ({getattr(listener, '__name__', listener)}): {e}")
+    return catalog
+
+
+def _reload() -> Catalog:
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        raw = load_catalog(db)
+    finally:
+        db.close()
+    return _publish(raw)
+
+
+def apply_overrides(db: Optional[Session] = None) -> bool:
+    """Relê customizações/ordem de provedores; se mudaram, rematerializa o catálogo. True = mudou."""
+    if not catalog_overrides.refresh(db):
+        return False
+    _publish()
+    return True
+
+
+# ========== SINCRONIZAÇÃO ==========
+
+def _change(db: Session, run: CatalogSyncRun, entity: str, change: str, provider_code: str,
+            game_code: Optional[str] = None, detail: Optional[Dict[str, Any]] = None) -> None:
+    db.add(CatalogChange(
+        sync_run_id=run.id,
+        entity=entity,
+        change=change,
+        provider_code=provider_code,
+        game_code=game_code,
+        detail=json.dumps(detail) if detail else None,
+    ))
+    if entity == "game":
+        setattr(run, change, getattr(run, change) + 1)
+
+
+def _apply_status(db: Session, run: CatalogSyncRun, entity: str, row, is_active: bool,
+                  provider_code: str, game_code: Optional[str] = None) -> None:
+    if row.is_active and not is_active:
+        _change(db, run, entity, CHANGE_DISABLED, provider_code, game_code)
+    elif not row.is_active and is_active:
+        _change(db, run, entity, CHANGE_ENABLED, provider_code, game_code)
+    row.is_active = is_active
+
+
+def apply_sync(
+    db: Session,
+    upstream_providers: List[Dict[str, Any]],
+    upstream_games: Dict[str, List[Dict[str, Any]]],
+    failed_providers: List[str],
+) -> CatalogSyncRun:
+    """
+    Aplica no banco o estado baixado do upstream e registra as diferenças. `upstream_games` só
+    contém os provedores cuja game_list foi obtida; os de `failed_providers` não são tocados.
+    """
+    now = datetime.utcnow()
+    run = CatalogSyncRun(
+        status=RUN_PARTIAL if failed_providers else RUN_SUCCESS,
+        failed_providers=json.dumps(failed_providers) if failed_providers else None,
+        added=0, removed=0, disabled=0, enabled=0, updated=0,
+        started_at=now,
+    )
+    db.add(run)
+    db.flush()
+
+    # Provedores
+    existing_providers = {p.code: p for p in db.query(Provider).all()}
+    seen_providers = set()
+    for position, p in enumerate(upstream_providers):
+        code, name, is_active = _provider_fields(p)
+        if not code or code in seen_providers:
+            continue
+        seen_providers.add(code)
+        row = existing_providers.get(code)
+        if row is None:
+            row = Provider(code=code, is_active=is_active)
+            db.add(row)
+            _change(db, run, "provider", CHANGE_ADDED, code)
+        elif row.removed_at is not None:
+            row.removed_at = None
+            row.is_active = is_active
+            _change(db, run, "provider", CHANGE_ADDED, code)
+        else:
+            _apply_status(db, run, "provider", row, is_active, code)
+        row.name = name
+        row.position = position
+        row.raw_json = json.dumps(p)
+    removed_providers = []
+    for code, row in existing_providers.items():
+        if code not in seen_providers and row.removed_at is None:
+            row.removed_at = now
+            removed_providers.append(code)
+            _change(db, run, "provider", CHANGE_REMOVED, code)
+    if removed_providers:
+        # Provedor saiu da provider_list: os jogos dele saem do catálogo junto
+        for row in db.query(Game).filter(Game.provider_code.in_(removed_providers), Game.removed_at.is_(None)):
+            row.removed_at = now
+            _change(db, run, "game", CHANGE_REMOVED, row.provider_code, row.game_code)
+
+    # Jogos (por provedor obtido com sucesso)
+    existing_games: Dict[Tuple[str, str], Game] = {
+        (g.provider_code, g.game_code): g
+        for g in db.query(Game).filter(Game.provider_code.in_(list(upstream_games))).all()
+    } if upstream_games else {}
+    seen_games = set()
+    for provider_code, games in upstream_games.items():
+        for position, g in enumerate(games):
+            game_code, name, banner, category, is_active = _game_fields(g)
+            key = (provider_code, game_code)
+            if not game_code or key in seen_games:
+                continue
+            seen_games.add(key)
+            row = existing_games.get(key)
+            if row is None:
+                row = Game(provider_code=provider_code, game_code=game_code, is_active=is_active)
+                db.add(row)
+                _change(db, run, "game", CHANGE_ADDED, provider_code, game_code)
+            elif row.removed_at is not None:
+                row.removed_at = None
+                row.is_active = is_active
+                _change(db, run, "game", CHANGE_ADDED, provider_code, game_code)
+            else:
+                _apply_status(db, run, "game", row, is_active, provider_code, game_code)
+                before = {"name": row.name, "banner": row.banner, "category": row.category}
+                after = {"name": name, "banner": banner, "category": category}
+                if before != after:
+                    _change(db, run, "game", CHANGE_UPDATED, provider_code, game_code, {"before": before, "after": after})
+            row.name = name
+            row.banner = banner
+            row.category = category
+            row.position = position
+            row.raw_json = json.dumps(g)
+    for key, row in existing_games.items():
+        if key not in seen_games and row.removed_at is None:
+            row.removed_at = now
+            _change(db, run, "game", CHANGE_REMOVED, row.provider_code, row.game_code)
+
+    db.flush()
+    run.providers_total = len(seen_providers)
+    run.games_total = db.query(Game).filter(Game.removed_at.is_(None)).count()
+    run.finished_at = datetime.utcnow()
+    db.commit()
+    return run
+
+
+def _record_failed_run(error: str) -> None:
+    """Registra uma falha; a repetição da última falha só avança o finished_at da mesma linha."""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        error = error[:2000]
+        latest = db.query(CatalogSyncRun).order_by(CatalogSyncRun.id.desc()).first()
+        if latest is not None and latest.status == RUN_FAILED and latest.error == error:
+            latest.finished_at = now
+        else:
+            db.add(CatalogSyncRun(status=RUN_FAILED, error=error, started_at=now, finished_at=now))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _load_api():
+    from database import SessionLocal
+    from igamewin_api import get_igamewin_api
+
+    db = SessionLocal()
+    try:
+        return get_igamewin_api(db)
+    finally:
+        db.close()
+
+
+def _apply_sync_once(providers, games, failed) -> Dict[str, Any]:
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        run = apply_sync(db, providers, games, failed)
+        return run_dict(run)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def sync_catalog() -> Dict[str, Any]:
+    """Baixa o catálogo do IGameWin, aplica as diferenças e troca o snapshot. Retorna o resumo."""
+    async with _sync_lock:
+        api = await asyncio.to_thread(_load_api)
+        if not api:
+            error = "Nenhum agente IGameWin ativo configurado"
+            await asyncio.to_thread(_record_failed_run, error)
+            return {"status": RUN_FAILED, "error": error}
+
+        upstream_providers = await api.get_providers()
+        if upstream_providers is None:
+            error = f"Falha ao obter provedores: {api.last_error or 'erro desconhecido'}"
+            await asyncio.to_thread(_record_failed_run, error)
+            print(f"[Game Catalog] {error}")
+            return {"status": RUN_FAILED, "error": error}
+
+        # game_list de todos os provedores em paralelo (limitado): a duração é a do provedor mais lento
+        codes = list(dict.fromkeys(c for c in (_provider_fields(p)[0] for p in upstream_providers) if c))
+        upstream_games, errors = await api.get_games_for_providers(
+            codes, concurrency=FETCH_CONCURRENCY, timeout=FETCH_TIMEOUT_SECONDS
+        )
+        for code, error in errors.items():
+            print(f"[Game Catalog] Falha ao obter jogos de {code}: {error}")
+        failed = [c for c in codes if c in errors]
+
+        summary = await asyncio.to_thread(_apply_sync_once, upstream_providers, upstream_games, failed)
+        await asyncio.to_thread(_reload)
+        print(
+            f"[Game Catalog] Sync #{summary['id']} ({summary['status']}): {summary['providers_total']} provedores, "
+            f"{summary['games_total']} jogos | +{summary['added']} -{summary['removed']} "
+            f"desativados={summary['disabled']} reativados={summary['enabled']} alterados={summary['updated']}"
+        )
+        return summary
+
+
+def _latest_success() -> Optional[Tuple[int, datetime]]:
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return db.query(CatalogSyncRun.id, CatalogSyncRun.finished_at).filter(
+            CatalogSyncRun.status != RUN_FAILED
+        ).order_by(CatalogSyncRun.id.desc()).first()
+    finally:
+        db.close()
+
+
+def _schedule_next_sync(ok: bool) -> None:
+    """Após uma tentativa do sync_loop: sucesso zera o backoff; falha dobra a espera (com teto)."""
+    global _sync_failures, _next_sync_at
+    if ok:
+        _sync_failures = 0
+        _next_sync_at = 0.0
+        return
+    _sync_failures += 1
+    delay = min(_CHECK_INTERVAL_SECONDS * 2 ** (_sync_failures - 1), MAX_BACKOFF_SECONDS)
+    _next_sync_at = time.monotonic() + delay
+    print(f"[Game Catalog] {_sync_failures} falha(s) seguida(s) na sincronização; próxima tentativa em {delay:.0f}s")
+
+
+async def sync_loop() -> None:
+    """Tarefa de fundo: sincroniza quando o catálogo está velho; senão acompanha o de outro worker."""
+    while True:
+        try:
+            latest = await asyncio.to_thread(_latest_success)
+            stale = latest is None or latest[1] is None or (
+                datetime.utcnow() - latest[1] >= timedelta(seconds=SYNC_INTERVAL_SECONDS)
+            )
+            if stale:
+                if time.monotonic() >= _next_sync_at:
+                    ok = False
+                    try:
+                        ok = (await sync_catalog())["status"] != RUN_FAILED
+                    finally:
+                        _schedule_next_sync(ok)
+            elif latest[0] != _catalog.version:
+                await asyncio.to_thread(_reload)
+            # Customizações alteradas por outro worker
+            await asyncio.to_thread(apply_overrides)
+        except Exception as e:
+            print(f"[Game Catalog] Erro na sincronização: {e}")
+        await asyncio.sleep(_CHECK_INTERVAL_SECONDS)
+
+
+async def start() -> None:
+    """Carrega o snapshot do banco (aquecimento) e inicia a sincronização em segundo plano."""
+    await asyncio.to_thread(catalog_overrides.refresh)
+    catalog = await asyncio.to_thread(_reload)
+    print(f"[Game Catalog] Catálogo carregado: {len(catalog.providers)} provedores, "
+          f"{sum(len(g) for g in catalog.games.values())} jogos (versão {catalog.version})")
+    asyncio.create_task(sync_loop())
+
+
+# ========== LOBBY (PAGINAÇÃO POR CURSOR) ==========
+
+def encode_cursor(key: Tuple[str, int, str]) -> str:
+    """Cursor opaco com a chave de ordenação (provider_code, position, game_code) do último jogo da página."""
+    raw = json.dumps(list(key), separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int, str]:
+    """Chave de ordenação do cursor; ValueError se inválido."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        provider_code, position, game_code = json.loads(raw)
+        return str(provider_code), int(position), str(game_code)
+    except Exception:
+        raise ValueError("cursor inválido")
+
+
+def lobby_page(
+    catalog: Catalog,
+    provider_codes: Optional[List[str]] = None,
+    category: Optional[str] = None,
+    active: Optional[bool] = True,
+    after: Optional[Tuple[str, int, str]] = None,
+    limit: int = 48,
+) -> Tuple[List[Tuple[Tuple[str, int, str], Dict[str, Any]]], bool]:
+    """
+    Uma página do lobby do snapshot (customizações já aplicadas) depois da chave `after`.
+
+    Sem banco nem I/O: com filtro de provedor, só as faixas desses provedores são percorridas; em
+    cada faixa, busca binária até o cursor e varredura filtrada a partir dele. A chave é estável
+    entre versões do catálogo, então um cursor continua válido após uma sincronização.
+    Devolve ([(chave, jogo)], há_mais).
+    """
+    entries = catalog.lobby
+    if provider_codes is None:
+        ranges = [(0, len(entries))]
+    else:
+        # Faixas em ordem de posição = ordem de chave (o provedor é o primeiro campo da chave)
+        wanted = {normalize_code(c) for c in provider_codes}
+        ranges = sorted(catalog.lobby_ranges[p] for p in wanted if p in catalog.lobby_ranges)
+    page = []
+    for start, end in ranges:
+        if after is not None:
+            start = bisect.bisect_right(entries, after, start, end, key=lambda entry: entry[0])
+        for index in range(start, end):
+            key, game = entries[index]
+            if category and game.get("category") != category:
+                continue
+            if active is not None and (game.get("status") == 1) != active:
+                continue
+            if len(page) == limit:
+                return page, True
+            page.append((key, game))
+    return page, False
+
+
+# ========== CONSULTAS DO ADMIN ==========
+
+def run_dict(run: CatalogSyncRun) -> Dict[str, Any]:
+    return {
+        "id": run.id,
+        "status": run.status,
+        "providers_total": run.providers_total,
+        "games_total": run.games_total,
+        "added": run.added,
+        "removed": run.removed,
+        "disabled": run.disabled,
+        "enabled": run.enabled,
+        "updated": run.updated,
+        "failed_providers": json.loads(run.failed_providers) if run.failed_providers else [],
+        "error": run.error,
+        "started_at": run.started_at.isoformat() if run.started_at else None,
+        "finished_at": run.finished_at.isoformat() if run.finished_at else None,
+    }
+
+
+def change_dict(change: CatalogChange) -> Dict[str, Any]:
+    return {
+        "id": change.id,
+        "sync_run_id": change.sync_run_id,
+        "entity": change.entity,
+        "change": change.change,
+        "provider_code": change.provider_code,
+        "game_code": change.game_code,
+        "detail": json.loads(change.detail) if change.detail else None,
+        "created_at": change.created_at.isoformat(),
+    }
+
+
+def _metric_lines() -> List[str]:
+    catalog = _catalog
+    lookups = [({"result": "hit"}, _index_stats["hits"]), ({"result": "db"}, _index_stats["db_hits"]),
+               ({"result": "miss"}, _index_stats["misses"])]
+    return (
+        metrics.gauge("catalog_version", "Execução de sync carregada no snapshot do catálogo", [({}, catalog.version)])
+        + metrics.gauge("catalog_providers", "Provedores no catálogo local", [({}, len(catalog.providers))])
+        + metrics.gauge("catalog_games", "Jogos no catálogo local", [({}, sum(len(g) for g in catalog.games.values()))])
+        + metrics.gauge("catalog_index_entries", "Entradas do índice game_code -> provider",
+                        [({}, len(catalog.game_providers) + len(_index_overlay))])
+        + metrics.counter_samples("catalog_index_lookups_total", "Resoluções de provedor no launch por resultado", lookups)
+        + metrics.gauge("catalog_sync_consecutive_failures", "Falhas totais seguidas da sincronização (backoff)",
+                        [({}, _sync_failures)])
+        + metrics.counter_samples("catalog_miss_lookups_total", "Buscas pontuais no upstream por jogo fora do catálogo",
+                                  [({}, _index_stats["lookups"])])
+    )
+
+
+metrics.register_collector(_metric_lines)
@@ -0,0 +1,389 @@
+"""
+Popularidade dos jogos calculada a partir das apostas reais (Bet): listas de populares e em alta.
+
+Contadores por jogo em baldes de 1 hora: rodadas, valor apostado e jogadores únicos. Os jogadores
+ficam num HyperLogLog de 256 registradores (256 bytes por jogo/hora, erro típico de ~6,5%): baldes
+de horas diferentes ou de outros workers se combinam pelo máximo de cada registrador, sem guardar
+os user_id. O bet_writer chama record() com as apostas novas de cada lote gravado; nenhuma
+agregação é feita por requisição.
+
+Os baldes da janela de 7 dias ficam em memória. A cada POPULARITY_REFRESH_SECONDS a tarefa de
+fundo soma os deltas deste processo na tabela game_popularity_buckets (todos os workers somam nas
+mesmas linhas) e relê só os baldes a partir da hora do ciclo anterior (onde os outros workers
+escrevem). A leitura completa, com a poda dos baldes mais velhos que 7 dias, acontece na
+inicialização e a cada POPULARITY_FULL_RELOAD_SECONDS (pega gravações atrasadas em horas antigas).
+Por janela, os totais das horas já fechadas ficam guardados e só são refeitos na virada da hora;
+nos demais ciclos o ranking combina esses totais com o balde da hora corrente e o da borda.
+
+As janelas deslizam por aproximação: contam inteiras as horas dentro da janela e, do balde mais
+antigo, a fração que ainda cai dentro dela (interpolação linear, como em rate limiters).
+"""
+import asyncio
+import hashlib
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+
+import game_catalog
+import metrics
+from models import GamePopularityBucket
+
+REFRESH_SECONDS = int(os.getenv("POPULARITY_REFRESH_SECONDS", "60"))
+FULL_RELOAD_SECONDS = int(os.getenv("POPULARITY_FULL_RELOAD_SECONDS", "3600"))
+MAX_RANKED = 200  # Jogos guardados por ranking
+
+WINDOWS = {"1h": 1, "24h": 24, "7d": 24 * 7}
+SORTS = ("players", "rounds", "wagered")
+_RETENTION = timedelta(hours=max(WINDOWS.values()) + 1)
+_PERSIST_BATCH = 500
+
+# HyperLogLog: 2^8 registradores; índice = 8 bits mais altos do hash, posto = zeros à esquerda + 1
+_HLL_BITS = 8
+_HLL_SIZE = 1 << _HLL_BITS
+_HLL_REST_BITS = 64 - _HLL_BITS
+_HLL_ALPHA = 0.7213 / (1 + 1.079 / _HLL_SIZE)
+_INV_POW2 = [2.0 ** -i for i in range(_HLL_REST_BITS + 2)]
+
+
+def _hll_add(registers: bytearray, user_id: Any) -> None:
+    x = int.from_bytes(hashlib.blake2b(str(user_id).encode(), digest_size=8).digest(), "big")
+    index = x >> _HLL_REST_BITS
+    rank = _HLL_REST_BITS + 1 - (x & ((1 << _HLL_REST_BITS) - 1)).bit_length()
+    if rank > registers[index]:
+        registers[index] = rank
+
+
+def _hll_merge(registers: bytes, other: bytes) -> bytes:
+    return bytes(map(max, registers, other))
+
+
+def _hll_count(registers: bytes) -> float:
+    estimate = _HLL_ALPHA * _HLL_SIZE * _HLL_SIZE / sum(_INV_POW2[r] for r in registers)
+    zeros = registers.count(0)
+    if estimate <= 2.5 * _HLL_SIZE and zeros:
+        # Poucos jogadores: contagem linear (exata na prática para dezenas de jogadores)
+        estimate = _HLL_SIZE * math.log(_HLL_SIZE / zeros)
+    return estimate
+
+
+def _hour(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+# (provider_code, game_code, hora) -> [rodadas, apostado, hll]: deltas deste processo ainda não gravados
+_pending: Dict[Tuple[str, str, datetime], list] = {}
+_pending_lock = threading.Lock()
+# (window, sort) -> [{"provider_code", "game_code", "rounds", "players", "wagered"}, ...]
+_rankings: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+_version = 0
+# (provider_code, game_code) -> {hora: [rodadas, apostado, hll]}: baldes combinados de todos os workers
+_buckets: Dict[Tuple[str, str], Dict[datetime, list]] = {}
+_synced_hour: Optional[datetime] = None  # hora corrente do último ciclo (próxima releitura parcial começa nela)
+_last_full_load = 0.0
+# window -> jogo -> [rodadas, apostado, hll] das horas fechadas da janela; válido para _closed_hour
+_closed: Dict[str, Dict[Tuple[str, str], list]] = {}
+_closed_hour: Optional[datetime] = None
+_task: Optional[asyncio.Task] = None
+_stats: Dict[str, float] = {
+    "recorded": 0,  # apostas contabilizadas neste processo
+    "persisted_buckets": 0,
+    "refreshes": 0,
+    "refresh_errors": 0,
+    "loaded_buckets": 0,  # baldes lidos do banco no último ciclo
+    "full_loads": 0,
+    "last_refresh_seconds": 0.0,
+}
+
+
+def record(bets: Iterable[Dict[str, Any]]) -> None:
+    """Contabiliza apostas novas (linhas gravadas pelo bet_writer: game_id, provider, user_id, amount, created_at)."""
+    count = 0
+    with _pending_lock:
+        for bet in bets:
+            game_code = bet.get("game_id")
+            if not game_code:
+                continue
+            key = (game_catalog.normalize_code(bet.get("provider")), str(game_code), _hour(bet["created_at"]))
+            bucket = _pending.get(key)
+            if bucket is None:
+                bucket = _pending[key] = [0, 0.0, bytearray(_HLL_SIZE)]
+            bucket[0] += 1
+            bucket[1] += float(bet.get("amount") or 0)
+            _hll_add(bucket[2], bet.get("user_id"))
+            count += 1
+    _stats["recorded"] += count
+
+
+def _restore(pending: Dict[Tuple[str, str, datetime], list]) -> None:
+    """Devolve deltas que não puderam ser gravados (próxima tentativa no ciclo seguinte)."""
+    with _pending_lock:
+        for key, (rounds, wagered, players) in pending.items():
+            bucket = _pending.get(key)
+            if bucket is None:
+                _pending[key] = [rounds, wagered, players]
+            else:
+                bucket[0] += rounds
+                bucket[1] += wagered
+                bucket[2] = bytearray(_hll_merge(bucket[2], players))
+
+
+def _persist(db: Session, pending: Dict[Tuple[str, str, datetime], list]) -> None:
+    keys = list(pending)
+    for i in range(0, len(keys), _PERSIST_BATCH):
+        batch = keys[i:i + _PERSIST_BATCH]
+        existing = {
+            (row.provider_code, row.game_code, row.bucket_start): row
+            for row in db.query(GamePopularityBucket).filter(
+                tuple_(GamePopularityBucket.provider_code, GamePopularityBucket.game_code,
+                       GamePopularityBucket.bucket_start).in_(batch)
+            ).with_for_update()
+        }
+        for key in batch:
+            rounds, wagered, players = pending[key]
+            row = existing.get(key)
+            if row is None:
+                db.add(GamePopularityBucket(
+                    provider_code=key[0], game_code=key[1], bucket_start=key[2],
+                    rounds=rounds, wagered=wagered, players_hll=bytes(players),
+                ))
+            else:
+                row.rounds += rounds
+                row.wagered += wagered
+                row.players_hll = _hll_merge(row.players_hll, players)
+    db.commit()
+    _stats["persisted_buckets"] += len(keys)
+
+
+def _prune(db: Session, now: datetime) -> None:
+    db.query(GamePopularityBucket).filter(
+        GamePopularityBucket.bucket_start < _hour(now) - _RETENTION
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
+def _merge_into(target: list, rounds: float, wagered: float, players: bytes) -> None:
+    target[0] += rounds
+    target[1] += wagered
+    target[2] = _hll_merge(target[2], players)
+
+
+def _build_closed(current: datetime) -> None:
+    """Totais por janela das horas fechadas [início da janela, hora corrente) de cada jogo."""
+    global _closed, _closed_hour
+    closed: Dict[str, Dict[Tuple[str, str], list]] = {}
+    for window, hours in WINDOWS.items():
+        start = current - timedelta(hours=hours - 1)
+        totals: Dict[Tuple[str, str], list] = {}
+        for game, buckets in _buckets.items():
+            for hour, (rounds, wagered, players) in buckets.items():
+                if start <= hour < current:
+                    entry = totals.get(game)
+                    if entry is None:
+                        totals[game] = [rounds, wagered, players]
+                    else:
+                        _merge_into(entry, rounds, wagered, players)
+        closed[window] = totals
+    _closed = closed
+    _closed_hour = current
+
+
+def _window_totals(closed: Optional[list], current: Optional[list], edge: Optional[list],
+                   edge_weight: float) -> Optional[Tuple[float, float, float]]:
+    merged = None
+    rounds = wagered = 0.0
+    for part in (closed, current):
+        if part is not None:
+            rounds += part[0]
+            wagered += part[1]
+            merged = part[2] if merged is None else _hll_merge(merged, part[2])
+    if edge is not None and edge_weight <= 0:
+        edge = None
+    if merged is None and edge is None:
+        return None
+    players = _hll_count(merged) if merged is not None else 0.0
+    if edge is not None:
+        rounds += edge[0] * edge_weight
+        wagered += edge[1] * edge_weight
+        with_edge = _hll_count(edge[2] if merged is None else _hll_merge(merged, edge[2]))
+        players += max(with_edge - players, 0.0) * edge_weight
+    return rounds, players, wagered
+
+
+def _compute_rankings(now: datetime) -> Dict[Tuple[str, str], List[Dict[str, Any]]]:
+    current = _hour(now)
+    if _closed_hour != current:
+        _build_closed(current)
+    fraction = (now - current).total_seconds() / 3600
+    rankings = {}
+    for window, hours in WINDOWS.items():
+        edge_hour = current - timedelta(hours=hours)
+        closed = _closed[window]
+        entries = []
+        for game, buckets in _buckets.items():
+            totals = _window_totals(closed.get(game), buckets.get(current), buckets.get(edge_hour), 1 - fraction)
+            if totals is None or round(totals[0]) < 1:
+                continue
+            rounds, players, wagered = totals
+            entries.append({
+                "provider_code": game[0],
+                "game_code": game[1],
+                "rounds": int(round(rounds)),
+                "players": max(int(round(players)), 1),
+                "wagered": round(wagered, 2),
+            })
+        for sort in SORTS:
+            ordered = sorted(entries, key=lambda e: (e[sort], e["rounds"], e["players"]), reverse=True)
+            rankings[(window, sort)] = ordered[:MAX_RANKED]
+    return rankings
+
+
+def _load(db: Session, since: datetime) -> Dict[Tuple[str, str], Dict[datetime, list]]:
+    games: Dict[Tuple[str, str], Dict[datetime, list]] = {}
+    rows = db.query(
+        GamePopularityBucket.provider_code, GamePopularityBucket.game_code, GamePopularityBucket.bucket_start,
+        GamePopularityBucket.rounds, GamePopularityBucket.wagered, GamePopularityBucket.players_hll,
+    ).filter(GamePopularityBucket.bucket_start >= since).all()
+    for provider_code, game_code, hour, rounds, wagered, players in rows:
+        games.setdefault((provider_code, game_code), {})[hour] = [rounds, wagered, bytes(players)]
+    _stats["loaded_buckets"] = len(rows)
+    return games
+
+
+def _sync_buckets(db: Session, pending: Dict[Tuple[str, str, datetime], list], now: datetime) -> None:
+    """Atualiza os baldes em memória: leitura completa periódica ou só as horas recentes."""
+    global _buckets, _synced_hour, _last_full_load, _closed_hour
+    current = _hour(now)
+    oldest = current - _RETENTION
+    if _synced_hour is None or time.monotonic() - _last_full_load >= FULL_RELOAD_SECONDS:
+        _prune(db, now)
+        _buckets = _load(db, oldest)
+        _last_full_load = time.monotonic()
+        _stats["full_loads"] += 1
+        _closed_hour = None
+    else:
+        since = _synced_hour
+        for game, hours in _load(db, since).items():
+            _buckets.setdefault(game, {}).update(hours)
+        # Deltas deste processo em horas anteriores (ex.: apostas recuperadas após crash)
+        for (provider_code, game_code, hour), (rounds, wagered, players) in pending.items():
+            if oldest <= hour < since:
+                buckets = _buckets.setdefault((provider_code, game_code), {})
+                bucket = buckets.get(hour)
+                if bucket is None:
+                    buckets[hour] = [rounds, wagered, bytes(players)]
+                else:
+                    _merge_into(bucket, rounds, wagered, players)
+                _closed_hour = None
+        if current != _synced_hour:
+            # Virada da hora: descarta da memória os baldes fora da retenção
+            for game in list(_buckets):
+                hours = {hour: b for hour, b in _buckets[game].items() if hour >= oldest}
+                if hours:
+                    _buckets[game] = hours
+                else:
+                    del _buckets[game]
+    _synced_hour = current
+
+
+def refresh(db: Optional[Session] = None) -> None:
+    """Grava os deltas deste processo, atualiza os baldes em memória e troca os rankings."""
+    global _rankings, _version
+    from database import SessionLocal
+
+    started = time.monotonic()
+    session = db or SessionLocal()
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+    try:
+        if pending:
+            try:
+                _persist(session, pending)
+            except Exception:
+                session.rollback()
+                _restore(pending)
+                raise
+        now = datetime.utcnow()
+        _sync_buckets(session, pending, now)
+        _rankings = _compute_rankings(now)
+        _version += 1
+    finally:
+        if db is None:
+            session.close()
+    _stats["refreshes"] += 1
+    _stats["last_refresh_seconds"] = time.monotonic() - started
+
+
+def version() -> int:
+    """Muda a cada recálculo (chave dos caches das listas públicas)."""
+    return _version
+
+
+def ranking(window: str = "24h", sort: str = "players") -> List[Dict[str, Any]]:
+    """Jogos mais jogados na janela (1h, 24h, 7d), do maior para o menor por players/rounds/wagered."""
+    return _rankings.get((window, sort), [])
+
+
+async def _refresh_loop() -> None:
+    while True:
+        await asyncio.sleep(REFRESH_SECONDS)
+        try:
+            await asyncio.to_thread(refresh)
+        except Exception as e:
+            _stats["refresh_errors"] += 1
+            print(f"[Popularity] Erro ao gravar/recalcular popularidade: {e}")
+
+
+async def start() -> None:
+    """Carrega os rankings persistidos e inicia o ciclo de gravação/recálculo."""
+    global _task
+    try:
+        await asyncio.to_thread(refresh)
+    except Exception as e:
+        _stats["refresh_errors"] += 1
+        print(f"[Popularity] Erro ao carregar popularidade: {e}")
+    _task = asyncio.create_task(_refresh_loop())
+
+
+async def stop() -> None:
+    """Grava os deltas pendentes (chamar depois do bet_writer.stop, que drena as apostas)."""
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
+    try:
+        await asyncio.to_thread(refresh)
+    except Exception as e:
+        print(f"[Popularity] Erro ao gravar popularidade no encerramento: {e}")
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        **_stats,
+        "version": _version,
+        "pending_buckets": len(_pending),
+        "games": {window: len(_rankings.get((window, "rounds"), [])) for window in WINDOWS},
+        "refresh_seconds": REFRESH_SECONDS,
+        "games_in_memory": len(_buckets),
+    }
+
+
+def _metric_lines() -> List[str]:
+    return (
+        metrics.counter_samples("game_popularity_bets_recorded_total", "Apostas contabilizadas na popularidade dos jogos",
+                                [({}, _stats["recorded"])])
+        + metrics.counter_samples("game_popularity_refresh_errors_total", "Falhas ao gravar/recalcular a popularidade",
+                                  [({}, _stats["refresh_errors"])])
+        + metrics.gauge("game_popularity_ranked_games", "Jogos com apostas na janela",
+                        [({"window": window}, len(_rankings.get((window, "rounds"), []))) for window in WINDOWS])
+        + metrics.gauge("game_popularity_pending_buckets", "Baldes com apostas ainda não gravadas", [({}, len(_pending))])
+    )
+
+
+metrics.register_collector(_metric_lines)
@@ -0,0 +1,356 @@
+"""
+Índice de busca de jogos em memória sobre o catálogo local (game_catalog).
+
+- Normalização: nomes em minúsculas, sem acentos (NFKD) e com pontuação trocada por espaço, de
+  modo que "Fortune Tigre", "fortune-tigre" e "FÓRTUNE TIGRE" são a mesma coisa.
+- Prefixo: trie por palavra; cada nó guarda os ids dos jogos com alguma palavra começando pelo
+  caminho até ele. "gat oly" encontra "Gates of Olympus" (todas as palavras da busca precisam ser
+  prefixo de alguma palavra do nome).
+- Aproximada: vocabulário de palavras dos nomes indexado por trigramas (como o pg_trgm), com
+  similaridade de Jaccard por palavra; usada quando a busca por prefixo não preenche o limite
+  ("olimpus" -> "Olympus", "avaitor" -> "Aviator").
+
+O índice é atualizado incrementalmente a cada recarga do catálogo (só os jogos adicionados,
+removidos ou alterados mexem na trie/trigramas); a primeira carga monta tudo e troca de uma vez.
+"""
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import game_catalog
+import metrics
+
+# Similaridade mínima (trigramas) para um resultado aproximado
+FUZZY_THRESHOLD = 0.3
+# Para best_match (destaques/populares) o resultado aproximado precisa ser mais parecido
+BEST_MATCH_FUZZY_THRESHOLD = 0.5
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+# Níveis de relevância (menor = melhor)
+TIER_EXACT = 0  # nome normalizado igual à busca
+TIER_STARTS = 1  # nome começa com a busca
+TIER_PREFIX = 2  # todas as palavras da busca são prefixo de palavras do nome
+TIER_FUZZY = 3
+
+
+def fold(text: Optional[str]) -> str:
+    """Minúsculas, sem acentos, só letras/dígitos separados por um espaço."""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _NON_ALNUM.sub(" ", stripped.lower()).strip()
+
+
+def trigrams(folded: str) -> Set[str]:
+    grams: Set[str] = set()
+    for word in folded.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class Doc(NamedTuple):
+    key: Tuple[str, str]  # (provider_code normalizado, game_code)
+    game: Dict[str, Any]  # dict do snapshot do catálogo
+    provider: str
+    folded: str
+    tokens: Tuple[str, ...]
+    active: bool
+    position: int
+
+
+class _Node:
+    __slots__ = ("children", "ids")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_Node"] = {}
+        self.ids: Set[int] = set()
+
+
+class SearchIndex:
+    """Trie de prefixos das palavras + vocabulário de palavras indexado por trigramas."""
+
+    def __init__(self) -> None:
+        self.docs: Dict[int, Doc] = {}
+        self.ids: Dict[Tuple[str, str], int] = {}
+        self.root = _Node()
+        self.words: Dict[str, Set[int]] = {}  # palavra -> jogos que a contêm
+        self.word_grams: Dict[str, int] = {}  # palavra -> quantidade de trigramas
+        self.postings: Dict[str, Set[str]] = {}  # trigrama -> palavras
+        self._next_id = 0
+
+    # ----- manutenção -----
+
+    def add(self, doc: Doc) -> None:
+        doc_id = self._next_id
+        self._next_id += 1
+        self.docs[doc_id] = doc
+        self.ids[doc.key] = doc_id
+        for token in set(doc.tokens):
+            node = self.root
+            for char in token:
+                node = node.children.setdefault(char, _Node())
+                node.ids.add(doc_id)
+            docs = self.words.get(token)
+            if docs is None:
+                docs = self.words[token] = set()
+                grams = trigrams(token)
+                self.word_grams[token] = len(grams)
+                for gram in grams:
+                    self.postings.setdefault(gram, set()).add(token)
+            docs.add(doc_id)
+
+    def remove(self, key: Tuple[str, str]) -> None:
+        doc_id = self.ids.pop(key, None)
+        if doc_id is None:
+            return
+        doc = self.docs.pop(doc_id)
+        for token in set(doc.tokens):
+            path = []
+            node = self.root
+            for char in token:
+                child = node.children.get(char)
+                if child is None:
+                    break
+                child.ids.discard(doc_id)
+                path.append((node, char, child))
+                node = child
+            # Poda os nós que ficaram vazios (de baixo para cima)
+            for parent, char, child in reversed(path):
+                if child.ids or child.children:
+                    break
+                del parent.children[char]
+            docs = self.words.get(token)
+            if docs is not None:
+                docs.discard(doc_id)
+                if not docs:
+                    del self.words[token]
+                    del self.word_grams[token]
+                    for gram in trigrams(token):
+                        words = self.postings.get(gram)
+                        if words is not None:
+                            words.discard(token)
+                            if not words:
+                                del self.postings[gram]
+
+    # ----- consulta -----
+
+    def prefix_ids(self, token: str) -> Set[int]:
+        node = self.root
+        for char in token:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return node.ids
+
+    def similar_words(self, token: str, threshold: float) -> Dict[str, float]:
+        """Palavras do vocabulário parecidas com a palavra (Jaccard dos trigramas >= threshold)."""
+        query_grams = trigrams(token)
+        shared: Counter = Counter()
+        for gram in query_grams:
+            shared.update(self.postings.get(gram, ()))
+        similar = {}
+        for word, count in shared.items():
+            similarity = count / (len(query_grams) + self.word_grams[word] - count)
+            if similarity >= threshold:
+                similar[word] = similarity
+        return similar
+
+    def fuzzy(self, tokens: List[str], threshold: float) -> Dict[int, float]:
+        """
+        doc_id -> similaridade média das palavras da busca. Toda palavra da busca precisa casar com
+        alguma palavra do nome: por prefixo (1.0) ou por trigramas (similaridade da palavra).
+        """
+        per_token: List[Dict[int, float]] = []
+        for token in tokens:
+            scores: Dict[int, float] = {}
+            for word, similarity in self.similar_words(token, threshold).items():
+                for doc_id in self.words[word]:
+                    if scores.get(doc_id, 0.0) < similarity:
+                        scores[doc_id] = similarity
+            per_token.append(scores)
+        # Interseção começando pela palavra com menos candidatos
+        order = sorted(range(len(tokens)), key=lambda i: len(per_token[i]) + len(self.prefix_ids(tokens[i])))
+        results: Dict[int, float] = {}
+        first = order[0]
+        for doc_id in set(per_token[first]) | self.prefix_ids(tokens[first]):
+            total = 0.0
+            for i in order:
+                if doc_id in self.prefix_ids(tokens[i]):
+                    total += 1.0
+                elif doc_id in per_token[i]:
+                    total += per_token[i][doc_id]
+                else:
+                    break
+            else:
+                results[doc_id] = total / len(tokens)
+        return results
+
+
+_index = SearchIndex()
+_lock = threading.Lock()
+_stats: Dict[str, float] = {
+    "searches": 0,
+    "search_seconds": 0.0,
+    "builds": 0,
+    "incremental_updates": 0,
+    "docs_added": 0,
+    "docs_removed": 0,
+}
+
+
+def _docs_from(catalog: game_catalog.Catalog) -> Dict[Tuple[str, str], Doc]:
+    docs = {}
+    for provider, games in catalog.games.items():
+        for position, game in enumerate(games):
+            code = game.get("game_code")
+            folded = fold(game.get("game_name") or game.get("name") or game.get("title"))
+            if not code or not folded:
+                continue
+            tokens = tuple(folded.split())
+            if game.get("original_name"):
+                # Renomeado pelo admin: também encontrável pelo nome do upstream
+                tokens += tuple(t for t in fold(game["original_name"]).split() if t not in tokens)
+            docs[(provider, code)] = Doc(
+                key=(provider, code),
+                game=game,
+                provider=provider,
+                folded=folded,
+                tokens=tokens,
+                active=game.get("status") == 1,
+                position=position,
+            )
+    return docs
+
+
+def update(catalog: game_catalog.Catalog) -> None:
+    """Sincroniza o índice com um novo snapshot do catálogo (chamado a cada recarga)."""
+    global _index
+    docs = _docs_from(catalog)
+    if not _index.docs:
+        # Primeira carga: monta fora do lock e troca o índice inteiro
+        index = SearchIndex()
+        for doc in docs.values():
+            index.add(doc)
+        with _lock:
+            _index = index
+        _stats["builds"] += 1
+        _stats["docs_added"] += len(docs)
+        return
+
+    current = {doc.key: doc for doc in list(_index.docs.values())}
+    removed = [key for key in current if key not in docs]
+    changed = [
+        doc for key, doc in docs.items()
+        if key not in current or current[key][2:] != doc[2:] or current[key].game != doc.game
+    ]
+    # Um jogo por vez no lock: buscas concorrentes esperam no máximo uma atualização de documento
+    for key in removed:
+        with _lock:
+            _index.remove(key)
+    for doc in changed:
+        with _lock:
+            _index.remove(doc.key)
+            _index.add(doc)
+    _stats["incremental_updates"] += 1
+    _stats["docs_removed"] += len(removed)
+    _stats["docs_added"] += len(changed)
+
+
+def search(
+    query: str,
+    limit: int = 20,
+    providers: Optional[Iterable[str]] = None,
+    active_only: bool = True,
+    fuzzy_threshold: float = FUZZY_THRESHOLD,
+    exclude: Iterable[str] = (),
+) -> List[Tuple[int, float, Dict[str, Any]]]:
+    """
+    Melhores jogos para a busca: [(nível, similaridade, jogo)], do mais relevante ao menos.
+
+    providers (códigos em ordem de preferência) restringe a busca e desempata por ordem; sem ele
+    o desempate é pelo nome mais curto e posição no provedor. exclude: game_codes a ignorar.
+    """
+    started = time.perf_counter()
+    folded = fold(query)
+    tokens = folded.split()
+    if not tokens or limit <= 0:
+        return []
+    provider_rank = None
+    if providers is not None:
+        provider_rank = {}
+        for code in providers:
+            provider_rank.setdefault(game_catalog.normalize_code(code), len(provider_rank))
+    excluded = set(exclude)
+
+    with _lock:
+        index = _index
+        docs = index.docs
+
+        # Prefixo: interseção começando pelo conjunto menor
+        candidate_sets = sorted((index.prefix_ids(t) for t in tokens), key=len)
+        matched = candidate_sets[0].intersection(*candidate_sets[1:]) if candidate_sets[0] else set()
+
+        ranked = []
+        for doc_id in matched:
+            doc = docs[doc_id]
+            if (active_only and not doc.active) or (provider_rank is not None and doc.provider not in provider_rank) \
+                    or (excluded and doc.key[1] in excluded):
+                continue
+            name = doc.folded
+            tier = TIER_EXACT if name == folded else TIER_STARTS if name.startswith(folded) else TIER_PREFIX
+            rank = provider_rank[doc.provider] if provider_rank is not None else 0
+            ranked.append((tier, -1.0, rank, len(name), doc.position, doc_id))
+
+        if len(ranked) < limit and len(folded) >= 3:
+            for doc_id, similarity in index.fuzzy(tokens, fuzzy_threshold).items():
+                if doc_id in matched:
+                    continue
+                doc = docs[doc_id]
+                if (active_only and not doc.active) or (provider_rank is not None and doc.provider not in provider_rank) \
+                        or (excluded and doc.key[1] in excluded):
+                    continue
+                rank = provider_rank[doc.provider] if provider_rank is not None else 0
+                ranked.append((TIER_FUZZY, -similarity, rank, len(doc.folded), doc.position, doc_id))
+
+        best = [(item[0], -item[1], docs[item[5]].game) for item in heapq.nsmallest(limit, ranked)]
+
+    _stats["searches"] += 1
+    _stats["search_seconds"] += time.perf_counter() - started
+    return best
+
+
+def best_match(name: str, providers: Iterable[str], exclude: Iterable[str] = ()) -> Optional[Dict[str, Any]]:
+    """Jogo ativo que melhor corresponde a um nome (destaques/populares), ou None."""
+    found = search(name, limit=1, providers=providers, exclude=exclude, fuzzy_threshold=BEST_MATCH_FUZZY_THRESHOLD)
+    return found[0][2] if found else None
+
+
+def stats() -> Dict[str, Any]:
+    searches = _stats["searches"]
+    return {
+        **_stats,
+        "docs": len(_index.docs),
+        "words": len(_index.words),
+        "trigrams": len(_index.postings),
+        "avg_search_ms": round(_stats["search_seconds"] * 1000 / searches, 4) if searches else None,
+    }
+
+
+def _metric_lines() -> List[str]:
+    snapshot = stats()
+    return (
+        metrics.gauge("game_search_docs", "Jogos no índice de busca", [({}, snapshot["docs"])])
+        + metrics.counter_samples("game_search_queries_total", "Buscas atendidas pelo índice", [({}, snapshot["searches"])])
+        + metrics.counter_samples("game_search_seconds_total", "Tempo total gasto nas buscas", [({}, snapshot["search_seconds"])])
+    )
+
+
+game_catalog.on_reload(update)
+metrics.register_collector(_metric_lines)
@@ -1,8 +1,178 @@
+import asyncio
+import copy
 import httpx
 import json
-from typing import Optional, Dict, Any, List
+import os
+import random
+import time
+from typing import Optional, Dict, Any, List, Tuple
 from models import IGameWinAgent
 from sqlalchemy.orm import Session
+import circuit_breaker
+import metrics
+
+
+# ========== CLIENTE HTTP COMPARTILHADO ==========
+# Um único httpx.AsyncClient por processo (aberto no startup, fechado no shutdown): as chamadas à
+# IGameWin reaproveitam conexões keep-alive em vez de pagar DNS + TCP + TLS a cada requisição.
+MAX_CONNECTIONS = int(os.getenv("IGAMEWIN_MAX_CONNECTIONS", "50"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("IGAMEWIN_MAX_KEEPALIVE_CONNECTIONS", "20"))
+KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("IGAMEWIN_KEEPALIVE_EXPIRY_SECONDS", "60"))
+CONNECT_TIMEOUT_SECONDS = float(os.getenv("IGAMEWIN_CONNECT_TIMEOUT_SECONDS", "5"))
+# HTTP/2 é opcional: exige o pacote h2 (pip install httpx[http2])
+HTTP2 = os.getenv("IGAMEWIN_HTTP2", "false").lower() in ("1", "true", "yes")
+
+# Timeout total por método da API (segundos); IGAMEWIN_TIMEOUT_<MÉTODO> sobrescreve
+_DEFAULT_TIMEOUT_SECONDS = 30.0
+_METHOD_TIMEOUTS = {
+    "game_launch": 10.0,
+    "user_create": 10.0,
+    "money_info": 10.0,
+    "provider_list": 15.0,
+    "game_list": 20.0,
+    "control_rtp": 15.0,
+    "user_deposit": 15.0,
+    "user_withdraw": 15.0,
+}
+
+# Circuit breaker por método: com a IGameWin degradada as chamadas falham na hora em vez de
+# empilhar requisições esperando timeout
+BREAKER_WINDOW_SECONDS = int(os.getenv("IGAMEWIN_BREAKER_WINDOW_SECONDS", "30"))
+BREAKER_MIN_REQUESTS = int(os.getenv("IGAMEWIN_BREAKER_MIN_REQUESTS", "10"))
+BREAKER_FAILURE_RATE = float(os.getenv("IGAMEWIN_BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("IGAMEWIN_BREAKER_OPEN_SECONDS", "15"))
+CIRCUIT_OPEN_ERROR = "CIRCUIT_OPEN"
+
+# game_launch: poucas tentativas curtas (só erros transitórios) dentro de um prazo total; com
+# IGAMEWIN_LAUNCH_HEDGE_AFTER_SECONDS > 0, uma segunda chamada paralela se a primeira demorar
+LAUNCH_ATTEMPTS = int(os.getenv("IGAMEWIN_LAUNCH_ATTEMPTS", "2"))
+LAUNCH_RETRY_BASE_SECONDS = float(os.getenv("IGAMEWIN_LAUNCH_RETRY_BASE_SECONDS", "0.3"))
+LAUNCH_DEADLINE_SECONDS = float(os.getenv("IGAMEWIN_LAUNCH_DEADLINE_SECONDS", "15"))
+LAUNCH_HEDGE_AFTER_SECONDS = float(os.getenv("IGAMEWIN_LAUNCH_HEDGE_AFTER_SECONDS", "0"))
+
+_client: Optional[httpx.AsyncClient] = None
+_http_stats: Dict[str, Any] = {
+    "requests": {},  # método -> quantidade
+    "errors": {},  # método -> quantidade
+    "connections_opened": 0,
+    "tls_handshakes": 0,
+}
+_launch_stats: Dict[str, int] = {
+    "retries": 0,  # nova tentativa após erro transitório
+    "hedges": 0,  # segunda chamada paralela disparada
+    "hedge_wins": 0,  # a segunda chamada respondeu primeiro
+    "deadline_exceeded": 0,
+}
+_request_duration = metrics.Histogram(
+    "igamewin_http_duration_seconds",
+    "Latência das chamadas HTTP à IGameWin por método",
+    ("method",),
+)
+
+
+def method_timeout(method: Optional[str]) -> float:
+    env = os.getenv(f"IGAMEWIN_TIMEOUT_{(method or '').upper()}")
+    if env:
+        return float(env)
+    return _METHOD_TIMEOUTS.get(method or "", _DEFAULT_TIMEOUT_SECONDS)
+
+
+def breaker_for(method: Optional[str]) -> circuit_breaker.CircuitBreaker:
+    return circuit_breaker.create(
+        f"igamewin:{method or 'unknown'}",
+        window_seconds=BREAKER_WINDOW_SECONDS,
+        min_requests=BREAKER_MIN_REQUESTS,
+        failure_rate=BREAKER_FAILURE_RATE,
+        open_seconds=BREAKER_OPEN_SECONDS,
+    )
+
+
+def _http2_enabled() -> bool:
+    if not HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        print("[IGameWin] IGAMEWIN_HTTP2=true mas o pacote h2 não está instalado - usando HTTP/1.1")
+        return False
+    return True
+
+
+async def _trace(event: str, info: Dict[str, Any]) -> None:
+    """Eventos do httpcore: conta conexões novas (o restante das requisições reaproveitou uma)."""
+    if event == "connection.connect_tcp.complete":
+        _http_stats["connections_opened"] += 1
+    elif event == "connection.start_tls.complete":
+        _http_stats["tls_handshakes"] += 1
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Cliente compartilhado (criado sob demanda se usado fora da aplicação, ex.: scripts)."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=_http2_enabled(),
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            timeout=httpx.Timeout(_DEFAULT_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+        )
+    return _client
+
+
+async def start_http_client() -> None:
+    global _client
+    if _client is None or _client.is_closed:
+        get_http_client()
+        print(f"[IGameWin] Cliente HTTP compartilhado iniciado (max_connections={MAX_CONNECTIONS}, "
+              f"keepalive={MAX_KEEPALIVE_CONNECTIONS}, http2={_http2_enabled()})")
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def http_stats() -> Dict[str, Any]:
+    """Requisições, erros e reaproveitamento de conexões do cliente compartilhado."""
+    requests = sum(_http_stats["requests"].values())
+    opened = _http_stats["connections_opened"]
+    return {
+        "requests": dict(_http_stats["requests"]),
+        "errors": dict(_http_stats["errors"]),
+        "connections_opened": opened,
+        "tls_handshakes": _http_stats["tls_handshakes"],
+        "reused_requests": max(requests - opened, 0),
+        "reuse_ratio": round(max(requests - opened, 0) / requests, 4) if requests else None,
+        "http2": bool(_client is not None and HTTP2 and _http2_enabled()),
+        "max_connections": MAX_CONNECTIONS,
+        "max_keepalive_connections": MAX_KEEPALIVE_CONNECTIONS,
+        "launch": dict(_launch_stats),
+    }
+
+
+def _metric_lines() -> List[str]:
+    stats = http_stats()
+    return (
+        metrics.counter_samples("igamewin_http_requests_total", "Chamadas HTTP à IGameWin por método",
+                                [({"method": m}, n) for m, n in sorted(stats["requests"].items())])
+        + metrics.counter_samples("igamewin_http_errors_total", "Chamadas à IGameWin com erro de transporte/HTTP por método",
+                                  [({"method": m}, n) for m, n in sorted(stats["errors"].items())])
+        + metrics.counter_samples("igamewin_http_connections_opened_total", "Conexões TCP novas abertas para a IGameWin",
+                                  [({}, stats["connections_opened"])])
+        + metrics.counter_samples("igamewin_http_tls_handshakes_total", "Handshakes TLS com a IGameWin",
+                                  [({}, stats["tls_handshakes"])])
+        + metrics.counter_samples("igamewin_launch_events_total", "Retentativas, hedges e prazos estourados no game_launch",
+                                  [({"event": e}, n) for e, n in _launch_stats.items()])
+        + _request_duration.render()
+    )
+
+
+metrics.register_collector(_metric_lines)
 
 
 class IGameWinAPI:
@@ -25,6 +195,8 @@ class IGameWinAPI:
             self.base_url = f"{self.api_url}/api/v1"
         self.credentials = credentials or {}
         self.last_error: Optional[str] = None
+        # Erro transitório (rede, timeout, 5xx/429): vale tentar de novo
+        self.last_error_retryable = False
     
     def _get_headers(self) -> Dict[str, str]:
         return {
@@ -166,40 +338,61 @@ class IGameWinAPI:
     
     async def _post(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         self.last_error = None
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    self.base_url,
-                    headers=self._get_headers(),
-                    json=payload,
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                data = response.json()
-                
-                # API retorna status 1 para sucesso, 0 para erro
-                # Para métodos que não retornam status (como alguns endpoints), aceitar a resposta
-                # Mas para métodos que devem retornar status, validar explicitamente
-                if isinstance(data, dict):
-                    status = data.get("status")
-                    # Se status existe e não é 1, é um erro
-                    if status is not None and status != 1:
-                        error_msg = data.get("msg", "Erro desconhecido")
-                        self.last_error = f"status={status} msg={error_msg}"
-                        return None
-                    # Se status é 1 ou None (alguns endpoints podem não retornar status), aceitar
-                    return data
-                
+        self.last_error_retryable = False
+        method = payload.get("method") or ""
+        breaker = breaker_for(method)
+        if not breaker.allow():
+            self.last_error = (f"{CIRCUIT_OPEN_ERROR}: IGameWin indisponível para {method} "
+                               f"(nova tentativa em {breaker.retry_after():.0f}s)")
+            return None
+        timeout = method_timeout(method)
+        _http_stats["requests"][method] = _http_stats["requests"].get(method, 0) + 1
+        started = time.perf_counter()
+        # None = cancelada ou exceção inesperada: não conta para o breaker
+        healthy: Optional[bool] = None
+        try:
+            response = await get_http_client().post(
+                self.base_url,
+                headers=self._get_headers(),
+                json=payload,
+                timeout=httpx.Timeout(timeout, connect=min(CONNECT_TIMEOUT_SECONDS, timeout)),
+                extensions={"trace": _trace},
+            )
+            response.raise_for_status()
+            data = response.json()
+            # Erros de negócio (status 0) não indicam IGameWin degradada
+            healthy = True
+            
+            # API retorna status 1 para sucesso, 0 para erro
+            # Para métodos que não retornam status (como alguns endpoints), aceitar a resposta
+            # Mas para métodos que devem retornar status, validar explicitamente
+            if isinstance(data, dict):
+                status = data.get("status")
+                # Se status existe e não é 1, é um erro
+                if status is not None and status != 1:
+                    error_msg = data.get("msg", "Erro desconhecido")
+                    self.last_error = f"status={status} msg={error_msg}"
+                    return None
+                # Se status é 1 ou None (alguns endpoints podem não retornar status), aceitar
                 return data
-            except httpx.HTTPError as e:
-                body_preview = ""
-                try:
-                    body_preview = e.response.text[:500] if hasattr(e, "response") and e.response else ""
-                except Exception:
-                    pass
-                self.last_error = f"{e} {body_preview}"
-                print(f"Error calling igamewin: {self.last_error}")
-                return None
+            
+            return data
+        except httpx.HTTPError as e:
+            _http_stats["errors"][method] = _http_stats["errors"].get(method, 0) + 1
+            status_code = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+            healthy = status_code is not None and status_code < 500 and status_code != 429
+            self.last_error_retryable = not healthy
+            body_preview = ""
+            try:
+                body_preview = e.response.text[:500] if hasattr(e, "response") and e.response else ""
+            except Exception:
+                pass
+            self.last_error = f"{e} {body_preview}"
+            print(f"Error calling igamewin: {self.last_error}")
+            return None
+        finally:
+            breaker.record(healthy)
+            _request_duration.observe(time.perf_counter() - started, method)
 
     async def get_providers(self) -> Optional[List[Dict[str, Any]]]:
         payload = {
@@ -231,6 +424,41 @@ class IGameWinAPI:
             return None
         return data.get("games")
 
+    async def get_games_for_providers(
+        self,
+        provider_codes: List[str],
+        concurrency: int = 8,
+        timeout: float = 20.0
+    ) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, str]]:
+        """
+        game_list de vários provedores em paralelo, no máximo `concurrency` ao mesmo tempo e com
+        `timeout` por provedor. Um provedor lento ou com erro não atrasa os outros: o resultado é
+        parcial. Retorna (jogos por provedor, erro por provedor que falhou).
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def fetch(code: str):
+            async with semaphore:
+                # Cópia rasa por chamada: last_error não é compartilhado entre as requisições paralelas
+                client = copy.copy(self)
+                try:
+                    games = await asyncio.wait_for(client.get_games(provider_code=code), timeout)
+                except asyncio.TimeoutError:
+                    return code, None, f"timeout após {timeout:.0f}s"
+                except Exception as e:
+                    # Ex.: resposta 200 sem JSON válido; só este provedor falha
+                    return code, None, f"{type(e).__name__}: {e}"
+                return code, games, client.last_error
+
+        games_by_provider: Dict[str, List[Dict[str, Any]]] = {}
+        errors: Dict[str, str] = {}
+        for code, games, error in await asyncio.gather(*(fetch(c) for c in provider_codes)):
+            if games is None:
+                errors[code] = error or "erro desconhecido"
+            else:
+                games_by_provider[code] = games
+        return games_by_provider, errors
+
     async def launch_game(self, user_code: str, game_code: str, provider_code: Optional[str] = None, lang: str = "pt") -> Optional[str]:
         """Generate game launch URL for user - follows IGameWin API documentation"""
         payload: Dict[str, Any] = {
@@ -278,6 +506,74 @@ class IGameWinAPI:
         print(f"[IGameWin] Success! Launch URL: {launch_url[:100]}...")
         return launch_url
     
+    async def launch_game_with_retries(
+        self, user_code: str, game_code: str, provider_code: Optional[str] = None, lang: str = "pt"
+    ) -> Optional[str]:
+        """
+        launch_game com até LAUNCH_ATTEMPTS tentativas dentro de LAUNCH_DEADLINE_SECONDS. Só erros
+        transitórios (rede, timeout, 5xx) são repetidos, após uma espera aleatória curta (jitter
+        exponencial); erros de negócio e circuito aberto voltam na hora.
+        """
+        deadline = time.monotonic() + LAUNCH_DEADLINE_SECONDS
+        for attempt in range(1, LAUNCH_ATTEMPTS + 1):
+            remaining = deadline - time.monotonic()
+            try:
+                launch_url = await asyncio.wait_for(
+                    self._launch_hedged(user_code, game_code, provider_code, lang), max(remaining, 0.001)
+                )
+            except asyncio.TimeoutError:
+                _launch_stats["deadline_exceeded"] += 1
+                self.last_error = f"timeout: game_launch sem resposta em {LAUNCH_DEADLINE_SECONDS:.0f}s"
+                self.last_error_retryable = False
+                return None
+            if launch_url:
+                return launch_url
+            if not self.last_error_retryable or attempt == LAUNCH_ATTEMPTS:
+                return None
+            delay = min(random.uniform(0, LAUNCH_RETRY_BASE_SECONDS * 2 ** (attempt - 1)),
+                        max(deadline - time.monotonic(), 0))
+            _launch_stats["retries"] += 1
+            print(f"[IGameWin] game_launch falhou ({self.last_error}); nova tentativa em {delay:.2f}s")
+            await asyncio.sleep(delay)
+        return None
+
+    async def _launch_hedged(
+        self, user_code: str, game_code: str, provider_code: Optional[str], lang: str
+    ) -> Optional[str]:
+        """
+        Uma tentativa de launch. Com LAUNCH_HEDGE_AFTER_SECONDS > 0 e o circuito fechado, se a
+        chamada não respondeu nesse tempo uma segunda é disparada e vale a primeira com sucesso.
+        """
+        kwargs = {"user_code": user_code, "game_code": game_code, "provider_code": provider_code, "lang": lang}
+        if LAUNCH_HEDGE_AFTER_SECONDS <= 0:
+            return await self.launch_game(**kwargs)
+        # Cópias rasas: cada chamada tem seu próprio last_error
+        primary = copy.copy(self)
+        calls = {asyncio.ensure_future(primary.launch_game(**kwargs)): primary}
+        try:
+            await asyncio.wait(list(calls), timeout=LAUNCH_HEDGE_AFTER_SECONDS)
+            if not any(task.done() for task in calls) and breaker_for("game_launch").state == circuit_breaker.CLOSED:
+                _launch_stats["hedges"] += 1
+                hedge = copy.copy(self)
+                calls[asyncio.ensure_future(hedge.launch_game(**kwargs))] = hedge
+            pending = set(calls)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    client = calls[task]
+                    launch_url = task.result()
+                    if launch_url:
+                        if client is not primary:
+                            _launch_stats["hedge_wins"] += 1
+                        return launch_url
+                    self.last_error = client.last_error
+                    self.last_error_retryable = client.last_error_retryable
+            return None
+        finally:
+            for task in calls:
+                if not task.done():
+                    task.cancel()
+
     async def control_rtp(
         self,
         rtp: float,
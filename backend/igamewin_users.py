@@ -0,0 +1,172 @@
+"""
+Registro dos usuários no agente IGameWin (user_create).
+
+O IGameWin exige que o user_code exista no agente antes do game_launch. Em vez de chamar
+user_create a cada lançamento (uma ida e volta extra, respondida com DUPLICATED_USER a partir da
+segunda vez), o registro fica marcado em igamewin_user_registrations por (agent_code, user_code)
+e o launch só chama a API quando a marca não existe. O cadastro (/api/auth/register) já dispara o
+registro em segundo plano, então normalmente o primeiro lançamento faz uma única chamada.
+
+Chamadas simultâneas para o mesmo usuário (registro em segundo plano + primeiro launch)
+compartilham a mesma requisição ao IGameWin. As consultas e gravações da marca rodam numa thread
+(sessão própria), fora do event loop.
+
+A marca pode ficar desatualizada (agente resetado, usuário apagado no IGameWin): se o launch
+falhar com usuário inexistente, o chamador usa reregister(), que apaga a marca e registra de novo.
+"""
+import asyncio
+from typing import Dict, Set, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+import metrics
+from models import IGameWinUserRegistration, User
+
+# Marcas já confirmadas neste processo (evita a consulta ao banco nos lançamentos seguintes)
+MAX_KNOWN_REGISTRATIONS = 100_000
+# Erros do IGameWin que indicam que o user_code não existe no agente
+USER_NOT_FOUND_ERRORS = ("INVALID_USER", "USER_NOT_FOUND", "NOT_FOUND_USER")
+
+_known: Set[Tuple[str, str]] = set()
+_inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+_stats: Dict[str, int] = {
+    "skipped": 0,  # launch sem user_create (marca encontrada)
+    "registered": 0,  # user_create com sucesso
+    "duplicated": 0,  # DUPLICATED_USER (já existia no IGameWin): marca gravada
+    "failed": 0,
+    "reregistered": 0,  # marca apagada após launch com usuário inexistente
+}
+
+
+def _remember(key: Tuple[str, str]) -> None:
+    if len(_known) >= MAX_KNOWN_REGISTRATIONS:
+        _known.clear()
+    _known.add(key)
+
+
+def _is_registered_sync(agent_code: str, user_code: str) -> bool:
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return db.query(IGameWinUserRegistration.id).filter(
+            IGameWinUserRegistration.agent_code == agent_code,
+            IGameWinUserRegistration.user_code == user_code,
+        ).first() is not None
+    finally:
+        db.close()
+
+
+async def is_registered(agent_code: str, user_code: str) -> bool:
+    key = (agent_code, user_code)
+    if key in _known:
+        return True
+    exists = await asyncio.to_thread(_is_registered_sync, agent_code, user_code)
+    if exists:
+        _remember(key)
+    return exists
+
+
+def _mark_registered(agent_code: str, user_code: str, user_id: int) -> None:
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        db.add(IGameWinUserRegistration(agent_code=agent_code, user_code=user_code, user_id=user_id))
+        db.commit()
+    except IntegrityError:
+        # Outro worker gravou a mesma marca
+        db.rollback()
+    finally:
+        db.close()
+    _remember((agent_code, user_code))
+
+
+def _forget_sync(agent_code: str, user_code: str) -> None:
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        db.query(IGameWinUserRegistration).filter(
+            IGameWinUserRegistration.agent_code == agent_code,
+            IGameWinUserRegistration.user_code == user_code,
+        ).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def is_user_not_found(error) -> bool:
+    """True se o erro do IGameWin indica que o user_code não existe no agente."""
+    return bool(error) and any(code in error for code in USER_NOT_FOUND_ERRORS)
+
+
+async def _register(api, user_code: str, user_id: int) -> bool:
+    created = await api.create_user(user_code, is_demo=False)
+    if created:
+        _stats["registered"] += 1
+    elif api.last_error and "DUPLICATED_USER" in api.last_error:
+        _stats["duplicated"] += 1
+    else:
+        _stats["failed"] += 1
+        print(f"[IGameWin Users] Não foi possível registrar {user_code}: {api.last_error}")
+        return False
+    await asyncio.to_thread(_mark_registered, api.agent_code, user_code, user_id)
+    return True
+
+
+async def ensure_registered(api, user: User) -> bool:
+    """Garante que o usuário existe no agente da API. True se registrado (agora ou antes)."""
+    key = (api.agent_code, user.username)
+    if await is_registered(*key):
+        _stats["skipped"] += 1
+        return True
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_register(api, user.username, user.id))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def reregister(api, user: User) -> bool:
+    """Apaga a marca (memória e banco) e chama user_create de novo. True se registrado."""
+    key = (api.agent_code, user.username)
+    _known.discard(key)
+    await asyncio.to_thread(_forget_sync, *key)
+    _stats["reregistered"] += 1
+    print(f"[IGameWin Users] {user.username} não existe no agente {api.agent_code}; registrando novamente")
+    return await ensure_registered(api, user)
+
+
+async def register_in_background(user_id: int) -> None:
+    """Registra um usuário recém-cadastrado no agente IGameWin ativo (BackgroundTasks do cadastro)."""
+    from database import SessionLocal
+    from igamewin_api import get_igamewin_api
+
+    db = SessionLocal()
+    try:
+        api = get_igamewin_api(db)
+        user = db.query(User).filter(User.id == user_id).first()
+        if not api or not user:
+            return
+        await ensure_registered(api, user)
+    except Exception as e:
+        print(f"[IGameWin Users] Erro ao registrar usuário {user_id} em segundo plano: {e}")
+    finally:
+        db.close()
+
+
+def stats() -> Dict[str, int]:
+    return {**_stats, "known": len(_known), "in_flight": len(_inflight)}
+
+
+def _metric_lines():
+    return metrics.counter_samples(
+        "igamewin_user_registration_total",
+        "Verificações de registro do usuário no IGameWin antes do launch por resultado",
+        [({"outcome": outcome}, count) for outcome, count in _stats.items()],
+    )
+
+
+metrics.register_collector(_metric_lines)
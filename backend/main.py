@@ -7,6 +7,18 @@ from slowapi.errors import RateLimitExceeded
 from database import init_db, get_db
 from auth import create_admin_user
 from sqlalchemy.orm import Session
+import admission
+import agent_cache
+import bet_writer
+import game_catalog
+import game_popularity
+import igamewin_api
+import metrics
+import thumbnail_pack
+import wallet_journal
+import wallet_ledger
+import asyncio
+import hmac
 import os
 import time
 import logging
@@ -92,7 +104,7 @@ def _cors_headers(origin=None) -> dict:
 async def http_exception_handler(request: Request, exc: HTTPException):
     """Garante que 4xx/5xx (incl. 502) tenham sempre CORS para luxbet.site -> api.luxbet.site."""
     origin = request.headers.get("Origin")
-    headers = dict(_cors_headers(origin))
+    headers = {**(exc.headers or {}), **_cors_headers(origin)}  # preserva Retry-After, WWW-Authenticate...
     detail = exc.detail
     if isinstance(detail, dict):
         content = detail
@@ -113,6 +125,27 @@ async def global_exception_handler(request: Request, exc: Exception):
     )
 
 
+# Controle de admissão por classe de carga (registrado antes: roda dentro do middleware abaixo,
+# então a resposta 503 também recebe CORS e entra nas métricas)
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """Limita a concorrência por classe (wallet, webhooks, player, catálogo, admin) com fila e 503."""
+    workload = admission.classify(request.method, request.url.path)
+    if workload is None:
+        return await call_next(request)
+    if not await workload.acquire():
+        logger.warning(f"Load shedding ({workload.name}): {request.method} {request.url.path}")
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Servidor ocupado. Tente novamente em instantes."},
+            headers={"Retry-After": "1"},
+        )
+    try:
+        return await call_next(request)
+    finally:
+        workload.release()
+
+
 # Middleware de logging e headers de compatibilidade
 @app.middleware("http")
 async def add_compatibility_headers(request: Request, call_next):
@@ -138,18 +171,25 @@ async def add_compatibility_headers(request: Request, call_next):
         response.headers["X-Content-Type-Options"] = "nosniff"
         response.headers["X-Frame-Options"] = "SAMEORIGIN"
         response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
+        # Rotas que definem o próprio Cache-Control (catálogo público com ETag) mantêm o seu
+        if "Cache-Control" not in response.headers:
+            response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+            response.headers["Pragma"] = "no-cache"
+            response.headers["Expires"] = "0"
         
         process_time = time.time() - start_time
         response.headers["X-Process-Time"] = str(process_time)
+        # Histograma por rota (template do path, não a URL) e status
+        route = request.scope.get("route")
+        metrics.observe_request(request.method, getattr(route, "path", None), response.status_code, process_time)
         
         logger.info(f"Response: {request.method} {request.url.path} - Status: {response.status_code} - Time: {process_time:.3f}s")
         
         return response
     except Exception as e:
         logger.error(f"Error processing request {request.method} {request.url.path}: {str(e)}", exc_info=True)
+        route = request.scope.get("route")
+        metrics.observe_request(request.method, getattr(route, "path", None), 502, time.time() - start_time)
         origin = request.headers.get("Origin")
         return JSONResponse(
             status_code=502,
@@ -182,6 +222,30 @@ async def startup_event():
         create_admin_user(db)
     finally:
         db.close()
+    # Poda periódica do journal de idempotência do /gold_api
+    asyncio.create_task(wallet_journal.prune_loop())
+    # Snapshots periódicos do ledger da carteira (saldo em qualquer instante sem varrer o histórico)
+    asyncio.create_task(wallet_ledger.snapshot_loop())
+    # Agentes IGameWin do /gold_api em memória (recargas seguintes em segundo plano)
+    await agent_cache.start()
+    # Write-behind das apostas do /gold_api (recupera pendências do journal antes de iniciar)
+    await bet_writer.start()
+    # Popularidade dos jogos (rodadas/jogadores por hora) a partir das apostas gravadas
+    await game_popularity.start()
+    # Cliente HTTP compartilhado (keep-alive) para as chamadas à IGameWin
+    await igamewin_api.start_http_client()
+    # Miniaturas dos jogos (pacote mmap): antes do catálogo, que troca os banners pelas URLs com hash
+    thumbnail_pack.load()
+    # Catálogo local de jogos: carrega do banco e sincroniza com a IGameWin em segundo plano
+    await game_catalog.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Grava as apostas ainda enfileiradas (e a popularidade) e fecha as conexões com a IGameWin antes de encerrar"""
+    await bet_writer.stop()
+    await game_popularity.stop()
+    await igamewin_api.close_http_client()
 
 
 @app.get("/")
@@ -189,6 +253,19 @@ async def root():
     return {"message": "Lux Bet API", "status": "ok", "version": "1.0.0"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    """Métricas no formato do Prometheus (latência por rota, /gold_api, pool do banco).
+    Endpoint interno: exige Authorization: Bearer <METRICS_TOKEN>; sem METRICS_TOKEN configurado
+    responde 404 (não expõe tráfego, pool e erros da carteira publicamente)."""
+    token = os.getenv("METRICS_TOKEN", "").strip()
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        raise HTTPException(status_code=401, detail="Não autorizado")
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.get("/api/health")
 async def health(request: Request):
     """Health check endpoint com informações de debug"""
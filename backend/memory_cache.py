@@ -0,0 +1,185 @@
+"""
+Caches em memória limitados (LRU + TTL) com contadores.
+
+Substitui dicionários de módulo que cresciam sem limite: cada cache tem número máximo de entradas
+e, opcionalmente, um teto de memória estimada; ao estourar, as entradas menos usadas recentemente
+são descartadas. Entradas expiradas (TTL padrão do cache ou por entrada) são tratadas como
+ausentes e removidas na leitura ou quando chegam ao fim da fila LRU.
+
+Todos os caches criados com create() aparecem em /metrics (cache_hits_total, cache_misses_total,
+cache_evictions_total, cache_entries, cache_memory_bytes) e em stats().
+
+Configuração por cache: CACHE_<NOME>_MAX_ENTRIES e CACHE_<NOME>_MAX_BYTES (0 = sem teto de memória).
+"""
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import metrics
+
+_MISSING = object()
+
+
+def approx_size(value: Any, _depth: int = 0) -> int:
+    """Tamanho aproximado em bytes (sys.getsizeof recursivo em dict/list/tuple/set, até 4 níveis)."""
+    size = sys.getsizeof(value)
+    if _depth >= 4:
+        return size
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += approx_size(k, _depth + 1) + approx_size(v, _depth + 1)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += approx_size(item, _depth + 1)
+    return size
+
+
+class LRUCache:
+    """Cache LRU com TTL, limite de entradas e teto opcional de memória estimada."""
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int,
+        ttl_seconds: Optional[float] = None,
+        max_bytes: int = 0,
+    ) -> None:
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # chave -> (valor, expira_em (monotonic) ou None, tamanho estimado)
+        self._entries: "OrderedDict[Hashable, Tuple[Any, Optional[float], int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {"size": 0, "memory": 0, "expired": 0}
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at, _ = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.evictions["expired"] += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        """Grava a entrada; ttl_seconds sobrescreve o TTL padrão do cache."""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        size = approx_size(key) + approx_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            self._evict()
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        while self._entries and (
+            len(self._entries) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            key, (_, expires_at, _) = next(iter(self._entries.items()))
+            if expires_at is not None and expires_at <= now:
+                reason = "expired"
+            elif len(self._entries) > self.max_entries:
+                reason = "size"
+            else:
+                reason = "memory"
+            self._remove(key)
+            self.evictions[reason] += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            self._remove(key)
+            return entry[0]
+
+    def keys(self) -> List[Hashable]:
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "memory_bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": dict(self.evictions),
+        }
+
+
+_caches: Dict[str, LRUCache] = {}
+
+
+def create(name: str, max_entries: int, ttl_seconds: Optional[float] = None, max_bytes: int = 0) -> LRUCache:
+    """Cria e registra um cache (limites sobrescrevíveis por CACHE_<NOME>_MAX_ENTRIES/_MAX_BYTES)."""
+    prefix = f"CACHE_{name.upper()}"
+    cache = LRUCache(
+        name,
+        max_entries=int(os.getenv(f"{prefix}_MAX_ENTRIES", str(max_entries))),
+        ttl_seconds=ttl_seconds,
+        max_bytes=int(os.getenv(f"{prefix}_MAX_BYTES", str(max_bytes))),
+    )
+    _caches[name] = cache
+    return cache
+
+
+def stats() -> Dict[str, Dict[str, Any]]:
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+def _metric_lines() -> List[str]:
+    snapshot = stats()
+
+    def samples(key: str):
+        return [({"cache": name}, values[key]) for name, values in snapshot.items()]
+
+    evictions = [
+        ({"cache": name, "reason": reason}, count)
+        for name, values in snapshot.items()
+        for reason, count in values["evictions"].items()
+    ]
+    return (
+        metrics.counter_samples("cache_hits_total", "Leituras encontradas no cache", samples("hits"))
+        + metrics.counter_samples("cache_misses_total", "Leituras ausentes/expiradas no cache", samples("misses"))
+        + metrics.counter_samples("cache_evictions_total", "Entradas descartadas por motivo (size, memory, expired)", evictions)
+        + metrics.gauge("cache_entries", "Entradas no cache", samples("entries"))
+        + metrics.gauge("cache_max_entries", "Limite de entradas do cache", samples("max_entries"))
+        + metrics.gauge("cache_memory_bytes", "Memória estimada das entradas do cache", samples("memory_bytes"))
+    )
+
+
+metrics.register_collector(_metric_lines)
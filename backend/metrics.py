@@ -0,0 +1,218 @@
+"""
+Métricas em memória do processo, expostas em formato texto do Prometheus (GET /metrics).
+
+- http_request_duration_seconds: histograma de latência por método HTTP, rota (template, ex.:
+  /api/admin/users/{user_id}) e status. Rotas desconhecidas são agrupadas em "unmatched" para
+  não criar uma série por URL.
+- gold_api_requests_total / gold_api_errors_total / gold_api_duration_seconds: chamadas do IGameWin
+  ao /gold_api por método (user_balance, transaction) e txn_type, e respostas de erro por código.
+- db_pool_*: estado dos pools do SQLAlchemy (síncrono e assíncrono) lido no momento da coleta.
+
+Outros módulos podem publicar métricas próprias com register_collector(fn): fn() devolve as
+linhas já formatadas e é chamada a cada coleta.
+"""
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Buckets em segundos: cobre desde o user_balance em cache (~1ms) até chamadas lentas ao IGameWin
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_lock = threading.Lock()
+_collectors: List[Callable[[], Iterable[str]]] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...]) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: Dict[Tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        with _lock:
+            self._values[tuple(label_values)] += amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with _lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_labels(self.label_names, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        # Por série: [contagem por bucket (não cumulativa)..., +Inf], soma, total
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect_left(self.buckets, value)
+        key = tuple(label_values)
+        with _lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {repr(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+def _collected(kind: str, name: str, help_text: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        names = tuple(labels)
+        lines.append(f"{name}{_labels(names, tuple(labels[n] for n in names))} {_number(value)}")
+    return lines
+
+
+def gauge(name: str, help_text: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> List[str]:
+    """Linhas de um gauge calculado na coleta. samples: [(labels, valor), ...]."""
+    return _collected("gauge", name, help_text, samples)
+
+
+def counter_samples(name: str, help_text: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> List[str]:
+    """Linhas de um contador mantido por outro módulo (valor lido na coleta)."""
+    return _collected("counter", name, help_text, samples)
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Latência das requisições HTTP por rota e status",
+    ("method", "route", "status"),
+)
+gold_api_requests = Counter(
+    "gold_api_requests_total",
+    "Chamadas do IGameWin ao /gold_api por método e txn_type",
+    ("method", "txn_type"),
+)
+gold_api_errors = Counter(
+    "gold_api_errors_total",
+    "Respostas de erro do /gold_api por método e código (msg)",
+    ("method", "code"),
+)
+gold_api_duration = Histogram(
+    "gold_api_duration_seconds",
+    "Latência do processamento do /gold_api por método",
+    ("method",),
+)
+
+
+def observe_request(method: str, route: Optional[str], status: int, seconds: float) -> None:
+    http_request_duration.observe(seconds, method, route or "unmatched", str(status))
+
+
+def observe_gold_api(method: Optional[str], txn_type: Optional[str], response: dict, seconds: float) -> None:
+    # Valores vindos do payload: limitados a um conjunto fixo para não criar séries arbitrárias
+    method = method if method in ("user_balance", "transaction") else "invalid"
+    if txn_type is not None and txn_type not in ("debit", "credit", "debit_credit"):
+        txn_type = "other"
+    gold_api_requests.inc(method, txn_type or "")
+    gold_api_duration.observe(seconds, method)
+    code = response.get("msg") if isinstance(response, dict) else None
+    if code:
+        gold_api_errors.inc(method, str(code))
+
+
+def register_collector(fn: Callable[[], Iterable[str]]) -> None:
+    """Registra uma função que devolve linhas de métricas adicionais a cada coleta."""
+    _collectors.append(fn)
+
+
+def _pool_waiters(pool) -> Optional[int]:
+    """Conexões aguardando o pool (sem API pública no SQLAlchemy; lido da fila interna)."""
+    queue = getattr(pool, "_pool", None)
+    if queue is None:
+        return None
+    not_empty = getattr(queue, "not_empty", None)  # QueuePool (threading.Condition)
+    if not_empty is not None:
+        return len(getattr(not_empty, "_waiters", ()))
+    async_queue = queue.__dict__.get("_queue")  # AsyncAdaptedQueuePool (asyncio.Queue, criada no 1º uso)
+    if async_queue is not None:
+        return len(getattr(async_queue, "_getters", ()))
+    return 0
+
+
+def _pool_lines() -> List[str]:
+    from database import async_engine, engine
+
+    size, checked_out, checked_in, overflow, waiters = [], [], [], [], []
+    for label, pool in (("sync", engine.pool), ("async", async_engine.sync_engine.pool)):
+        if not hasattr(pool, "checkedout"):
+            # NullPool/StaticPool (SQLite assíncrono): não há conexões compartilhadas a medir
+            continue
+        labels = {"pool": label}
+        size.append((labels, pool.size()))
+        checked_out.append((labels, pool.checkedout()))
+        checked_in.append((labels, pool.checkedin()))
+        overflow.append((labels, max(pool.overflow(), 0)))
+        pending = _pool_waiters(pool)
+        if pending is not None:
+            waiters.append((labels, pending))
+    return (
+        gauge("db_pool_size", "Tamanho base do pool de conexões", size)
+        + gauge("db_pool_checked_out", "Conexões em uso", checked_out)
+        + gauge("db_pool_checked_in", "Conexões ociosas no pool", checked_in)
+        + gauge("db_pool_overflow", "Conexões abertas além do tamanho base (max_overflow)", overflow)
+        + gauge("db_pool_waiters", "Requisições aguardando uma conexão do pool", waiters)
+    )
+
+
+def render() -> str:
+    """Todas as métricas no formato texto do Prometheus."""
+    lines: List[str] = []
+    lines += http_request_duration.render()
+    lines += gold_api_requests.render()
+    lines += gold_api_errors.render()
+    lines += gold_api_duration.render()
+    try:
+        lines += _pool_lines()
+    except Exception as e:
+        print(f"[Metrics] Erro ao ler o pool de conexões: {e}")
+    for collector in list(_collectors):
+        try:
+            lines += list(collector())
+        except Exception as e:
+            print(f"[Metrics] Erro no coletor {getattr(collector, '__name__', collector)}: {e}")
+    return "\n".join(lines) + "\n"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, Enum
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, Enum, UniqueConstraint, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -80,6 +80,20 @@ class IGameWinAgent(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class IGameWinUserRegistration(Base):
+    """Marca que o user_code já foi criado (user_create) no agente IGameWin."""
+    __tablename__ = "igamewin_user_registrations"
+    __table_args__ = (
+        UniqueConstraint("agent_code", "user_code", name="uq_igamewin_user_registration"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    agent_code = Column(String(100), nullable=False)
+    user_code = Column(String(100), nullable=False)  # username enviado ao IGameWin
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
 class Deposit(Base):
     __tablename__ = "deposits"
     
@@ -197,6 +211,57 @@ class Bet(Base):
     user = relationship("User", back_populates="bets")
 
 
+class GoldApiTransaction(Base):
+    """Journal de idempotência do /gold_api: uma linha por (agente, txn_id, txn_type) já processado."""
+    __tablename__ = "gold_api_transactions"
+    __table_args__ = (
+        UniqueConstraint("agent_code", "txn_id", "txn_type", name="uq_gold_api_txn"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    agent_code = Column(String(100), nullable=False)
+    txn_id = Column(String(255), nullable=False)
+    txn_type = Column(String(32), nullable=False)  # debit, credit, debit_credit
+    user_code = Column(String(100), nullable=False)
+    response_json = Column(Text, nullable=False)  # Resposta devolvida ao IGameWin (replay em retries)
+    # Registro de aposta pendente do write-behind (bet_writer.py); recuperado no startup se não persistido
+    bet_json = Column(Text)
+    bet_persisted = Column(Boolean, default=False, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class WalletEntry(Base):
+    """Ledger append-only: uma linha por alteração de balance/bonus_balance de um usuário."""
+    __tablename__ = "wallet_entries"
+    __table_args__ = (
+        Index("ix_wallet_entries_user_id_id", "user_id", "id"),  # Extrato (keyset por id)
+        Index("ix_wallet_entries_user_id_created_at", "user_id", "created_at"),  # Saldo em um instante
+    )
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind = Column(String(50), nullable=False)  # bet, win, deposit, withdrawal, promotion_bonus, ...
+    balance_delta = Column(Float, default=0.0, nullable=False)  # Variação de users.balance
+    bonus_delta = Column(Float, default=0.0, nullable=False)  # Variação de users.bonus_balance
+    reference = Column(String(255))  # txn_id do provider, id do depósito/saque, etc.
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class WalletSnapshot(Base):
+    """Saldo de um usuário após aplicar todas as suas wallet_entries com id <= entry_id."""
+    __tablename__ = "wallet_snapshots"
+    __table_args__ = (
+        UniqueConstraint("user_id", "entry_id", name="uq_wallet_snapshot_user_entry"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    entry_id = Column(Integer, nullable=False)  # 0 = saldo de abertura (antes de qualquer entrada)
+    balance = Column(Float, nullable=False)
+    bonus_balance = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
 class NotificationType(str, enum.Enum):
     INFO = "info"
     SUCCESS = "success"
@@ -400,3 +465,89 @@ class GameCustomization(Base):
     # O game_code original não é alterado, apenas o nome e provider podem ser customizados
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Provider(Base):
+    """Catálogo local de provedores, sincronizado do IGameWin em segundo plano (game_catalog.py)."""
+    __tablename__ = "providers"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    code = Column(String(100), unique=True, nullable=False, index=True)  # provider_code do IGameWin
+    name = Column(String(255))
+    is_active = Column(Boolean, default=True, nullable=False)  # status do upstream
+    position = Column(Integer, default=0, nullable=False)  # Ordem na provider_list do IGameWin
+    raw_json = Column(Text)  # Objeto original da provider_list
+    removed_at = Column(DateTime)  # Sumiu da provider_list (não é apagado: mantém o histórico)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Game(Base):
+    """Catálogo local de jogos por provedor, sincronizado do IGameWin em segundo plano."""
+    __tablename__ = "games"
+    __table_args__ = (
+        UniqueConstraint("provider_code", "game_code", name="uq_games_provider_game"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    provider_code = Column(String(100), nullable=False, index=True)
+    game_code = Column(String(255), nullable=False, index=True)
+    name = Column(String(255))
+    banner = Column(String(500))
+    category = Column(String(100))
+    is_active = Column(Boolean, default=True, nullable=False)  # status do upstream
+    position = Column(Integer, default=0, nullable=False)  # Ordem na game_list do provedor
+    raw_json = Column(Text)  # Objeto original da game_list
+    removed_at = Column(DateTime)  # Sumiu da game_list do provedor
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class GamePopularityBucket(Base):
+    """Apostas de um jogo em uma hora (game_popularity.py): somadas por todos os workers."""
+    __tablename__ = "game_popularity_buckets"
+    __table_args__ = (
+        UniqueConstraint("provider_code", "game_code", "bucket_start", name="uq_game_popularity_bucket"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    provider_code = Column(String(100), nullable=False)  # Bet.provider normalizado
+    game_code = Column(String(255), nullable=False)
+    bucket_start = Column(DateTime, nullable=False, index=True)  # Início da hora (UTC)
+    rounds = Column(Integer, default=0, nullable=False)
+    wagered = Column(Float, default=0.0, nullable=False)
+    players_hll = Column(LargeBinary, nullable=False)  # HyperLogLog (256 registradores) dos user_id
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class CatalogSyncRun(Base):
+    """Uma execução da sincronização do catálogo com o IGameWin."""
+    __tablename__ = "catalog_sync_runs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String(20), nullable=False)  # success, partial (algum provedor falhou), failed
+    providers_total = Column(Integer, default=0, nullable=False)
+    games_total = Column(Integer, default=0, nullable=False)
+    added = Column(Integer, default=0, nullable=False)
+    removed = Column(Integer, default=0, nullable=False)
+    disabled = Column(Integer, default=0, nullable=False)
+    enabled = Column(Integer, default=0, nullable=False)
+    updated = Column(Integer, default=0, nullable=False)
+    failed_providers = Column(Text)  # JSON com os provedores cuja game_list falhou
+    error = Column(Text)
+    started_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime, index=True)
+
+
+class CatalogChange(Base):
+    """Diferença registrada por uma sincronização (jogo/provedor adicionado, removido, desativado...)."""
+    __tablename__ = "catalog_changes"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    sync_run_id = Column(Integer, ForeignKey("catalog_sync_runs.id"), nullable=False, index=True)
+    entity = Column(String(20), nullable=False)  # provider, game
+    change = Column(String(20), nullable=False)  # added, removed, disabled, enabled, updated
+    provider_code = Column(String(100), nullable=False)
+    game_code = Column(String(255))
+    detail = Column(Text)  # JSON com valores anteriores/novos (updated)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
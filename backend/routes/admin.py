@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Body
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response, Body
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, or_
-from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from sqlalchemy import func, desc, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Callable, Iterable, List, NamedTuple, Optional, Dict, Any
+from datetime import datetime, timedelta, timezone
+import asyncio
+import gzip
+import hashlib
 import os
 import uuid
 import json
@@ -11,13 +16,13 @@ import time
 
 import httpx
 
-from database import get_db
+from database import get_db, get_async_db
 from dependencies import get_current_admin_user, get_current_user
 from models import (
     User, Deposit, Withdrawal, FTD, Gateway, IGameWinAgent, FTDSettings,
     TransactionStatus, UserRole, Bet, BetStatus, Notification, NotificationType,
     Affiliate, Manager, Theme, ProviderOrder, TrackingConfig, SupportConfig, GameCustomization,
-    Coupon, Promotion
+    Coupon, Promotion, CatalogSyncRun, CatalogChange, WalletEntry
 )
 from schemas import (
     UserResponse, UserCreate, UserUpdate, AddBonusBalanceRequest,
@@ -38,7 +43,24 @@ from schemas import (
 )
 from auth import get_password_hash
 from igamewin_api import get_igamewin_api, IGameWinAPI
-from bonus_wagering import add_rollover_requirement, get_global_rollover_multiplier, reduce_bonus_wagering_remaining
+from bonus_wagering import add_rollover_requirement, get_global_rollover_multiplier
+import admission
+import agent_cache
+import balance_cache
+import bet_writer
+import catalog_overrides
+import circuit_breaker
+import game_catalog
+import game_popularity
+import game_search
+import igamewin_api
+import igamewin_users
+import memory_cache
+import metrics
+import thumbnail_pack
+import wallet
+import wallet_journal
+import wallet_ledger
 
 class SarrixReconcileByTransactionBody(BaseModel):
     """UUID da transação como no extrato SarrixPay (campo Transação / transaction_id)."""
@@ -51,44 +73,136 @@ public_router = APIRouter(prefix="/api/public", tags=["public"])
 # Router sem prefixo para endpoints que precisam estar na raiz (como /gold_api para IGameWin)
 root_router = APIRouter(tags=["root"])
 
-# Cache em memória para providers e games da API IGameWin
-# Formato: {chave: {"data": dados, "expires_at": timestamp}}
-_igamewin_cache: Dict[str, Dict[str, Any]] = {}
+# Cache em memória das listas de provedores/jogos montadas a partir do catálogo
+# Formato: {chave: {"data": dados, "fresh_until": timestamp}}, expirando no TTL máximo da família
+# Entre fresh_until e a expiração a entrada ainda é servida enquanto UMA tarefa em segundo plano a
+# recalcula (stale-while-revalidate). Misses simultâneos da mesma chave esperam um único cálculo.
+_igamewin_cache = memory_cache.create("public_games", max_entries=500, max_bytes=64 * 1024 * 1024)
 CACHE_TTL_SECONDS = 300  # 5 minutos de cache
 
 
+def _cache_ttls(family: str, soft: int, hard: int):
+    """(TTL fresco, TTL máximo) da família de chaves; CACHE_<FAMÍLIA>_SOFT_TTL / _HARD_TTL sobrescrevem"""
+    prefix = f"CACHE_{family.upper()}"
+    return (
+        float(os.getenv(f"{prefix}_SOFT_TTL", str(soft))),
+        float(os.getenv(f"{prefix}_HARD_TTL", str(hard))),
+    )
+
+
+CACHE_FAMILY_TTLS = {
+    "providers": _cache_ttls("providers", 60, 600),
+    "games": _cache_ttls("games", CACHE_TTL_SECONDS, 3600),
+    "all_games": _cache_ttls("all_games", CACHE_TTL_SECONDS, 3600),
+    "featured_games": _cache_ttls("featured_games", CACHE_TTL_SECONDS, 3600),
+    "popular_games": _cache_ttls("popular_games", CACHE_TTL_SECONDS, 3600),
+}
+_cache_loads: Dict[str, asyncio.Task] = {}
+# Incrementada a cada _clear_cache: um cálculo iniciado antes da limpeza não grava o resultado
+_cache_generation = 0
+
+
+# Respostas do catálogo público: JSON já serializado e comprimido, com ETag pelo hash do conteúdo
+CATALOG_CACHE_CONTROL = os.getenv("CATALOG_CACHE_CONTROL", "public, max-age=60, stale-while-revalidate=300")
+
+
+class EncodedBody(NamedTuple):
+    body: bytes
+    gzipped: bytes
+    etag: str
+
+
+def _encode_body(data: Any) -> EncodedBody:
+    """Serializa uma vez (mesmo formato do JSONResponse) e guarda também a versão gzip"""
+    body = json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+    etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    return EncodedBody(body, gzip.compress(body, compresslevel=6, mtime=0), etag)
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def _encoded_response(request: Request, encoded: EncodedBody) -> Response:
+    """200 com o corpo pré-serializado (gzip se aceito) ou 304 se o cliente já tem a versão atual"""
+    headers = {"ETag": encoded.etag, "Cache-Control": CATALOG_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if _etag_matches(request, encoded.etag):
+        return Response(status_code=304, headers=headers)
+    if "gzip" in request.headers.get("accept-encoding", "").lower():
+        headers["Content-Encoding"] = "gzip"
+        return Response(encoded.gzipped, media_type="application/json", headers=headers)
+    return Response(encoded.body, media_type="application/json", headers=headers)
+
+
 def _get_cache_key(prefix: str, *args) -> str:
     """Gera uma chave de cache única"""
     return f"{prefix}:{':'.join(str(arg) for arg in args)}"
 
 
-def _get_cached(key: str) -> Optional[Any]:
-    """Obtém dados do cache se ainda válidos"""
-    if key not in _igamewin_cache:
-        return None
-    cache_entry = _igamewin_cache[key]
-    if time.time() > cache_entry["expires_at"]:
-        del _igamewin_cache[key]
-        return None
-    return cache_entry["data"]
-
-
-def _set_cache(key: str, data: Any, ttl: int = CACHE_TTL_SECONDS):
-    """Armazena dados no cache com TTL"""
-    _igamewin_cache[key] = {
-        "data": data,
-        "expires_at": time.time() + ttl
-    }
+def _set_cache(key: str, data: Any, ttl: Optional[float] = None):
+    """Armazena dados no cache com os TTLs da família da chave (ou ttl, se fornecido)"""
+    soft, hard = CACHE_FAMILY_TTLS.get(key.split(":", 1)[0], (CACHE_TTL_SECONDS, CACHE_TTL_SECONDS))
+    if ttl is not None:
+        soft = hard = ttl
+    _igamewin_cache.set(key, {"data": data, "fresh_until": time.time() + soft}, ttl_seconds=hard)
 
 
 def _clear_cache(pattern: Optional[str] = None):
     """Limpa o cache. Se pattern fornecido, limpa apenas chaves que começam com pattern"""
+    global _cache_generation
+    _cache_generation += 1
     if pattern:
-        keys_to_delete = [k for k in _igamewin_cache.keys() if k.startswith(pattern)]
-        for k in keys_to_delete:
-            del _igamewin_cache[k]
+        for k in _igamewin_cache.keys():
+            if k.startswith(pattern):
+                _igamewin_cache.pop(k)
+        # Cálculos em andamento usam dados antigos: a próxima leitura inicia outro
+        for k in [k for k in _cache_loads if k.startswith(pattern)]:
+            del _cache_loads[k]
     else:
         _igamewin_cache.clear()
+        _cache_loads.clear()
+
+
+async def _load_into_cache(key: str, loader: Callable[[], Any]) -> Any:
+    generation = _cache_generation
+    try:
+        data = await asyncio.to_thread(loader)
+    finally:
+        if _cache_loads.get(key) is asyncio.current_task():
+            del _cache_loads[key]
+    if generation == _cache_generation:
+        _set_cache(key, data)
+    return data
+
+
+def _start_cache_load(key: str, loader: Callable[[], Any]) -> asyncio.Task:
+    task = _cache_loads.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_load_into_cache(key, loader))
+        _cache_loads[key] = task
+    return task
+
+
+def _log_refresh_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        print(f"[Cache] Erro ao recalcular entrada em segundo plano: {task.exception()}")
+
+
+async def _get_or_load(key: str, loader: Callable[[], Any]) -> Any:
+    """Valor da chave; calcula com loader() (em thread, fora do event loop) uma única vez por chave.
+
+    Entrada vencida mas dentro do TTL máximo é servida imediatamente e recalculada em segundo plano.
+    """
+    entry = _igamewin_cache.get(key)
+    if entry is not None:
+        if time.time() > entry["fresh_until"] and key not in _cache_loads:
+            _start_cache_load(key, loader).add_done_callback(_log_refresh_error)
+        return entry["data"]
+    return await asyncio.shield(_start_cache_load(key, loader))
 
 
 # ========== USERS ==========
@@ -152,15 +266,28 @@ async def update_user(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_admin_user)
 ):
-    user = db.query(User).filter(User.id == user_id).first()
+    update_data = user_data.model_dump(exclude_unset=True)
+    query = db.query(User).filter(User.id == user_id)
+    if update_data.get("balance") is not None:
+        # Saldo absoluto definido pelo admin: a linha fica travada até o commit, então o delta
+        # do ledger é calculado sobre o saldo que de fato será substituído
+        query = query.with_for_update().populate_existing()
+    user = query.first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    update_data = user_data.model_dump(exclude_unset=True)
+    balance_before = float(user.balance or 0.0)
     for field, value in update_data.items():
         setattr(user, field, value)
+    if update_data.get("balance") is not None:
+        wallet_ledger.record(
+            db, user.id, wallet_ledger.KIND_ADMIN_ADJUSTMENT, float(user.balance) - balance_before,
+            reference=f"admin:{current_user.id}",
+        )
     
     db.commit()
+    # O cache de saldo é indexado por username, que também pode ter mudado
+    balance_cache.invalidate_user(user.id)
     db.refresh(user)
     return user
 
@@ -185,8 +312,8 @@ async def add_user_bonus_balance(
             detail="Este usuário não está autorizado a receber esse tipo de crédito (saldo jogável). Ative 'Pode receber' na lista de usuários.",
         )
     amt = float(body.amount)
-    user.balance = float(user.balance) + amt
-    user.bonus_balance = float(user.bonus_balance or 0.0) + amt
+    wallet.adjust(db, user, amt, amt)
+    wallet_ledger.record(db, user.id, wallet_ledger.KIND_ADMIN_BONUS, amt, amt, reference=f"admin:{current_user.id}")
     rm = get_global_rollover_multiplier(db)
     if rm > 0:
         add_rollover_requirement(user, amt, rm)
@@ -230,6 +357,7 @@ async def delete_user(
         raise HTTPException(status_code=404, detail="User not found")
     db.delete(user)
     db.commit()
+    balance_cache.invalidate_user(user_id)
     return None
 
 
@@ -339,7 +467,8 @@ async def update_deposit(
     if deposit_data.status == TransactionStatus.APPROVED and old_status != TransactionStatus.APPROVED:
         user = db.query(User).filter(User.id == deposit.user_id).first()
         balance_before = float(user.balance)
-        user.balance += deposit.amount
+        wallet.adjust(db, user, deposit.amount)
+        wallet_ledger.record(db, user.id, wallet_ledger.KIND_DEPOSIT, deposit.amount, reference=f"deposit:{deposit.id}")
         db.flush()  # Garantir que o depósito seja persistido antes de aplicar bônus
         
         # Aplicar bônus de promoção se houver
@@ -468,12 +597,14 @@ async def update_withdrawal(
         TransactionStatus.PROCESSING,
     ):
         if user:
-            user.balance += withdrawal.amount
+            wallet.adjust(db, user, withdrawal.amount)
+            wallet_ledger.record(db, user.id, wallet_ledger.KIND_WITHDRAWAL_REFUND, withdrawal.amount, reference=f"withdrawal:{withdrawal.id}")
             print(f"[Admin] Revertendo saque {withdrawal_id} - adicionando R$ {withdrawal.amount:.2f} ao saldo do usuário")
     # Se está rejeitando/cancelando um saque que estava aprovado, reverter o saldo
     elif withdrawal_data.status in [TransactionStatus.REJECTED, TransactionStatus.CANCELLED] and withdrawal.status == TransactionStatus.APPROVED:
         if user:
-            user.balance += withdrawal.amount
+            wallet.adjust(db, user, withdrawal.amount)
+            wallet_ledger.record(db, user.id, wallet_ledger.KIND_WITHDRAWAL_REFUND, withdrawal.amount, reference=f"withdrawal:{withdrawal.id}")
             print(f"[Admin] Revertendo saque aprovado {withdrawal_id} - adicionando R$ {withdrawal.amount:.2f} ao saldo do usuário")
     
     for field, value in update_data.items():
@@ -763,6 +894,7 @@ async def create_igamewin_agent(
     db.add(agent)
     db.commit()
     db.refresh(agent)
+    await agent_cache.reload(agent.agent_code)
     
     # Sincronizar RTP com IGameWin se agente estiver ativo e tiver credenciais
     if agent.is_active and agent.agent_code and agent.agent_key:
@@ -811,12 +943,15 @@ async def update_igamewin_agent(
     # Verificar se RTP está sendo atualizado
     rtp_updated = 'rtp' in update_data
     old_rtp = agent.rtp
+    old_agent_code = agent.agent_code
     
     for field, value in update_data.items():
         setattr(agent, field, value)
     
     db.commit()
     db.refresh(agent)
+    # Secret trocado ou agente desativado deixa de autenticar no /gold_api antes da resposta
+    await agent_cache.reload(old_agent_code, agent.agent_code)
     
     # Sincronizar RTP com IGameWin se RTP foi atualizado e agente estiver ativo
     if rtp_updated and agent.is_active and agent.agent_code and agent.agent_key:
@@ -849,54 +984,14 @@ async def delete_igamewin_agent(
     agent = db.query(IGameWinAgent).filter(IGameWinAgent.id == agent_id).first()
     if not agent:
         raise HTTPException(status_code=404, detail="IGameWin agent not found")
+    agent_code = agent.agent_code
     db.delete(agent)
     db.commit()
+    await agent_cache.reload(agent_code)
     return None
 
 
 # ========== IGAMEWIN GAMES ==========
-def _apply_game_customizations(games: list, db: Session) -> list:
-    """Aplica customizações de jogos aos dados retornados"""
-    if not games:
-        return games
-    
-    # Buscar todas as customizações de uma vez
-    game_codes = [g.get("game_code") or g.get("code") or g.get("game_id") or g.get("id") or g.get("slug") for g in games]
-    game_codes = [code for code in game_codes if code]
-    
-    if not game_codes:
-        return games
-    
-    # Dividir em lotes para evitar problemas com muitos parâmetros (limite de 1000 por lote)
-    BATCH_SIZE = 1000
-    customization_map = {}
-    
-    for i in range(0, len(game_codes), BATCH_SIZE):
-        batch = game_codes[i:i + BATCH_SIZE]
-        customizations = db.query(GameCustomization).filter(GameCustomization.game_code.in_(batch)).all()
-        for c in customizations:
-            customization_map[c.game_code] = c
-    
-    # Aplicar customizações
-    for game in games:
-        game_code = game.get("game_code") or game.get("code") or game.get("game_id") or game.get("id") or game.get("slug")
-        if game_code and game_code in customization_map:
-            custom = customization_map[game_code]
-            if custom.custom_name:
-                game["name"] = custom.custom_name
-                game["game_name"] = custom.custom_name
-                game["title"] = custom.custom_name
-                game["gameTitle"] = custom.custom_name
-            if custom.custom_provider:
-                game["provider"] = custom.custom_provider
-                game["provider_code"] = custom.custom_provider
-                game["provider_name"] = custom.custom_provider
-                game["vendor"] = custom.custom_provider
-                game["vendor_name"] = custom.custom_provider
-    
-    return games
-
-
 def _choose_provider(providers: list, provider_code: Optional[str]) -> Optional[str]:
     chosen = provider_code
     if not chosen:
@@ -1078,56 +1173,72 @@ async def get_igamewin_agent_balance(
     }
 
 
+def _provider_ordering():
+    """Ordem (display_order) e provedores prioritários definidos em ProviderOrder, por código normalizado"""
+    overrides = catalog_overrides.get()
+    return overrides.order_map, overrides.priority_providers
+
+
+def _sort_providers(providers: list, order_map: Dict[str, int], priority_providers: set) -> list:
+    """Primeiro os prioritários por display_order (menor primeiro), depois os outros por display_order"""
+    def sort_key(p):
+        code = (p.get("code") or p.get("provider_code") or "").upper().strip()
+        return (0 if code in priority_providers else 1, order_map.get(code, 999))
+    return sorted(providers, key=sort_key)
+
+
+def _home_providers(providers: list, priority_providers: set) -> list:
+    """Até 3 provedores prioritários; se não há prioritários configurados, os 3 primeiros da lista"""
+    chosen = []
+    for p in providers:
+        code = (p.get("code") or p.get("provider_code") or "").upper().strip()
+        if code in priority_providers:
+            chosen.append(p)
+            if len(chosen) >= 3:
+                break
+    return chosen or providers[:3]
+
+
+def _catalog_games(catalog: game_catalog.Catalog, provider_code: Optional[str]) -> list:
+    """Jogos de um provedor do catálogo local (customizações já aplicadas na materialização do snapshot)"""
+    return catalog.games_for(provider_code)
+
+
+def _catalog_overrides_changed(db: Session):
+    """Customizações/ordem de provedores gravadas: troca o snapshot, rematerializa o catálogo e limpa as listas"""
+    game_catalog.apply_overrides(db)
+    _clear_catalog_views()
+
+
+def _clear_catalog_views():
+    """Descarta as listas de jogos montadas a partir do catálogo (customizações/ordem mudaram)"""
+    _clear_cache("providers")
+    _clear_cache("games")
+    _clear_cache("all_games")
+    _clear_cache("featured_games")
+    _clear_cache("popular_games")
+    _clear_cache("trending")
+
+
 @router.get("/igamewin/games")
 async def list_igamewin_games(
     provider_code: Optional[str] = Query(None),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_admin_user)
 ):
-    api = get_igamewin_api(db)
-    if not api:
-        raise HTTPException(
-            status_code=400, 
-            detail="Nenhum agente IGameWin ativo configurado ou credenciais incompletas (agent_code/agent_key vazios)"
-        )
-
-    providers = await api.get_providers()
-    if providers is None:
+    catalog = game_catalog.get_catalog()
+    if not catalog.providers:
         raise HTTPException(
-            status_code=502,
-            detail=f"Não foi possível obter provedores da IGameWin ({api.last_error or 'erro desconhecido'})"
+            status_code=503,
+            detail="Catálogo de jogos ainda não sincronizado com a IGameWin (veja /api/admin/catalog/sync-runs)"
         )
     
     # Ordenar provedores pela ordem definida no banco
-    provider_orders = db.query(ProviderOrder).all()
-    order_map = {po.provider_code: po.display_order for po in provider_orders}
-    priority_providers = {po.provider_code for po in provider_orders if po.is_priority}
-    
-    # Normalizar códigos dos provedores para comparação (uppercase, sem espaços)
-    normalized_order_map = {k.upper().strip(): v for k, v in order_map.items()}
-    normalized_priority_providers = {p.upper().strip() for p in priority_providers}
-    
-    # Ordenar: primeiro os prioritários por display_order (menor primeiro), depois os outros por display_order
-    def sort_providers(p):
-        code = (p.get("code") or p.get("provider_code") or "").upper().strip()
-        is_priority = code in normalized_priority_providers
-        order = normalized_order_map.get(code, 999)
-        # Retorna: (0 se prioritário, 1 se não), depois a ordem específica
-        return (0 if is_priority else 1, order)
-    
-    providers = sorted(providers, key=sort_providers)
+    order_map, priority_providers = _provider_ordering()
+    providers = _sort_providers(catalog.providers, order_map, priority_providers)
 
     chosen_provider = _choose_provider(providers, provider_code)
-
-    games = await api.get_games(provider_code=chosen_provider)
-    if games is None:
-        raise HTTPException(
-            status_code=502,
-            detail=f"Não foi possível obter jogos da IGameWin (verifique provider_code e credenciais do agente). {api.last_error or ''}".strip()
-        )
-
-    games = _normalize_games(games, chosen_provider)
-    games = _apply_game_customizations(games, db)
+    games = _catalog_games(catalog, chosen_provider)
 
     return {
         "providers": providers[:3],  # Limitar a 3 provedores
@@ -1136,225 +1247,268 @@ async def list_igamewin_games(
     }
 
 
-@public_router.get("/games")
-async def public_games(
-    provider_code: Optional[str] = Query(None),
-    db: Session = Depends(get_db)
+@router.post("/catalog/sync")
+async def sync_game_catalog(current_user: User = Depends(get_current_admin_user)):
+    """Sincroniza agora o catálogo local de provedores/jogos com a IGameWin"""
+    summary = await game_catalog.sync_catalog()
+    if summary.get("status") == game_catalog.RUN_FAILED:
+        raise HTTPException(status_code=502, detail=summary.get("error") or "Falha ao sincronizar catálogo")
+    _clear_catalog_views()
+    return summary
+
+
+@router.get("/catalog/sync-runs")
+async def list_catalog_sync_runs(
+    limit: int = Query(20, ge=1, le=200),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
 ):
-    api = get_igamewin_api(db)
-    if not api:
-        raise HTTPException(
-            status_code=400, 
-            detail="Nenhum agente IGameWin ativo configurado ou credenciais incompletas (agent_code/agent_key vazios)"
-        )
+    """Últimas sincronizações do catálogo (contagens de jogos adicionados/removidos/desativados)"""
+    runs = db.query(CatalogSyncRun).order_by(CatalogSyncRun.id.desc()).limit(limit).all()
+    catalog = game_catalog.get_catalog()
+    return {
+        "loaded_version": catalog.version,
+        "providers": len(catalog.providers),
+        "games": sum(len(g) for g in catalog.games.values()),
+        "runs": [game_catalog.run_dict(r) for r in runs],
+    }
 
-    # Verificar cache para providers
-    cache_key_providers = _get_cache_key("providers", api.agent_code)
-    cached_providers = _get_cached(cache_key_providers)
-    
-    if cached_providers is not None:
-        providers = cached_providers
-    else:
-        providers = await api.get_providers()
-        if providers is None:
-            raise HTTPException(
-                status_code=502,
-                detail=f"Não foi possível obter provedores da IGameWin ({api.last_error or 'erro desconhecido'})"
-            )
-        _set_cache(cache_key_providers, providers)
-    
-    # Ordenar provedores pela ordem definida no banco
-    provider_orders = db.query(ProviderOrder).all()
-    order_map = {po.provider_code: po.display_order for po in provider_orders}
-    priority_providers = {po.provider_code for po in provider_orders if po.is_priority}
-    
-    # Normalizar códigos dos provedores para comparação (uppercase, sem espaços)
-    normalized_order_map = {k.upper().strip(): v for k, v in order_map.items()}
-    normalized_priority_providers = {p.upper().strip() for p in priority_providers}
-    
-    # Ordenar: primeiro os prioritários por display_order (menor primeiro), depois os outros por display_order
-    def sort_providers(p):
-        code = (p.get("code") or p.get("provider_code") or "").upper().strip()
-        is_priority = code in normalized_priority_providers
-        order = normalized_order_map.get(code, 999)
-        # Retorna: (0 se prioritário, 1 se não), depois a ordem específica
-        return (0 if is_priority else 1, order)
-    
-    providers = sorted(providers, key=sort_providers)
-    
-    # Filtrar apenas os 3 provedores prioritários (is_priority = True)
-    priority_providers_list = []
-    for p in providers:
-        code = (p.get("code") or p.get("provider_code") or "").upper().strip()
-        if code in normalized_priority_providers:
-            priority_providers_list.append(p)
-            if len(priority_providers_list) >= 3:
-                break
-    
-    # Se não há provedores prioritários configurados, usar os 3 primeiros da lista ordenada
-    if not priority_providers_list:
-        priority_providers_list = providers[:3]
-    
-    # Usar apenas os provedores prioritários para a home
-    providers = priority_providers_list
-    
-    # Se provider_code foi especificado, retorna apenas jogos desse provedor
+
+@router.get("/catalog/changes")
+async def list_catalog_changes(
+    sync_run_id: Optional[int] = Query(None),
+    change: Optional[str] = Query(None, description="added, removed, disabled, enabled, updated"),
+    provider_code: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Diferenças registradas pelas sincronizações do catálogo (mais recentes primeiro)"""
+    query = db.query(CatalogChange)
+    if sync_run_id is not None:
+        query = query.filter(CatalogChange.sync_run_id == sync_run_id)
+    if change:
+        query = query.filter(CatalogChange.change == change)
     if provider_code:
-        chosen_provider = _choose_provider(providers, provider_code)
+        query = query.filter(CatalogChange.provider_code == provider_code)
+    return [game_catalog.change_dict(c) for c in query.order_by(CatalogChange.id.desc()).limit(limit).all()]
+
+
+def _load_provider_views(catalog: game_catalog.Catalog) -> Dict[str, Any]:
+    """Provedores ordenados pela ordem definida no banco e os prioritários (máximo 3) da home"""
+    order_map, priority_providers = _provider_ordering()
+    sorted_providers = _sort_providers(catalog.providers, order_map, priority_providers)
+    return {
+        "sorted": sorted_providers,
+        "home": _home_providers(sorted_providers, priority_providers),
+        "priority": priority_providers,
+    }
+
+
+def _load_provider_games(catalog: game_catalog.Catalog, chosen_provider: Optional[str]) -> list:
+    public_games = []
+    for g in _catalog_games(catalog, chosen_provider):
+        if len(public_games) >= 20:  # Limitar a 20 jogos por provedor
+            break
+        status_val = g.get("status")
+        is_active = (status_val == 1) or (status_val is True) or (str(status_val).lower() == "active")
+        if not is_active:
+            continue
+        game_code = _extract_game_code(g)
+        if not game_code:
+            continue  # Pular jogos sem código válido
+        public_games.append({
+            "name": g.get("game_name") or g.get("name") or g.get("title") or g.get("gameTitle"),
+            "code": game_code,
+            "provider": g.get("provider_code") or g.get("provider") or g.get("provider_name") or g.get("vendor") or g.get("vendor_name") or chosen_provider,
+            "banner": g.get("banner") or g.get("image") or g.get("icon"),
+            "status": "active"
+        })
+    return public_games
+
+
+def _load_all_games(catalog: game_catalog.Catalog, provider_views: Dict[str, Any]) -> list:
+    """Jogos de todos os provedores prioritários (até 20 por provedor)"""
+    all_games = []
+    sorted_providers = provider_views["sorted"]
+    active_providers = [p for p in sorted_providers if str(p.get("status", 1)) in ["1", "true", "True"]] or sorted_providers
+    priority_active_providers = _home_providers(active_providers, provider_views["priority"])
+    
+    # Coletar os jogos apenas dos provedores prioritários
+    all_raw_games = []
+    for provider in priority_active_providers:
+        prov_code = provider.get("code") or provider.get("provider_code")
+        if not prov_code:
+            continue
+        for g in catalog.games_for(prov_code):
+            # provider_code do jogo (já com o provedor customizado, se houver) ou o do provedor
+            all_raw_games.append(g if g.get("provider_code") else {**g, "provider_code": prov_code})
+    
+    # Agora processar os jogos customizados, limitando a 20 jogos por provedor
+    games_per_provider = {}
+    for g in all_raw_games:
+        status_val = g.get("status")
+        is_active = (status_val == 1) or (status_val is True) or (str(status_val).lower() == "active")
+        if not is_active:
+            continue
+        # Usar o código do provedor diretamente para garantir correspondência com a ordenação
+        game_code = _extract_game_code(g)
+        if not game_code:
+            continue  # Pular jogos sem código válido
+        prov_code = g.get("provider_code")
         
-        # Verificar cache para games deste provedor
-        cache_key_games = _get_cache_key("games", api.agent_code, chosen_provider)
-        cached_games = _get_cached(cache_key_games)
+        # Contar jogos por provedor
+        if prov_code not in games_per_provider:
+            games_per_provider[prov_code] = 0
         
-        if cached_games is not None:
-            games = cached_games
-        else:
-            games = await api.get_games(provider_code=chosen_provider)
-            if games is None:
-                raise HTTPException(
-                    status_code=502,
-                    detail=f"Não foi possível obter jogos da IGameWin (verifique provider_code e credenciais do agente). {api.last_error or ''}".strip()
-                )
-            games = _normalize_games(games, chosen_provider)
-            _set_cache(cache_key_games, games)
+        # Limitar a 20 jogos por provedor
+        if games_per_provider[prov_code] >= 20:
+            continue
         
-        games = _apply_game_customizations(games, db)
-        public_games = []
-        game_count = 0
-        for g in games:
-            if game_count >= 20:  # Limitar a 20 jogos por provedor
-                break
-            status_val = g.get("status")
-            is_active = (status_val == 1) or (status_val is True) or (str(status_val).lower() == "active")
-            if not is_active:
-                continue
-            game_code = _extract_game_code(g)
-            if not game_code:
-                continue  # Pular jogos sem código válido
-            public_games.append({
-                "name": g.get("game_name") or g.get("name") or g.get("title") or g.get("gameTitle"),
-                "code": game_code,
-                "provider": g.get("provider_code") or g.get("provider") or g.get("provider_name") or g.get("vendor") or g.get("vendor_name") or chosen_provider,
-                "banner": g.get("banner") or g.get("image") or g.get("icon"),
-                "status": "active"
-            })
-            game_count += 1
-        return {
-            "providers": providers,  # Apenas os provedores prioritários (máximo 3)
-            "provider_code": chosen_provider,
-            "games": public_games
-        }
+        all_games.append({
+            "name": g.get("game_name") or g.get("name") or g.get("title") or g.get("gameTitle"),
+            "code": game_code,
+            "provider": prov_code,  # Usar o código do provedor diretamente
+            "provider_code": prov_code,  # Adicionar também como provider_code para referência
+            "banner": g.get("banner") or g.get("image") or g.get("icon"),
+            "status": "active"
+        })
+        games_per_provider[prov_code] += 1
+    return all_games
+
+
+@public_router.get("/games")
+async def public_games(request: Request, provider_code: Optional[str] = Query(None)):
+    # Somente o catálogo local: nenhuma chamada à IGameWin durante a requisição
+    catalog = game_catalog.get_catalog()
+    
+    # Ordenar provedores pela ordem definida no banco e usar apenas os prioritários (máximo 3) na home
+    provider_views = await _get_or_load(
+        _get_cache_key("providers", catalog.revision),
+        lambda: _load_provider_views(catalog),
+    )
+    providers = provider_views["home"]
     
-    # Se não há provider_code, busca jogos de TODOS os provedores
-    # Verificar cache para todos os games
-    cache_key_all_games = _get_cache_key("all_games", api.agent_code)
-    cached_all_games = _get_cached(cache_key_all_games)
+    # Se provider_code foi especificado, retorna apenas jogos desse provedor
+    if provider_code:
+        chosen_provider = _choose_provider(providers, provider_code)
+        encoded = await _get_or_load(
+            _get_cache_key("games", catalog.revision, chosen_provider),
+            lambda: _encode_body({
+                "providers": providers,  # Apenas os provedores prioritários (máximo 3)
+                "provider_code": chosen_provider,
+                "games": _load_provider_games(catalog, chosen_provider)
+            }),
+        )
+        return _encoded_response(request, encoded)
     
-    if cached_all_games is not None:
-        all_games = cached_all_games
-    else:
-        all_games = []
-        all_raw_games = []  # Coletar todos os jogos brutos primeiro
-        active_providers = [p for p in providers if str(p.get("status", 1)) in ["1", "true", "True"]] or providers
-        
-        # Ordenar provedores pela ordem definida no banco (já ordenado acima, mas garantir)
-        active_providers = sorted(active_providers, key=sort_providers)
-        
-        # Filtrar apenas os provedores prioritários (máximo 3)
-        priority_active_providers = []
-        for p in active_providers:
-            code = (p.get("code") or p.get("provider_code") or "").upper().strip()
-            if code in normalized_priority_providers:
-                priority_active_providers.append(p)
-                if len(priority_active_providers) >= 3:
-                    break
-        
-        # Se não há provedores prioritários, usar os 3 primeiros
-        if not priority_active_providers:
-            priority_active_providers = active_providers[:3]
-        
-        # Primeiro, coletar todos os jogos brutos apenas dos provedores prioritários
-        for provider in priority_active_providers:
-            prov_code = provider.get("code") or provider.get("provider_code")
-            if not prov_code:
-                continue
-            
-            # Verificar cache para games deste provedor específico
-            cache_key_provider_games = _get_cache_key("games", api.agent_code, prov_code)
-            cached_provider_games = _get_cached(cache_key_provider_games)
-            
-            if cached_provider_games is not None:
-                games = cached_provider_games
-            else:
-                games = await api.get_games(provider_code=prov_code)
-                if games is None:
-                    continue
-                games = _normalize_games(games, prov_code)
-                _set_cache(cache_key_provider_games, games)
-            
-            # Adicionar provedor_code a cada jogo para referência posterior
-            for g in games:
-                g["provider_code"] = prov_code
-            
-            all_raw_games.extend(games)
-        
-        # Aplicar customizações UMA VEZ para todos os jogos coletados
-        all_raw_games = _apply_game_customizations(all_raw_games, db)
-        
-        # Agora processar os jogos customizados, limitando a 20 jogos por provedor
-        games_per_provider = {}
-        for g in all_raw_games:
-            status_val = g.get("status")
-            is_active = (status_val == 1) or (status_val is True) or (str(status_val).lower() == "active")
-            if not is_active:
-                continue
-            # Usar o código do provedor diretamente para garantir correspondência com a ordenação
-            game_code = _extract_game_code(g)
-            if not game_code:
-                continue  # Pular jogos sem código válido
-            prov_code = g.get("provider_code")
-            
-            # Contar jogos por provedor
-            if prov_code not in games_per_provider:
-                games_per_provider[prov_code] = 0
-            
-            # Limitar a 20 jogos por provedor
-            if games_per_provider[prov_code] >= 20:
-                continue
-            
-            all_games.append({
-                "name": g.get("game_name") or g.get("name") or g.get("title") or g.get("gameTitle"),
-                "code": game_code,
-                "provider": prov_code,  # Usar o código do provedor diretamente
-                "provider_code": prov_code,  # Adicionar também como provider_code para referência
-                "banner": g.get("banner") or g.get("image") or g.get("icon"),
-                "status": "active"
-            })
-            games_per_provider[prov_code] += 1
-        
-        # Cachear resultado final
-        _set_cache(cache_key_all_games, all_games)
+    # Se não há provider_code, jogos de todos os provedores prioritários
+    encoded = await _get_or_load(
+        _get_cache_key("all_games", catalog.revision),
+        lambda: _encode_body({
+            "providers": providers,  # Apenas os provedores prioritários (máximo 3)
+            "provider_code": None,
+            "games": _load_all_games(catalog, provider_views)
+        }),
+    )
+    return _encoded_response(request, encoded)
 
+
+def _game_card(g: Dict[str, Any]) -> Dict[str, Any]:
     return {
-        "providers": providers,  # Apenas os provedores prioritários (máximo 3)
-        "provider_code": None,
-        "games": all_games
+        "name": g.get("game_name") or g.get("name") or g.get("title"),
+        "code": _extract_game_code(g),
+        "provider": g.get("provider_code"),
+        "banner": g.get("banner") or g.get("image") or g.get("icon"),
     }
 
 
+def _match_games_by_name(catalog: game_catalog.Catalog, names: List[str], exclude: Iterable[str] = ()) -> List[Dict[str, Any]]:
+    """Jogos ativos dos provedores prioritários que melhor correspondem a cada nome (índice de busca, um jogo por nome)"""
+    order_map, priority_providers = _provider_ordering()
+    providers = _home_providers(_sort_providers(catalog.providers, order_map, priority_providers), priority_providers)
+    provider_codes = [p.get("code") or p.get("provider_code") for p in providers]
+    provider_codes = [code for code in provider_codes if code]
+    
+    found = []
+    used = set(exclude)
+    for wanted_name in names:
+        g = game_search.best_match(wanted_name, provider_codes, exclude=used)
+        if g is not None:
+            used.add(g.get("game_code"))
+            found.append(g)
+    
+    return [_game_card(g) for g in found]
+
+
+def _trending_games(catalog: game_catalog.Catalog, window: str, sort: str, limit: int) -> List[Dict[str, Any]]:
+    """Jogos ativos do catálogo mais jogados na janela (ranking em memória do game_popularity)"""
+    by_provider: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    cards = []
+    for entry in game_popularity.ranking(window, sort):
+        provider = entry["provider_code"]
+        if provider not in catalog.games:
+            # Bet.provider fora do catálogo (ex.: "IGameWin" padrão): provedor pelo índice de jogos
+            provider = game_catalog.normalize_code(catalog.game_providers.get(entry["game_code"]))
+        games = by_provider.get(provider)
+        if games is None:
+            games = by_provider[provider] = {g.get("game_code"): g for g in catalog.games_for(provider)}
+        g = games.get(entry["game_code"])
+        if g is None or g.get("status") != 1:
+            continue
+        cards.append({**_game_card(g), "rounds": entry["rounds"], "players": entry["players"]})
+        if len(cards) >= limit:
+            break
+    return cards
+
+
+def _popular_or_curated(catalog: game_catalog.Catalog, window: str, names: List[str], limit: int) -> List[Dict[str, Any]]:
+    """Mais jogados na janela; completa com a lista curada enquanto não há apostas suficientes"""
+    cards = [
+        {k: v for k, v in card.items() if k not in ("rounds", "players")}
+        for card in _trending_games(catalog, window, "players", limit)
+    ]
+    if len(cards) < limit:
+        used = [card["code"] for card in cards]
+        cards += _match_games_by_name(catalog, names, exclude=used)[:limit - len(cards)]
+    return cards
+
+
+@public_router.get("/games/search")
+async def public_games_search(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=100),
+    provider_code: Optional[str] = Query(None, description="Um ou mais códigos separados por vírgula"),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """
+    Busca de jogos por nome (sem acentos, por prefixo das palavras e aproximada por trigramas).
+    Lê apenas o índice em memória do catálogo local.
+    """
+    providers = provider_code.split(",") if provider_code else None
+    results = game_search.search(q, limit=limit, providers=providers)
+    return _encoded_response(request, _encode_body({
+        "query": q,
+        "games": [
+            {
+                "name": g.get("game_name") or g.get("name") or g.get("title"),
+                "code": _extract_game_code(g),
+                "provider": g.get("provider_code"),
+                "banner": g.get("banner") or g.get("image") or g.get("icon"),
+                "category": g.get("category"),
+                "match": "fuzzy" if tier == game_search.TIER_FUZZY else "prefix",
+            }
+            for tier, _, g in results
+        ],
+    }))
+
+
 @public_router.get("/games/featured")
-async def public_featured_games(db: Session = Depends(get_db)):
+async def public_featured_games(request: Request):
     """
     Retorna apenas os jogos em destaque (featured games).
-    Otimizado para retornar apenas os jogos necessários sem buscar todos.
+    Lê apenas o catálogo local (sem chamadas à IGameWin).
     """
-    api = get_igamewin_api(db)
-    if not api:
-        raise HTTPException(
-            status_code=400, 
-            detail="Nenhum agente IGameWin ativo configurado"
-        )
-    
     # Lista de jogos em destaque que queremos buscar
     featured_game_names = [
         'Aviator', 'Cachorro Sortudo', 'Roleta', 'Fortune Tiger', 'Mine',
@@ -1362,224 +1516,103 @@ async def public_featured_games(db: Session = Depends(get_db)):
         'Slot Da Sorte', 'Big Bass', 'Sweet Bonanza', 'JetX'
     ]
     
-    # Verificar cache
-    cache_key = _get_cache_key("featured_games", api.agent_code)
-    cached_featured = _get_cached(cache_key)
-    
-    if cached_featured is not None:
-        return {"games": cached_featured}
-    
-    # Buscar provedores prioritários
-    cache_key_providers = _get_cache_key("providers", api.agent_code)
-    cached_providers = _get_cached(cache_key_providers)
-    
-    if cached_providers is None:
-        providers = await api.get_providers()
-        if providers is None:
-            raise HTTPException(status_code=502, detail="Erro ao buscar provedores")
-        _set_cache(cache_key_providers, providers)
-    else:
-        providers = cached_providers
-    
-    # Obter provedores prioritários
-    provider_orders = db.query(ProviderOrder).all()
-    priority_providers = {po.provider_code.upper().strip() for po in provider_orders if po.is_priority}
-    
-    priority_providers_list = []
-    for p in providers:
-        code = (p.get("code") or p.get("provider_code") or "").upper().strip()
-        if code in priority_providers:
-            priority_providers_list.append(p)
-            if len(priority_providers_list) >= 3:
-                break
-    
-    if not priority_providers_list:
-        priority_providers_list = providers[:3]
-    
-    # Buscar jogos apenas dos provedores prioritários e filtrar por nome
-    featured_games = []
-    found_names = set()
-    
-    for provider in priority_providers_list:
-        prov_code = provider.get("code") or provider.get("provider_code")
-        if not prov_code:
-            continue
-        
-        # Verificar cache para games deste provedor
-        cache_key_provider_games = _get_cache_key("games", api.agent_code, prov_code)
-        cached_provider_games = _get_cached(cache_key_provider_games)
-        
-        if cached_provider_games is None:
-            games = await api.get_games(provider_code=prov_code)
-            if games is None:
-                continue
-            games = _normalize_games(games, prov_code)
-            _set_cache(cache_key_provider_games, games)
-        else:
-            games = cached_provider_games
-        
-        # Aplicar customizações
-        games = _apply_game_customizations(games, db)
-        
-        # Buscar jogos que correspondem aos nomes em destaque
-        for g in games:
-            if len(featured_games) >= len(featured_game_names):
-                break
-            
-            status_val = g.get("status")
-            is_active = (status_val == 1) or (status_val is True) or (str(status_val).lower() == "active")
-            if not is_active:
-                continue
-            
-            game_name = (g.get("game_name") or g.get("name") or g.get("title") or "").lower().strip()
-            game_code = _extract_game_code(g)
-            
-            if not game_code or not game_name:
-                continue
-            
-            # Verificar se corresponde a algum jogo em destaque
-            for featured_name in featured_game_names:
-                if featured_name.lower() in found_names:
-                    continue
-                
-                normalized_featured = featured_name.lower().strip()
-                if normalized_featured in game_name or game_name in normalized_featured:
-                    featured_games.append({
-                        "name": g.get("game_name") or g.get("name") or g.get("title"),
-                        "code": game_code,
-                        "provider": prov_code,
-                        "banner": g.get("banner") or g.get("image") or g.get("icon"),
-                    })
-                    found_names.add(featured_name.lower())
-                    break
-            
-            if len(featured_games) >= len(featured_game_names):
-                break
-        
-        if len(featured_games) >= len(featured_game_names):
-            break
-    
-    # Cachear resultado
-    _set_cache(cache_key, featured_games)
-    
-    return {"games": featured_games}
+    catalog = game_catalog.get_catalog()
+    encoded = await _get_or_load(
+        _get_cache_key("featured_games", catalog.revision, game_popularity.version()),
+        lambda: _encode_body({"games": _popular_or_curated(catalog, "24h", featured_game_names, len(featured_game_names))}),
+    )
+    return _encoded_response(request, encoded)
 
 
 @public_router.get("/games/popular")
-async def public_popular_games(db: Session = Depends(get_db)):
+async def public_popular_games(request: Request):
     """
     Retorna apenas os jogos populares para o sidebar.
-    Otimizado para retornar apenas os jogos necessários.
+    Lê apenas o catálogo local (sem chamadas à IGameWin).
     """
-    api = get_igamewin_api(db)
-    if not api:
-        raise HTTPException(
-            status_code=400, 
-            detail="Nenhum agente IGameWin ativo configurado"
-        )
-    
     # Lista de jogos populares que queremos buscar
     popular_game_names = ['Fortune Tiger', 'Mine', 'Gate of Olympus', 'Aviator']
     
-    # Verificar cache
-    cache_key = _get_cache_key("popular_games", api.agent_code)
-    cached_popular = _get_cached(cache_key)
-    
-    if cached_popular is not None:
-        return {"games": cached_popular}
-    
-    # Buscar provedores prioritários
-    cache_key_providers = _get_cache_key("providers", api.agent_code)
-    cached_providers = _get_cached(cache_key_providers)
-    
-    if cached_providers is None:
-        providers = await api.get_providers()
-        if providers is None:
-            raise HTTPException(status_code=502, detail="Erro ao buscar provedores")
-        _set_cache(cache_key_providers, providers)
-    else:
-        providers = cached_providers
-    
-    # Obter provedores prioritários
-    provider_orders = db.query(ProviderOrder).all()
-    priority_providers = {po.provider_code.upper().strip() for po in provider_orders if po.is_priority}
-    
-    priority_providers_list = []
-    for p in providers:
-        code = (p.get("code") or p.get("provider_code") or "").upper().strip()
-        if code in priority_providers:
-            priority_providers_list.append(p)
-            if len(priority_providers_list) >= 3:
-                break
-    
-    if not priority_providers_list:
-        priority_providers_list = providers[:3]
-    
-    # Buscar jogos apenas dos provedores prioritários e filtrar por nome
-    popular_games = []
-    found_names = set()
-    
-    for provider in priority_providers_list:
-        prov_code = provider.get("code") or provider.get("provider_code")
-        if not prov_code:
-            continue
-        
-        # Verificar cache para games deste provedor
-        cache_key_provider_games = _get_cache_key("games", api.agent_code, prov_code)
-        cached_provider_games = _get_cached(cache_key_provider_games)
-        
-        if cached_provider_games is None:
-            games = await api.get_games(provider_code=prov_code)
-            if games is None:
-                continue
-            games = _normalize_games(games, prov_code)
-            _set_cache(cache_key_provider_games, games)
-        else:
-            games = cached_provider_games
-        
-        # Aplicar customizações
-        games = _apply_game_customizations(games, db)
-        
-        # Buscar jogos que correspondem aos nomes populares
-        for g in games:
-            if len(popular_games) >= len(popular_game_names):
-                break
-            
-            status_val = g.get("status")
-            is_active = (status_val == 1) or (status_val is True) or (str(status_val).lower() == "active")
-            if not is_active:
-                continue
-            
-            game_name = (g.get("game_name") or g.get("name") or g.get("title") or "").lower().strip()
-            game_code = _extract_game_code(g)
-            
-            if not game_code or not game_name:
-                continue
-            
-            # Verificar se corresponde a algum jogo popular
-            for popular_name in popular_game_names:
-                if popular_name.lower() in found_names:
-                    continue
-                
-                normalized_popular = popular_name.lower().strip()
-                if normalized_popular in game_name or game_name in normalized_popular:
-                    popular_games.append({
-                        "name": g.get("game_name") or g.get("name") or g.get("title"),
-                        "code": game_code,
-                    })
-                    found_names.add(popular_name.lower())
-                    break
-            
-            if len(popular_games) >= len(popular_game_names):
-                break
-        
-        if len(popular_games) >= len(popular_game_names):
-            break
-    
-    # Cachear resultado
-    _set_cache(cache_key, popular_games)
-    
-    return {"games": popular_games}
+    catalog = game_catalog.get_catalog()
+    encoded = await _get_or_load(
+        _get_cache_key("popular_games", catalog.revision, game_popularity.version()),
+        lambda: _encode_body({"games": [
+            {"name": g["name"], "code": g["code"]}
+            for g in _popular_or_curated(catalog, "7d", popular_game_names, len(popular_game_names))
+        ]}),
+    )
+    return _encoded_response(request, encoded)
+
+
+@public_router.get("/games/trending")
+async def public_trending_games(
+    request: Request,
+    window: str = Query("24h", pattern="^(1h|24h|7d)$"),
+    sort: str = Query("players", pattern="^(players|rounds|wagered)$"),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """
+    Jogos em alta pelas apostas reais (jogadores únicos, rodadas ou valor apostado na janela).
+    Lê apenas os rankings em memória e o catálogo local.
+    """
+    catalog = game_catalog.get_catalog()
+    encoded = await _get_or_load(
+        _get_cache_key("trending", catalog.revision, game_popularity.version(), window, sort, limit),
+        lambda: _encode_body({"window": window, "sort": sort, "games": _trending_games(catalog, window, sort, limit)}),
+    )
+    return _encoded_response(request, encoded)
+
+
+LOBBY_FIELDS = ("code", "name", "provider", "banner", "category", "status")
+
+
+@public_router.get("/games/lobby")
+async def public_games_lobby(
+    request: Request,
+    provider_code: Optional[str] = Query(None, description="Um ou mais códigos separados por vírgula"),
+    category: Optional[str] = Query(None),
+    status_filter: str = Query("active", alias="status", pattern="^(active|inactive|all)$"),
+    fields: Optional[str] = Query(None, description=f"Campos separados por vírgula: {', '.join(LOBBY_FIELDS)}"),
+    cursor: Optional[str] = Query(None, description="next_cursor da página anterior"),
+    limit: int = Query(48, ge=1, le=200),
+):
+    """
+    Catálogo completo paginado por cursor (ordem estável provider_code, position, game_code).
+    Lê apenas o snapshot em memória do catálogo (sem banco e sem chamadas à IGameWin).
+    """
+    selected = LOBBY_FIELDS
+    if fields:
+        selected = tuple(f.strip() for f in fields.split(",") if f.strip())
+        unknown = [f for f in selected if f not in LOBBY_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Campos inválidos: {', '.join(unknown)}")
+    try:
+        after = game_catalog.decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    rows, has_more = game_catalog.lobby_page(
+        game_catalog.get_catalog(),
+        provider_codes=provider_code.split(",") if provider_code else None,
+        category=category,
+        active={"active": True, "inactive": False}.get(status_filter),
+        after=after,
+        limit=limit,
+    )
+    games = [g for _, g in rows]
+    values = {
+        "code": lambda g: g["game_code"],
+        "name": lambda g: g["game_name"],
+        "provider": lambda g: g["provider_code"],
+        "banner": lambda g: g["banner"],
+        "category": lambda g: g["category"],
+        "status": lambda g: "active" if g.get("status") == 1 else "inactive",
+    }
+    return _encoded_response(request, _encode_body({
+        "games": [{f: values[f](g) for f in selected} for g in games],
+        "next_cursor": game_catalog.encode_cursor(rows[-1][0]) if has_more else None,
+        "limit": limit,
+    }))
 
 
 @public_router.get("/games/{game_code}/launch")
@@ -1595,7 +1628,7 @@ async def launch_game(
     Follows IGameWin API documentation:
     - Uses user_code (username) to launch game
     - Returns launch_url from API response
-    - If provider_code is not provided, searches for the game in the game list to find its provider
+    - If provider_code is not provided, resolves it from the local catalog index (game_code -> provider)
     """
     api = get_igamewin_api(db)
     if not api:
@@ -1604,36 +1637,12 @@ async def launch_game(
             detail="Nenhum agente IGameWin ativo configurado ou credenciais incompletas (agent_code/agent_key vazios)"
         )
     
-    # Se provider_code não foi fornecido, buscar na lista de jogos
+    # Se provider_code não foi fornecido, resolver pelo índice game_code -> provider do catálogo local
     if not provider_code:
-        providers = await api.get_providers()
-        if providers is None:
-            raise HTTPException(
-                status_code=502,
-                detail=f"Não foi possível obter provedores da IGameWin ({api.last_error or 'erro desconhecido'})"
-            )
-        
-        # Tentar encontrar o jogo em cada provider
-        found_provider = None
-        for provider in providers:
-            provider_code_to_try = provider.get("code") or provider.get("provider_code")
-            if not provider_code_to_try:
-                continue
-            
-            games = await api.get_games(provider_code=provider_code_to_try)
-            if games:
-                for game in games:
-                    game_code_from_api = _extract_game_code(game)
-                    if game_code_from_api and game_code_from_api == game_code:
-                        found_provider = provider_code_to_try
-                        break
-                if found_provider:
-                    break
-        
-        if found_provider:
-            provider_code = found_provider
-        else:
-            # Se não encontrou, usar o primeiro provider ativo como fallback
+        provider_code = await game_catalog.resolve_provider(game_code, api)
+        if not provider_code:
+            # Jogo fora do catálogo: usar o primeiro provider ativo como fallback
+            providers = game_catalog.get_catalog().providers
             active_providers = [p for p in providers if str(p.get("status", 1)) in ["1", "true", "True"]]
             if active_providers:
                 provider_code = active_providers[0].get("code") or active_providers[0].get("provider_code")
@@ -1654,14 +1663,10 @@ async def launch_game(
     print(f"[Launch Game] 💰 Saldo no nosso banco: R$ {current_user.balance}")
     print("="*80 + "\n")
     
-    # 1. Garantir que o usuário existe no IGameWin
-    print(f"[Launch Game] Criando/verificando usuário no IGameWin...")
-    user_created = await api.create_user(current_user.username, is_demo=False)
-    if not user_created:
-        # Se o erro for DUPLICATED_USER, o usuário já existe - continuar normalmente
-        if api.last_error and "DUPLICATED_USER" not in api.last_error:
-            print(f"[Launch Game] Warning: Could not create user: {api.last_error}")
-            # Não bloquear - tentar lançar mesmo assim (usuário pode já existir)
+    # 1. Garantir que o usuário existe no IGameWin (user_create só se ainda não foi registrado no agente)
+    if not await igamewin_users.ensure_registered(api, current_user):
+        # Não bloquear - tentar lançar mesmo assim (usuário pode já existir)
+        print(f"[Launch Game] Warning: Could not create user: {api.last_error}")
     
     # 2. Modo Seamless - não fazer transferências
     # O saldo sempre fica no nosso banco e o IGameWin chama nosso /gold_api
@@ -1671,39 +1676,41 @@ async def launch_game(
     print(f"[Launch Game] Saldo permanece no nosso banco: R$ {current_user.balance:.2f}")
     
     # Gerar URL de lançamento do jogo usando user_code (username)
-    # Implementar retry logic para lidar com problemas de rede temporários
+    # Tentativas curtas com jitter só para erros transitórios, dentro de um prazo total; com o
+    # circuito do game_launch aberto (IGameWin degradada) a falha é imediata
     print(f"[Launch Game] Request - game_code={game_code}, provider_code={provider_code}, user={current_user.username}")
     
-    max_retries = 3
-    launch_url = None
-    last_error = None
-    
-    for attempt in range(1, max_retries + 1):
-        print(f"[Launch Game] Tentativa {attempt}/{max_retries} de lançar o jogo...")
-        launch_url = await api.launch_game(
-            user_code=current_user.username,
-            game_code=game_code,
-            provider_code=provider_code,
-            lang=lang
-        )
-        
-        if launch_url:
-            print(f"[Launch Game] ✅ Sucesso na tentativa {attempt}")
-            break
-        
-        last_error = api.last_error or 'Erro desconhecido'
-        print(f"[Launch Game] ❌ Falha na tentativa {attempt}: {last_error}")
-        
-        # Se não for a última tentativa, aguardar antes de tentar novamente
-        if attempt < max_retries:
-            import asyncio
-            wait_time = attempt * 2  # 2s, 4s, 6s...
-            print(f"[Launch Game] Aguardando {wait_time}s antes da próxima tentativa...")
-            await asyncio.sleep(wait_time)
+    launch_url = await api.launch_game_with_retries(
+        user_code=current_user.username,
+        game_code=game_code,
+        provider_code=provider_code,
+        lang=lang
+    )
+    
+    # Marca de registro desatualizada (agente resetado, usuário apagado no IGameWin): registrar de novo uma vez
+    if not launch_url and igamewin_users.is_user_not_found(api.last_error):
+        if await igamewin_users.reregister(api, current_user):
+            launch_url = await api.launch_game_with_retries(
+                user_code=current_user.username,
+                game_code=game_code,
+                provider_code=provider_code,
+                lang=lang
+            )
     
     if not launch_url:
-        error_detail = last_error or 'Erro desconhecido após múltiplas tentativas'
-        print(f"[Launch Game] Failed após {max_retries} tentativas - {error_detail}")
+        error_detail = api.last_error or 'Erro desconhecido'
+        print(f"[Launch Game] Failed - {error_detail}")
+        
+        if error_detail.startswith(igamewin_api.CIRCUIT_OPEN_ERROR):
+            retry_after = igamewin_api.breaker_for("game_launch").retry_after()
+            raise HTTPException(
+                status_code=503,
+                detail=(
+                    "O servidor de jogos está instável no momento. "
+                    "Por favor, tente novamente em alguns instantes."
+                ),
+                headers={"Retry-After": str(max(int(retry_after + 0.999), 1))}
+            )
         
         # Mensagens de erro mais específicas
         if "ERROR_GET_BALANCE_END_POINT" in error_detail:
@@ -1743,7 +1750,7 @@ async def launch_game(
         
         raise HTTPException(
             status_code=502,
-            detail=f"Não foi possível iniciar o jogo após {max_retries} tentativas. {error_detail}. "
+            detail=f"Não foi possível iniciar o jogo. {error_detail}. "
                    "Por favor, tente novamente em alguns instantes ou entre em contato com o suporte."
         )
     
@@ -1777,10 +1784,6 @@ async def launch_game(
     }
 
 
-# Cache para rastrear chamadas ao /gold_api (para debug/logging)
-# Formato: {username: timestamp}
-_gold_api_calls: Dict[str, float] = {}
-
 @public_router.post("/games/sync-balance")
 async def sync_balance_from_igamewin(
     for_withdrawal: bool = Query(False, description="Parâmetro não utilizado - mantido para compatibilidade"),
@@ -2718,12 +2721,14 @@ async def create_provider_order(
         existing.display_order = order_data.display_order
         existing.is_priority = order_data.is_priority
         db.commit()
+        _catalog_overrides_changed(db)
         db.refresh(existing)
         return existing
     
     order = ProviderOrder(**order_data.dict())
     db.add(order)
     db.commit()
+    _catalog_overrides_changed(db)
     db.refresh(order)
     return order
 
@@ -2747,6 +2752,7 @@ async def update_provider_orders_bulk(
             db.add(new_order)
             updated.append(new_order)
     db.commit()
+    _catalog_overrides_changed(db)
     for order in updated:
         db.refresh(order)
     return updated
@@ -2763,6 +2769,7 @@ async def delete_provider_order(
     if order:
         db.delete(order)
         db.commit()
+        _catalog_overrides_changed(db)
 
 
 # ========== TRACKING CONFIG ==========
@@ -3018,7 +3025,7 @@ async def mark_notification_as_read(
 
 # Endpoint também na raiz (/gold_api) - IGameWin espera neste caminho
 @root_router.post("/gold_api")
-async def igamewin_gold_api_root(request: Request, db: Session = Depends(get_db)):
+async def igamewin_gold_api_root(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Endpoint /gold_api na raiz para IGameWin"""
     print(f"[Gold API Root] ===== REQUEST RECEIVED AT /gold_api =====")
     return await igamewin_gold_api(request, db)
@@ -3085,31 +3092,69 @@ async def seamless_diagnostics(
 
 # Endpoint também em /api/gold_api para garantir compatibilidade
 @public_router.post("/gold_api")
-async def igamewin_gold_api_public(request: Request, db: Session = Depends(get_db)):
+async def igamewin_gold_api_public(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Endpoint /api/public/gold_api para compatibilidade"""
     print(f"[Gold API Public] ===== REQUEST RECEIVED AT /api/public/gold_api =====")
     return await igamewin_gold_api(request, db)
 
 # Endpoint também em /api/admin/gold_api para garantir acesso via api.luxbet.site
 @router.post("/gold_api")
-async def igamewin_gold_api_admin(request: Request, db: Session = Depends(get_db)):
+async def igamewin_gold_api_admin(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Endpoint /api/admin/gold_api - redireciona para função principal"""
     print(f"[Gold API Admin] ===== REQUEST RECEIVED AT /api/admin/gold_api =====")
     return await igamewin_gold_api(request, db)
 
 # Função principal que contém a lógica do endpoint /gold_api
 # Esta função NÃO tem decorador - ela é chamada pelos endpoints acima
-async def igamewin_gold_api(request: Request, db: Session = Depends(get_db)):
+async def igamewin_gold_api(request: Request, db: AsyncSession):
+    """Processa a chamada e registra as métricas do /gold_api (método, txn_type, código de erro)."""
+    started = time.perf_counter()
+    response = await _igamewin_gold_api(request, db)
+    try:
+        data = await request.json()  # Já lido acima (Starlette guarda o corpo): sem novo parse do stream
+    except Exception:
+        data = {}
+    method = data.get("method") if isinstance(data, dict) else None
+    slot = data.get("slot") if isinstance(data, dict) else None
+    txn_type = slot.get("txn_type", "debit_credit") if method == "transaction" and isinstance(slot, dict) else None
+    metrics.observe_gold_api(method, txn_type, response, time.perf_counter() - started)
+    return response
+
+
+async def _igamewin_gold_api(request: Request, db: AsyncSession):
     """
     Endpoint para modo Seamless do IGameWin.
     Implementa os métodos: user_balance e transaction
+    Usa a sessão assíncrona: as queries do /gold_api não bloqueiam o event loop.
     """
-    # Log MUITO VISÍVEL no início para garantir que capturamos todas as chamadas
-    print("\n" + "="*80)
-    print("[Gold API] ⚡⚡⚡ CHAMADA RECEBIDA NO /gold_api ⚡⚡⚡")
-    print("="*80 + "\n")
-    
     try:
+        data = await request.json()
+        method = data.get("method")
+        agent_code = data.get("agent_code")
+        agent_secret = data.get("agent_secret")
+        
+        # Caminho rápido do polling de saldo (chamada mais frequente): sem banners nem dump de headers
+        if method == "user_balance":
+            agent = await agent_cache.get_agent(agent_code)
+            if not agent:
+                print(f"[Gold API] Agent not found: {agent_code}")
+                return {
+                    "status": 0,
+                    "msg": "INVALID_AGENT"
+                }
+            if not agent_cache.verify_secret(agent, agent_secret):
+                print(f"[Gold API] Invalid agent_secret for agent: {agent_code}")
+                return {
+                    "status": 0,
+                    "msg": "INVALID_SECRET"
+                }
+            return await _handle_user_balance(data, agent, db)
+        
+        # Log MUITO VISÍVEL no início para garantir que capturamos todas as chamadas
+        print("\n" + "="*80)
+        print("[Gold API] ⚡⚡⚡ CHAMADA RECEBIDA NO /gold_api ⚡⚡⚡")
+        print("="*80 + "\n")
+        
         # Log da requisição recebida
         client_host = request.client.host if request.client else "unknown"
         user_agent = request.headers.get("User-Agent", "")
@@ -3118,26 +3163,11 @@ async def igamewin_gold_api(request: Request, db: Session = Depends(get_db)):
         print(f"[Gold API] User-Agent: {user_agent[:150] or '(vazio)'}")
         print(f"[Gold API] Headers: {dict(request.headers)}")
         
-        data = await request.json()
-        method = data.get("method")
-        agent_code = data.get("agent_code")
-        agent_secret = data.get("agent_secret")
-        user_code = data.get("user_code")
-        
-        # Registrar chamada ao /gold_api para detectar Seamless Mode
-        if user_code:
-            import time
-            _gold_api_calls[user_code] = time.time()
-            print(f"[Gold API] ✅ Chamada ao /gold_api registrada para usuário {user_code} - Seamless Mode confirmado")
-        
         print(f"[Gold API] Method: {method}, Agent Code: {agent_code}")
         print(f"[Gold API] Full payload: {json.dumps({**data, 'agent_secret': '***' if agent_secret else None})}")
         
-        # Validar credenciais do agente
-        agent = db.query(IGameWinAgent).filter(
-            IGameWinAgent.agent_code == agent_code,
-            IGameWinAgent.is_active == True
-        ).first()
+        # Validar credenciais do agente (snapshot em memória, sem round trip ao banco)
+        agent = await agent_cache.get_agent(agent_code)
         
         if not agent:
             print(f"[Gold API] Agent not found: {agent_code}")
@@ -3146,29 +3176,16 @@ async def igamewin_gold_api(request: Request, db: Session = Depends(get_db)):
                 "msg": "INVALID_AGENT"
             }
         
-        # Verificar agent_secret
-        # O agent_secret pode estar em credentials ou ser o mesmo que agent_key
-        credentials_dict = {}
-        if agent.credentials:
-            try:
-                credentials_dict = json.loads(agent.credentials)
-            except Exception:
-                pass
-        
         # agent_secret pode estar em credentials ou ser o mesmo que agent_key
-        expected_secret = credentials_dict.get("agent_secret") or agent.agent_key
-        
-        if agent_secret != expected_secret:
+        if not agent_cache.verify_secret(agent, agent_secret):
             print(f"[Gold API] Invalid agent_secret for agent: {agent_code}")
             return {
                 "status": 0,
                 "msg": "INVALID_SECRET"
             }
         
-        # Processar métodos
-        if method == "user_balance":
-            return await _handle_user_balance(data, agent, db)
-        elif method == "transaction":
+        # Processar métodos (user_balance é tratado no caminho rápido acima)
+        if method == "transaction":
             return await _handle_transaction(data, agent, db)
         else:
             return {
@@ -3187,16 +3204,13 @@ async def igamewin_gold_api(request: Request, db: Session = Depends(get_db)):
         }
 
 
-async def _handle_user_balance(data: Dict[str, Any], agent: IGameWinAgent, db: Session) -> Dict[str, Any]:
+async def _handle_user_balance(data: Dict[str, Any], agent: agent_cache.CachedAgent, db: AsyncSession) -> Dict[str, Any]:
     """Handle user_balance method - retorna saldo do usuário
     
     IMPORTANTE: Em Seamless Mode, o IGameWin usa este saldo como fonte da verdade.
     O saldo retornado aqui é o que aparece no jogo.
+    Servido do cache de saldo (balance_cache) quando possível; o banco só é lido em miss.
     """
-    print("\n" + "="*80)
-    print("[Gold API] 💰💰💰 USER_BALANCE REQUEST 💰💰💰")
-    print("="*80 + "\n")
-    
     user_code = data.get("user_code")
     
     if not user_code:
@@ -3206,12 +3220,23 @@ async def _handle_user_balance(data: Dict[str, Any], agent: IGameWinAgent, db: S
             "msg": "INVALID_PARAMETER"
         }
     
-    print(f"[Gold API] Getting balance for user: {user_code}")
+    balance = balance_cache.get(user_code)
+    if balance is not None:
+        return {
+            "status": 1,
+            "user_balance": balance
+        }
     
-    # Buscar usuário pelo username (user_code)
-    user = db.query(User).filter(User.username == user_code).first()
+    # Buscar usuário pelo username (user_code), com a versão do saldo (última entrada do ledger)
+    # lida no mesmo statement: o balance_cache recusa o put se um commit posterior já invalidou
+    ledger_version = (
+        select(func.max(WalletEntry.id)).where(WalletEntry.user_id == User.id).scalar_subquery()
+    )
+    row = (await db.execute(
+        select(User.id, User.balance, ledger_version.label("version")).where(User.username == user_code)
+    )).first()
     
-    if not user:
+    if not row:
         print(f"[Gold API] User not found: {user_code}")
         return {
             "status": 0,
@@ -3223,15 +3248,9 @@ async def _handle_user_balance(data: Dict[str, Any], agent: IGameWinAgent, db: S
     # O IGameWin usa este valor como fonte da verdade para o jogo
     # NOTA: IGameWin pode esperar valores em centavos (multiplicar por 100) ou reais
     # Verificar documentação: se espera centavos, fazer: balance = float(user.balance) * 100
-    balance = float(user.balance)
-    
-    # Log detalhado para debug
-    print(f"[Gold API] ===== USER BALANCE REQUEST =====")
-    print(f"[Gold API] User: {user_code}")
-    print(f"[Gold API] Balance in DB (reais): {user.balance}")
-    print(f"[Gold API] Balance being returned: {balance}")
-    print(f"[Gold API] This balance will be used by IGameWin as the game balance")
-    print(f"[Gold API] =================================")
+    balance = float(row.balance)
+    balance_cache.put(user_code, row.id, balance, row.version or 0)
+    print(f"[Gold API] user_balance (cache miss) - user={user_code}, balance={balance}")
     
     return {
         "status": 1,
@@ -3239,15 +3258,18 @@ async def _handle_user_balance(data: Dict[str, Any], agent: IGameWinAgent, db: S
     }
 
 
-async def _handle_transaction(data: Dict[str, Any], agent: IGameWinAgent, db: Session) -> Dict[str, Any]:
-    """Handle transaction method - registra transação de jogo"""
+async def _handle_transaction(data: Dict[str, Any], agent: agent_cache.CachedAgent, db: AsyncSession) -> Dict[str, Any]:
+    """Handle transaction method - registra transação de jogo
+
+    O saldo é alterado pelo motor de carteira (wallet.py) em um único UPDATE ... RETURNING,
+    sem carregar o usuário antes nem reler depois. As funções síncronas de carteira/journal/ledger
+    rodam na sessão assíncrona via run_sync (mesma transação, I/O sem bloquear o event loop).
+    """
     print("\n" + "="*80)
     print("[Gold API] 💸💸💸 TRANSACTION REQUEST 💸💸💸")
     print("="*80 + "\n")
     
     user_code = data.get("user_code")
-    user_balance = data.get("user_balance")
-    agent_balance = data.get("agent_balance")
     game_type = data.get("game_type")
     
     if not user_code:
@@ -3258,15 +3280,6 @@ async def _handle_transaction(data: Dict[str, Any], agent: IGameWinAgent, db: Se
     
     print(f"[Gold API] Processing transaction - user={user_code}, game_type={game_type}")
     
-    # Buscar usuário
-    user = db.query(User).filter(User.username == user_code).first()
-    
-    if not user:
-        return {
-            "status": 0,
-            "msg": "INVALID_USER"
-        }
-    
     # Processar transação baseado no tipo de jogo
     if game_type == "slot":
         slot_data = data.get("slot", {})
@@ -3277,169 +3290,118 @@ async def _handle_transaction(data: Dict[str, Any], agent: IGameWinAgent, db: Se
         provider_code = slot_data.get("provider_code")
         game_code = slot_data.get("game_code")
         game_type_detail = slot_data.get("type", "BASE")
+        # Converter txn_id para string (external_id é VARCHAR no banco)
+        txn_id_str = str(txn_id) if txn_id else None
         
         print(f"[Gold API] Slot transaction - txn_type={txn_type}, bet={bet_money}, win={win_money}, txn_id={txn_id}")
-        print(f"[Gold API] Current balance before transaction: {user.balance}")
+        
+        # Retry do IGameWin: devolver a resposta já gravada, sem tocar no saldo nem em bets
+        if txn_id_str:
+            replay = await db.run_sync(wallet_journal.lookup, agent.agent_code, txn_id_str, txn_type)
+            if replay is not None:
+                print(f"[Gold API] Retry detectado para txn_id={txn_id_str} ({txn_type}) - devolvendo resposta gravada")
+                return replay
         
         # Calcular novo saldo baseado no tipo de transação
         if txn_type == "debit":
-            # Apenas aposta (debitar)
-            # Reduzir primeiro do bonus_balance se houver, depois do balance
-            db.refresh(user)
-            bonus_balance = float(user.bonus_balance) if hasattr(user, 'bonus_balance') else 0.0
-            total_balance = float(user.balance)
-            
-            # Reduzir primeiro do bonus_balance
-            remaining_bet = bet_money
-            if bonus_balance > 0:
-                if bonus_balance >= remaining_bet:
-                    # Todo o valor da aposta vem do bônus
-                    user.bonus_balance -= remaining_bet
-                    remaining_bet = 0
-                else:
-                    # Parte vem do bônus, parte do saldo real
-                    remaining_bet -= bonus_balance
-                    user.bonus_balance = 0.0
-            
-            # Reduzir o restante do balance
-            if remaining_bet > 0:
-                new_balance = total_balance - remaining_bet
-                if new_balance < 0:
-                    print(f"[Gold API] Insufficient funds - current: {total_balance}, bonus: {bonus_balance}, bet: {bet_money}")
-                    return {
-                        "status": 0,
-                        "user_balance": total_balance,
-                        "msg": "INSUFFICIENT_USER_FUNDS"
-                    }
-                user.balance = new_balance
-            
-            print(f"[Gold API] Debit applied - bet: {bet_money}, bonus used: {min(bonus_balance, bet_money):.2f}, balance used: {remaining_bet:.2f}, new balance: {user.balance}, new bonus: {user.bonus_balance}")
-            
-            # Criar registro de aposta
-            # Converter txn_id para string (external_id é VARCHAR no banco)
-            txn_id_str = str(txn_id) if txn_id else None
-            bet = Bet(
-                user_id=user.id,
-                game_id=game_code,
-                game_name=game_code,  # Pode ser melhorado buscando nome do jogo
-                provider=provider_code or "IGameWin",
-                amount=bet_money,
-                win_amount=0.0,
-                status=BetStatus.PENDING,
-                transaction_id=txn_id_str or str(uuid.uuid4()),
-                external_id=txn_id_str,
-                metadata_json=json.dumps({
-                    "txn_type": txn_type,
-                    "game_type": game_type_detail,
-                    "provider_code": provider_code,
-                    "game_code": game_code
-                })
-            )
-            db.add(bet)
-            reduce_bonus_wagering_remaining(user, bet_money)
-            
+            # Apenas aposta: reduz primeiro do bonus_balance, depois do balance
+            result = await db.run_sync(wallet.debit, user_code, bet_money)
         elif txn_type == "credit":
-            # Apenas ganho (creditar)
-            # Ganhos são sempre sacáveis - adicionar apenas ao balance
-            db.refresh(user)
-            new_balance = user.balance + win_money
-            user.balance = new_balance
-            print(f"[Gold API] Credit applied - win: {win_money}, new balance: {user.balance} (ganhos são sempre sacáveis)")
-            
-            # Atualizar aposta existente se houver
-            # Converter txn_id para string para comparação (external_id é VARCHAR)
-            if txn_id:
-                txn_id_str = str(txn_id)
-                bet = db.query(Bet).filter(Bet.external_id == txn_id_str).first()
-                if bet:
-                    bet.win_amount = win_money
-                    bet.status = BetStatus.WON if win_money > 0 else BetStatus.LOST
-                    bet.updated_at = datetime.utcnow()
-            
+            # Apenas ganho: ganhos são sempre sacáveis - adiciona apenas ao balance
+            result = await db.run_sync(wallet.credit, user_code, win_money)
         elif txn_type == "debit_credit":
             # Aposta e ganho juntos
-            # Reduzir primeiro do bonus_balance se houver, depois do balance
-            # Ganhos são sempre sacáveis - adicionar apenas ao balance
-            db.refresh(user)
-            bonus_balance = float(user.bonus_balance) if hasattr(user, 'bonus_balance') else 0.0
-            total_balance = float(user.balance)
-            
-            # Reduzir primeiro do bonus_balance
-            remaining_bet = bet_money
-            if bonus_balance > 0:
-                if bonus_balance >= remaining_bet:
-                    # Todo o valor da aposta vem do bônus
-                    user.bonus_balance -= remaining_bet
-                    remaining_bet = 0
-                else:
-                    # Parte vem do bônus, parte do saldo real
-                    remaining_bet -= bonus_balance
-                    user.bonus_balance = 0.0
-            
-            # Verificar se tem saldo suficiente
-            if total_balance < remaining_bet:
-                print(f"[Gold API] Insufficient funds - current: {total_balance}, bonus: {bonus_balance}, bet: {bet_money}")
+            result = await db.run_sync(wallet.debit_credit, user_code, bet_money, win_money)
+        else:
+            # txn_type desconhecido: nenhuma alteração, apenas devolve o saldo atual
+            result = await db.run_sync(wallet.credit, user_code, 0.0)
+        
+        if not result.ok:
+            await db.rollback()
+            if result.error == wallet.INSUFFICIENT_USER_FUNDS:
+                print(f"[Gold API] Insufficient funds - current: {result.balance}, bonus: {result.bonus_balance}, bet: {bet_money}")
                 return {
                     "status": 0,
-                    "user_balance": total_balance,
+                    "user_balance": result.balance,
                     "msg": "INSUFFICIENT_USER_FUNDS"
                 }
-            
-            # Reduzir o restante do balance e adicionar ganho
-            new_balance = total_balance - remaining_bet + win_money
-            user.balance = new_balance
-            
-            print(f"[Gold API] Debit+Credit applied - bet: {bet_money}, win: {win_money}, bonus used: {min(bonus_balance, bet_money):.2f}, balance used: {remaining_bet:.2f}, new balance: {user.balance}, new bonus: {user.bonus_balance}")
-            
-            # Criar ou atualizar registro de aposta
-            # Converter txn_id para string (external_id é VARCHAR no banco)
-            if txn_id:
-                txn_id_str = str(txn_id)
-                bet = db.query(Bet).filter(Bet.external_id == txn_id_str).first()
-                if bet:
-                    bet.win_amount = win_money
-                    bet.status = BetStatus.WON if win_money > bet_money else BetStatus.LOST
-                    bet.updated_at = datetime.utcnow()
-                else:
-                    bet = Bet(
-                        user_id=user.id,
-                        game_id=game_code,
-                        game_name=game_code,
-                        provider=provider_code or "IGameWin",
-                        amount=bet_money,
-                        win_amount=win_money,
-                        status=BetStatus.WON if win_money > bet_money else BetStatus.LOST,
-                        transaction_id=txn_id_str or str(uuid.uuid4()),
-                        external_id=txn_id_str,
-                        metadata_json=json.dumps({
-                            "txn_type": txn_type,
-                            "game_type": game_type_detail,
-                            "provider_code": provider_code,
-                            "game_code": game_code
-                        })
-                    )
-                    db.add(bet)
-            reduce_bonus_wagering_remaining(user, bet_money)
-        
-        db.commit()
-        db.refresh(user)  # Garantir que temos o valor atualizado
-        
-        final_balance = float(user.balance)
+            return {
+                "status": 0,
+                "msg": result.error
+            }
         
-        # Log detalhado para debug
-        print(f"[Gold API] ===== TRANSACTION PROCESSED =====")
-        print(f"[Gold API] User: {user_code}")
-        print(f"[Gold API] Transaction type: {txn_type}")
-        print(f"[Gold API] Bet: {bet_money}, Win: {win_money}")
-        print(f"[Gold API] Final balance in DB (reais): {user.balance}")
-        print(f"[Gold API] Final balance being returned: {final_balance}")
-        print(f"[Gold API] This balance ({final_balance}) is now the source of truth for the game")
-        print(f"[Gold API] ===================================")
+        print(f"[Gold API] {txn_type} applied - bet: {bet_money}, win: {win_money}, new balance: {result.balance}, new bonus: {result.bonus_balance}")
+
+        # Ledger da carteira: mesmas variações aplicadas pelo UPDATE, no mesmo commit
+        ledger_entries = []
+        if txn_type in ("debit", "debit_credit"):
+            ledger_entries.append(await db.run_sync(
+                wallet_ledger.record, result.user_id, wallet_ledger.KIND_BET,
+                -(max(bet_money, 0.0) - result.bonus_used), -result.bonus_used, txn_id_str,
+            ))
+        if txn_type in ("credit", "debit_credit"):
+            ledger_entries.append(await db.run_sync(
+                wallet_ledger.record, result.user_id, wallet_ledger.KIND_WIN, max(win_money, 0.0), 0.0, txn_id_str,
+            ))
+
+        # Registro da aposta: gravado em lote pelo write-behind (bet_writer) após o commit do saldo
+        bet_metadata = {
+            "txn_type": txn_type,
+            "game_type": game_type_detail,
+            "provider_code": provider_code,
+            "game_code": game_code
+        }
+        bet_record = None
+        # Chave do journal: o txn_id do provider; débito sem txn_id usa o id gerado para a aposta
+        # (sem idempotência para retries, mas a aposta enfileirada sobrevive a um crash)
+        journal_txn_id = txn_id_str
+        if txn_type == "debit":
+            journal_txn_id = txn_id_str or str(uuid.uuid4())
+            bet_record = bet_writer.make_record(
+                bet_writer.OP_INSERT, result.user_id, txn_id_str, game_code, provider_code,
+                bet_money, 0.0, BetStatus.PENDING, journal_txn_id, bet_metadata
+            )
+        elif txn_id_str and txn_type in ("credit", "debit_credit"):
+            won = win_money > 0 if txn_type == "credit" else win_money > bet_money
+            op = bet_writer.OP_SETTLE if txn_type == "credit" else bet_writer.OP_UPSERT
+            bet_record = bet_writer.make_record(
+                op, result.user_id, txn_id_str, game_code, provider_code,
+                bet_money, win_money, BetStatus.WON if won else BetStatus.LOST, txn_id_str, bet_metadata
+            )
         
-        return {
+        response = {
             "status": 1,
-            "user_balance": final_balance
+            "user_balance": result.balance
         }
+        journal_id = None
+        if journal_txn_id:
+            entry = await db.run_sync(wallet_journal.record, agent.agent_code, journal_txn_id, txn_type, user_code, response, bet_record)
+        try:
+            await db.flush()
+            if journal_txn_id:
+                journal_id = entry.id
+            # Versão do saldo no cache: id da última entrada do ledger, alocado com a linha travada
+            balance_version = max((e.id for e in ledger_entries if e is not None), default=None)
+            await db.commit()
+        except IntegrityError:
+            # Retry concorrente já gravou esta transação: desfaz a nossa e devolve a resposta dele
+            await db.rollback()
+            replay = await db.run_sync(wallet_journal.lookup, agent.agent_code, txn_id_str, txn_type) if txn_id_str else None
+            if replay is None:
+                raise
+            print(f"[Gold API] Retry concorrente para txn_id={txn_id_str} ({txn_type}) - devolvendo resposta gravada")
+            return replay
+        # Write-through: o próximo user_balance deste usuário não precisa ir ao banco
+        # (sem entrada no ledger o saldo não mudou e o cache continua válido)
+        if balance_version is not None:
+            balance_cache.put(user_code, result.user_id, result.balance, balance_version)
+        
+        if bet_record is not None:
+            await bet_writer.enqueue(bet_record, journal_id)
+        
+        print(f"[Gold API] ===== TRANSACTION PROCESSED ===== user={user_code} type={txn_type} final_balance={result.balance}")
+        
+        return response
     
     else:
         # Outros tipos de jogo (pode ser expandido)
@@ -3449,6 +3411,122 @@ async def _handle_transaction(data: Dict[str, Any], agent: IGameWinAgent, db: Se
         }
 
 
+@router.get("/bet-writer/stats")
+async def get_bet_writer_stats(current_user: User = Depends(get_current_admin_user)):
+    """Métricas do write-behind de apostas do /gold_api (fila, lotes, falhas, backpressure)"""
+    return bet_writer.stats()
+
+
+@router.get("/balance-cache/stats")
+async def get_balance_cache_stats(current_user: User = Depends(get_current_admin_user)):
+    """Acertos/erros do cache de saldo usado pelo user_balance do /gold_api"""
+    return balance_cache.stats()
+
+
+@router.get("/igamewin/http-stats")
+async def get_igamewin_http_stats(current_user: User = Depends(get_current_admin_user)):
+    """Chamadas à IGameWin pelo cliente HTTP compartilhado (erros e reaproveitamento de conexões)"""
+    return igamewin_api.http_stats()
+
+
+@router.get("/igamewin/user-registrations/stats")
+async def get_igamewin_user_registration_stats(current_user: User = Depends(get_current_admin_user)):
+    """Registros de usuários no IGameWin: launches sem user_create, registros, falhas"""
+    return igamewin_users.stats()
+
+
+@router.get("/memory-caches/stats")
+async def get_memory_cache_stats(current_user: User = Depends(get_current_admin_user)):
+    """Entradas, memória estimada, acertos/erros e descartes dos caches em memória"""
+    return memory_cache.stats()
+
+
+@router.get("/game-search/stats")
+async def get_game_search_stats(current_user: User = Depends(get_current_admin_user)):
+    """Tamanho do índice de busca de jogos e tempo médio das buscas"""
+    return game_search.stats()
+
+
+@router.get("/igamewin/circuit-breakers")
+async def get_igamewin_circuit_breakers(current_user: User = Depends(get_current_admin_user)):
+    """Estado dos circuit breakers por método da IGameWin (janela, taxa de erro, recusas)"""
+    return circuit_breaker.stats()
+
+
+@router.get("/game-popularity/stats")
+async def get_game_popularity_stats(current_user: User = Depends(get_current_admin_user)):
+    """Contadores da popularidade dos jogos e os mais apostados (valor) nas últimas 24h"""
+    return {**game_popularity.stats(), "top_wagered_24h": game_popularity.ranking("24h", "wagered")[:10]}
+
+
+@router.get("/thumbnails/stats")
+async def get_thumbnail_stats(current_user: User = Depends(get_current_admin_user)):
+    """Pacote de miniaturas carregado (arquivos, imagens distintas, tamanho) e respostas servidas"""
+    return thumbnail_pack.stats()
+
+
+@router.get("/catalog-overrides/stats")
+async def get_catalog_overrides_stats(current_user: User = Depends(get_current_admin_user)):
+    """Snapshot de customizações de jogos e ordem de provedores aplicado ao catálogo"""
+    return {**catalog_overrides.stats(), "catalog_revision": game_catalog.get_catalog().revision}
+
+
+@router.get("/admission/stats")
+async def get_admission_stats(current_user: User = Depends(get_current_admin_user)):
+    """Controle de admissão por classe de carga (vagas em uso, fila, requisições rejeitadas)"""
+    return admission.stats()
+
+
+# ========== LEDGER DA CARTEIRA ==========
+@router.get("/users/{user_id}/wallet/statement")
+async def get_user_wallet_statement(
+    user_id: int,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[int] = Query(None, ge=1),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Extrato da carteira do usuário (ledger), paginado por cursor"""
+    return wallet_ledger.statement(db, user_id, limit=limit, cursor=cursor)
+
+
+@router.get("/users/{user_id}/wallet/balance-at")
+async def get_user_balance_at(
+    user_id: int,
+    at: datetime = Query(..., description="Instante (ISO 8601, UTC)"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Saldo do usuário em um instante passado (snapshot + cauda do ledger)"""
+    if at.tzinfo is not None:
+        at = at.astimezone(timezone.utc).replace(tzinfo=None)
+    return wallet_ledger.balance_at(db, user_id, at)
+
+
+@router.get("/users/{user_id}/wallet/audit")
+async def audit_user_wallet(
+    user_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Compara o saldo reconstruído pelo ledger com users.balance / users.bonus_balance"""
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    ledger = wallet_ledger.balance_at(db, user_id, datetime.utcnow())
+    balance = round(float(user.balance or 0.0), 2)
+    bonus_balance = round(float(user.bonus_balance or 0.0), 2)
+    return {
+        "user_id": user_id,
+        "balance": balance,
+        "bonus_balance": bonus_balance,
+        "ledger": ledger,
+        "balance_diff": round(balance - ledger["balance"], 2),
+        "bonus_diff": round(bonus_balance - ledger["bonus_balance"], 2),
+        "consistent": abs(balance - ledger["balance"]) < 0.01 and abs(bonus_balance - ledger["bonus_balance"]) < 0.01,
+    }
+
+
 # ========== SINCRONIZAÇÃO DE SALDO ==========
 @public_router.post("/sync-balance")
 async def sync_balance(
@@ -3517,9 +3595,8 @@ async def create_game_customization(
         existing.updated_at = datetime.utcnow()
         db.commit()
         db.refresh(existing)
-        # Limpar cache de games para refletir mudanças
-        _clear_cache("games")
-        _clear_cache("all_games")
+        # Limpar listas de jogos montadas do catálogo para refletir mudanças
+        _catalog_overrides_changed(db)
         return existing
     else:
         # Criar novo
@@ -3527,9 +3604,8 @@ async def create_game_customization(
         db.add(customization)
         db.commit()
         db.refresh(customization)
-        # Limpar cache de games para refletir mudanças
-        _clear_cache("games")
-        _clear_cache("all_games")
+        # Limpar listas de jogos montadas do catálogo para refletir mudanças
+        _catalog_overrides_changed(db)
         return customization
 
 
@@ -3553,9 +3629,8 @@ async def update_game_customization(
     
     db.commit()
     db.refresh(customization)
-    # Limpar cache de games para refletir mudanças
-    _clear_cache("games")
-    _clear_cache("all_games")
+    # Limpar listas de jogos montadas do catálogo para refletir mudanças
+    _catalog_overrides_changed(db)
     return customization
 
 
@@ -3572,7 +3647,6 @@ async def delete_game_customization(
     
     db.delete(customization)
     db.commit()
-    # Limpar cache de games para refletir mudanças
-    _clear_cache("games")
-    _clear_cache("all_games")
+    # Limpar listas de jogos montadas do catálogo para refletir mudanças
+    _catalog_overrides_changed(db)
     return None
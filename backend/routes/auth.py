@@ -1,16 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Request, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import desc
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from typing import List, Optional
 from database import get_db
 from schemas import LoginRequest, Token, UserResponse, UserCreate
 from auth import authenticate_user, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, get_password_hash, get_user_by_username
-from dependencies import get_current_user
+from dependencies import get_current_user, get_current_user_async
 from models import User, UserRole, Affiliate, Deposit, Withdrawal, Bet, TransactionStatus, BetStatus
 from igamewin_api import get_igamewin_api
+import igamewin_users
+import wallet_ledger
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
@@ -21,7 +23,7 @@ def get_limiter(request: Request):
 
 
 @router.post("/register", response_model=UserResponse)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     # Verificar se username já existe
     if get_user_by_username(db, user_data.username):
         raise HTTPException(
@@ -90,6 +92,9 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
             aff.total_referrals = (aff.total_referrals or 0) + 1
             db.commit()
     
+    # Registrar no IGameWin após a resposta, para o primeiro launch não precisar do user_create
+    background_tasks.add_task(igamewin_users.register_in_background, new_user.id)
+    
     return new_user
 
 
@@ -128,15 +133,13 @@ async def login(request: Request, login_data: LoginRequest, db: Session = Depend
 
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user_async)
 ):
     """
     Retorna informações do usuário logado.
     Sempre retorna os dados mais atualizados do banco de dados.
     """
-    # Garantir que temos os dados mais atualizados do banco
-    db.refresh(current_user)
+    # O usuário acabou de ser carregado pela sessão assíncrona: os dados já são os mais atuais
     
     # Log para debug - verificar saldo retornado
     print(f"[Auth /me] User: {current_user.username}, Balance: {current_user.balance}")
@@ -181,6 +184,34 @@ async def get_available_balance(
     }
 
 
+# ========== EXTRATO DA CARTEIRA ==========
+
+@router.get("/wallet/statement")
+async def get_my_wallet_statement(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[int] = Query(None, ge=1),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Extrato da carteira (ledger), mais recente primeiro.
+    Paginação por cursor: envie o `next_cursor` da resposta anterior para obter a próxima página.
+    """
+    return wallet_ledger.statement(db, current_user.id, limit=limit, cursor=cursor)
+
+
+@router.get("/wallet/balance-at")
+async def get_my_balance_at(
+    at: datetime = Query(..., description="Instante (ISO 8601, UTC)"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Saldo da carteira em um instante passado (snapshot + entradas do ledger até `at`)"""
+    if at.tzinfo is not None:
+        at = at.astimezone(timezone.utc).replace(tzinfo=None)
+    return wallet_ledger.balance_at(db, current_user.id, at)
+
+
 # ========== HISTÓRICO DE TRANSAÇÕES ==========
 
 @router.get("/transactions")
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request, Response, status
 from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func
@@ -11,6 +11,7 @@ from pathlib import Path
 from database import get_db
 from dependencies import get_current_admin_user
 from models import User, MediaAsset, MediaType
+import thumbnail_pack
 
 router = APIRouter(prefix="/api/admin/media", tags=["media"])
 public_router = APIRouter(prefix="/api/public/media", tags=["public-media"])
@@ -318,3 +319,20 @@ async def serve_uploaded_file(media_type: str, filename: str):
         file_path,
         media_type="image/jpeg"  # FastAPI vai detectar automaticamente
     )
+
+
+@public_router.get("/thumbnails/{filename}")
+async def serve_thumbnail(filename: str, request: Request):
+    """Miniatura de jogo do pacote (URL com o hash do conteúdo: ETag forte e cache imutável)"""
+    digest, _, extension = filename.partition(".")
+    body = thumbnail_pack.lookup(digest) if "." + extension == thumbnail_pack.EXTENSION else None
+    if body is None:
+        raise HTTPException(status_code=404, detail="Miniatura não encontrada")
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": thumbnail_pack.CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+        thumbnail_pack.record_served(None)
+        return Response(status_code=304, headers=headers)
+    thumbnail_pack.record_served(body)
+    return Response(body, media_type="image/webp", headers=headers)
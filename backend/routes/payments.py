@@ -2,11 +2,12 @@
 Rotas públicas para pagamentos (depósitos e saques) usando SuitPay
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select
 from typing import Optional
 from datetime import timezone
-from database import get_db
+from database import get_db, get_async_db
 from models import User, Deposit, Withdrawal, Gateway, TransactionStatus, Bet, BetStatus, Affiliate, Manager, FTD, Notification, NotificationType, FTDSettings, UserRole, Promotion, PromotionType
 from suitpay_api import SuitPayAPI
 from nxgate_api import NXGateAPI
@@ -19,6 +20,8 @@ from auth import get_password_hash
 from igamewin_api import get_igamewin_api
 from utils import generate_fake_cpf, clean_cpf, normalize_phone_for_gatebox, normalize_pix_key_for_gatebox
 from bonus_wagering import add_rollover_requirement, get_global_rollover_multiplier
+import wallet
+import wallet_ledger
 from datetime import datetime, timedelta
 from decimal import Decimal
 import json
@@ -239,8 +242,8 @@ def apply_promotion_bonus(db: Session, user: User, deposit: Deposit) -> Optional
             # Um refresh poderia sobrescrever o saldo com dados desatualizados, perdendo o valor do depósito.
             balance_before_bonus = float(user.balance)
             bonus_balance_before = float(user.bonus_balance) if hasattr(user, 'bonus_balance') else 0.0
-            user.balance += bonus_amount
-            user.bonus_balance += bonus_amount  # Rastrear bônus separadamente (não sacável)
+            wallet.adjust(db, user, bonus_amount, bonus_amount)  # Rastrear bônus separadamente (não sacável)
+            wallet_ledger.record(db, user.id, wallet_ledger.KIND_PROMOTION_BONUS, bonus_amount, bonus_amount, reference=f"deposit:{deposit.id}")
             db.flush()  # Garantir que o bônus seja persistido imediatamente antes do commit
             balance_after_bonus = float(user.balance)
             bonus_balance_after = float(user.bonus_balance) if hasattr(user, 'bonus_balance') else 0.0
@@ -314,7 +317,8 @@ def update_affiliate_on_deposit_approved(db: Session, user: User, deposit: Depos
     revshare_amount = float(deposit.amount) * revshare_pct
     affiliate.total_revshare_earned = (affiliate.total_revshare_earned or 0) + revshare_amount
     affiliate.total_earnings = (affiliate.total_earnings or 0) + revshare_amount
-    affiliate_user.balance = (affiliate_user.balance or 0) + revshare_amount
+    wallet.adjust(db, affiliate_user, revshare_amount)
+    wallet_ledger.record(db, affiliate_user.id, wallet_ledger.KIND_AFFILIATE_REVSHARE, revshare_amount, reference=f"deposit:{deposit.id}")
     # Revshare do gerente (se sub-afiliado): gerente ganha revshare sobre depósitos dos indicados do sub
     if affiliate.manager_id:
         manager = db.query(Manager).filter(Manager.id == affiliate.manager_id, Manager.is_active == True).first()
@@ -325,7 +329,8 @@ def update_affiliate_on_deposit_approved(db: Session, user: User, deposit: Depos
             manager.total_earnings = (manager.total_earnings or 0) + manager_revshare
             manager_user = db.query(User).filter(User.id == manager.user_id).first()
             if manager_user:
-                manager_user.balance = (manager_user.balance or 0) + manager_revshare
+                wallet.adjust(db, manager_user, manager_revshare)
+                wallet_ledger.record(db, manager_user.id, wallet_ledger.KIND_MANAGER_REVSHARE, manager_revshare, reference=f"deposit:{deposit.id}")
     # Primeiro depósito (FTD): criar FTD e creditar CPA → credita no saldo do afiliado (sacável)
     existing_ftd = db.query(FTD).filter(FTD.user_id == user.id).first()
     if not existing_ftd:
@@ -341,7 +346,8 @@ def update_affiliate_on_deposit_approved(db: Session, user: User, deposit: Depos
         cpa = float(affiliate.cpa_amount or 0)
         affiliate.total_cpa_earned = (affiliate.total_cpa_earned or 0) + cpa
         affiliate.total_earnings = (affiliate.total_earnings or 0) + cpa
-        affiliate_user.balance = (affiliate_user.balance or 0) + cpa
+        wallet.adjust(db, affiliate_user, cpa)
+        wallet_ledger.record(db, affiliate_user.id, wallet_ledger.KIND_AFFILIATE_CPA, cpa, reference=f"deposit:{deposit.id}")
         # Se sub-afiliado: gerente ganha comissão = CPA do sub (o que distribuiu)
         if affiliate.manager_id and cpa > 0:
             manager = db.query(Manager).filter(Manager.id == affiliate.manager_id, Manager.is_active == True).first()
@@ -350,7 +356,8 @@ def update_affiliate_on_deposit_approved(db: Session, user: User, deposit: Depos
                 manager.total_earnings = (manager.total_earnings or 0) + cpa
                 manager_user = db.query(User).filter(User.id == manager.user_id).first()
                 if manager_user:
-                    manager_user.balance = (manager_user.balance or 0) + cpa
+                    wallet.adjust(db, manager_user, cpa)
+                    wallet_ledger.record(db, manager_user.id, wallet_ledger.KIND_MANAGER_CPA, cpa, reference=f"deposit:{deposit.id}")
 
 
 @router.post("/deposit/pix", response_model=DepositResponse, status_code=status.HTTP_201_CREATED)
@@ -1042,7 +1049,7 @@ async def create_pix_withdrawal(
     withdrawable_before = balance_before - bonus_balance_before
     
     # Deduzir apenas do balance (bonus_balance permanece intacto)
-    user.balance -= request.amount
+    wallet.adjust(db, user, -request.amount)
     balance_after = float(user.balance)
     bonus_balance_after = float(user.bonus_balance) if hasattr(user, 'bonus_balance') else 0.0
     withdrawable_after = balance_after - bonus_balance_after
@@ -1060,6 +1067,8 @@ async def create_pix_withdrawal(
     print(f"{'='*80}\n")
     
     db.add(withdrawal)
+    db.flush()  # Obter withdrawal.id para a referência no ledger
+    wallet_ledger.record(db, user.id, wallet_ledger.KIND_WITHDRAWAL, -request.amount, reference=f"withdrawal:{withdrawal.id}")
     db.commit()
     db.refresh(withdrawal)
     
@@ -1069,12 +1078,16 @@ async def create_pix_withdrawal(
 # ========== WEBHOOKS ==========
 
 @webhook_router.post("/suitpay/pix-cashin")
-async def webhook_pix_cashin(request: Request, db: Session = Depends(get_db)):
+async def webhook_pix_cashin(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Webhook para receber notificações de PIX Cash-in (depósitos) da SuitPay
     """
+    raw_body = await request.body()
+    return await db.run_sync(_webhook_pix_cashin, raw_body, dict(request.headers))
+
+
+def _webhook_pix_cashin(db: Session, raw_body: bytes, headers: dict) -> dict:
     try:
-        raw_body = await request.body()
         data = json.loads(raw_body, parse_float=Decimal)
 
         # Processar webhook conforme documentação oficial SuitPay
@@ -1131,7 +1144,7 @@ async def webhook_pix_cashin(request: Request, db: Session = Depends(get_db)):
             data.copy(),
             client_secret,
             raw_body=raw_body,
-            headers=dict(request.headers),
+            headers=headers,
             allow_missing_hash=True,
         ):
             raise HTTPException(status_code=401, detail="Hash inválido")
@@ -1166,7 +1179,8 @@ async def webhook_pix_cashin(request: Request, db: Session = Depends(get_db)):
                 if user:
                     db.refresh(user)  # Garantir dados atualizados
                     balance_before = float(user.balance)
-                    user.balance += deposit.amount
+                    wallet.adjust(db, user, deposit.amount)
+                    wallet_ledger.record(db, user.id, wallet_ledger.KIND_DEPOSIT, deposit.amount, reference=f"deposit:{deposit.id}")
                     db.flush()  # Garantir que a mudança é enviada antes do commit
                     balance_after_deposit = float(user.balance)
                     
@@ -1204,8 +1218,8 @@ async def webhook_pix_cashin(request: Request, db: Session = Depends(get_db)):
             if deposit.status == TransactionStatus.APPROVED:
                 # Reverter saldo se já foi aprovado
                 user = db.query(User).filter(User.id == deposit.user_id).first()
-                if user and user.balance >= deposit.amount:
-                    user.balance -= deposit.amount
+                if user and wallet.adjust(db, user, -deposit.amount, min_balance=deposit.amount).ok:
+                    wallet_ledger.record(db, user.id, wallet_ledger.KIND_DEPOSIT_REVERSAL, -deposit.amount, reference=f"deposit:{deposit.id}")
             deposit.status = TransactionStatus.CANCELLED
         
         # Atualizar metadata
@@ -1245,12 +1259,16 @@ async def webhook_pix_cashin(request: Request, db: Session = Depends(get_db)):
 
 
 @webhook_router.post("/nxgate/pix-cashin")
-async def webhook_nxgate_pix_cashin(request: Request, db: Session = Depends(get_db)):
+async def webhook_nxgate_pix_cashin(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Webhook para receber notificações de PIX Cash-in (depósitos) da NXGATE
     """
+    raw_body = await request.body()
+    return await db.run_sync(_webhook_nxgate_pix_cashin, raw_body)
+
+
+def _webhook_nxgate_pix_cashin(db: Session, raw_body: bytes) -> dict:
     try:
-        raw_body = await request.body()
         data = json.loads(raw_body, parse_float=Decimal)
         
         # Parse do webhook NXGATE
@@ -1286,7 +1304,8 @@ async def webhook_nxgate_pix_cashin(request: Request, db: Session = Depends(get_
                 if user:
                     db.refresh(user)  # Garantir dados atualizados
                     balance_before = float(user.balance)
-                    user.balance += deposit.amount
+                    wallet.adjust(db, user, deposit.amount)
+                    wallet_ledger.record(db, user.id, wallet_ledger.KIND_DEPOSIT, deposit.amount, reference=f"deposit:{deposit.id}")
                     db.flush()  # Garantir que a mudança é enviada antes do commit
                     balance_after_deposit = float(user.balance)
                     
@@ -1360,12 +1379,17 @@ async def webhook_nxgate_pix_cashin(request: Request, db: Session = Depends(get_
 
 
 @webhook_router.post("/nxgate/pix-cashout")
-async def webhook_nxgate_pix_cashout(request: Request, db: Session = Depends(get_db)):
+async def webhook_nxgate_pix_cashout(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Webhook para receber notificações de PIX Cash-out (saques) da NXGATE
     """
+    raw_body = await request.body()
+    return await db.run_sync(_webhook_nxgate_pix_cashout, raw_body)
+
+
+def _webhook_nxgate_pix_cashout(db: Session, raw_body: bytes) -> dict:
     try:
-        data = await request.json()
+        data = json.loads(raw_body)
         
         print(f"\n{'='*80}")
         print(f"[Webhook NXGATE PIX Cash-out] Webhook recebido")
@@ -1423,7 +1447,8 @@ async def webhook_nxgate_pix_cashout(request: Request, db: Session = Depends(get
                 if user:
                     db.refresh(user)  # Garantir dados atualizados
                     balance_before = float(user.balance)
-                    user.balance += withdrawal.amount
+                    wallet.adjust(db, user, withdrawal.amount)
+                    wallet_ledger.record(db, user.id, wallet_ledger.KIND_WITHDRAWAL_REFUND, withdrawal.amount, reference=f"withdrawal:{withdrawal.id}")
                     balance_after = float(user.balance)
                     print(f"[Webhook NXGATE PIX Cash-out] 💰 Saldo revertido para usuário:")
                     print(f"[Webhook NXGATE PIX Cash-out]   - Saldo anterior: R$ {balance_before:.2f}")
@@ -1540,11 +1565,13 @@ def _find_withdrawal_by_external_or_metadata(db: Session, external_id: Optional[
 
 
 @webhook_router.post("/gatebox")
-async def webhook_gatebox(request: Request, db: Session = Depends(get_db)):
+async def webhook_gatebox(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Uma única URL para todos os eventos da Gatebox (depósito, saque, reversão, estorno).
     Configure na Gatebox: {WEBHOOK_BASE_URL}/api/webhooks/gatebox
     Eventos: PIX_PAY_IN, PIX_PAY_OUT, PIX_REVERSAL, PIX_REVERSAL_OUT, PIX_REFUND.
+    As consultas ao banco rodam na sessão assíncrona (run_sync), intercaladas com as consultas de
+    status na API da Gatebox, sem bloquear o event loop.
     """
     try:
         data = await request.json()
@@ -1576,29 +1603,29 @@ async def webhook_gatebox(request: Request, db: Session = Depends(get_db)):
         event_type = _gatebox_event_type(data)
 
         if event_type == "PIX_REVERSAL":
-            deposit = _find_deposit_by_external_or_metadata(db, external_id, transaction_id, gatebox_uuid, gatebox_identifier)
+            deposit = await db.run_sync(_find_deposit_by_external_or_metadata, external_id, transaction_id, gatebox_uuid, gatebox_identifier)
             if deposit:
-                return await _process_gatebox_reversal(data, deposit, db)
+                return await db.run_sync(lambda s: _process_gatebox_reversal(data, deposit, s))
             return {"status": "received", "message": "Depósito não encontrado para reversão"}
 
         if event_type == "PIX_REVERSAL_OUT" or event_type == "PIX_REFUND":
-            withdrawal = _find_withdrawal_by_external_or_metadata(db, external_id, transaction_id, gatebox_uuid, gatebox_identifier)
+            withdrawal = await db.run_sync(_find_withdrawal_by_external_or_metadata, external_id, transaction_id, gatebox_uuid, gatebox_identifier)
             if withdrawal:
-                return await _process_gatebox_withdrawal_fail(data, withdrawal, db, reason=event_type or "reversal")
+                return await db.run_sync(lambda s: _process_gatebox_withdrawal_fail(data, withdrawal, s, reason=event_type or "reversal"))
             if event_type == "PIX_REFUND":
-                deposit = _find_deposit_by_external_or_metadata(db, external_id, transaction_id, gatebox_uuid, gatebox_identifier)
+                deposit = await db.run_sync(_find_deposit_by_external_or_metadata, external_id, transaction_id, gatebox_uuid, gatebox_identifier)
                 if deposit:
-                    return await _process_gatebox_reversal(data, deposit, db)
+                    return await db.run_sync(lambda s: _process_gatebox_reversal(data, deposit, s))
             return {"status": "received", "message": "Transação não encontrada para reversão/estorno"}
 
         is_cashout = _gatebox_event_is_cashout(data)
-        deposit = _find_deposit_by_external_or_metadata(db, external_id, transaction_id, gatebox_uuid, gatebox_identifier)
-        withdrawal = _find_withdrawal_by_external_or_metadata(db, external_id, transaction_id, gatebox_uuid, gatebox_identifier)
+        deposit = await db.run_sync(_find_deposit_by_external_or_metadata, external_id, transaction_id, gatebox_uuid, gatebox_identifier)
+        withdrawal = await db.run_sync(_find_withdrawal_by_external_or_metadata, external_id, transaction_id, gatebox_uuid, gatebox_identifier)
 
         # Fallback 1: webhook pode enviar apenas uuid do pagamento. Consultar status na Gatebox por transactionId para obter externalId.
         if not deposit and not withdrawal and (gatebox_uuid or transaction_id):
             try:
-                gateway = get_active_pix_gateway(db)
+                gateway = await db.run_sync(get_active_pix_gateway)
                 client = get_payment_client(gateway)
                 if isinstance(client, GateboxAPI):
                     logger.info("[Webhook Gatebox] Fallback: consultando status por transaction_id=%r", gatebox_uuid or transaction_id)
@@ -1614,12 +1641,14 @@ async def webhook_gatebox(request: Request, db: Session = Depends(get_db)):
                             logger.info("[Webhook Gatebox] Resolvido via status API: externalId=%r, transactionId=%r, uuid=%r",
                                         resolved_external, resolved_tx, resolved_uuid)
                             sid = status_data.get("identifier") if isinstance(status_data, dict) else None
-                            deposit = _find_deposit_by_external_or_metadata(
-                                db, resolved_external or external_id, resolved_tx or transaction_id,
+                            deposit = await db.run_sync(
+                                _find_deposit_by_external_or_metadata,
+                                resolved_external or external_id, resolved_tx or transaction_id,
                                 resolved_uuid or gatebox_uuid, gatebox_identifier or sid
                             )
-                            withdrawal = _find_withdrawal_by_external_or_metadata(
-                                db, resolved_external or external_id, resolved_tx or transaction_id,
+                            withdrawal = await db.run_sync(
+                                _find_withdrawal_by_external_or_metadata,
+                                resolved_external or external_id, resolved_tx or transaction_id,
                                 resolved_uuid or gatebox_uuid, gatebox_identifier or sid
                             )
             except HTTPException:
@@ -1637,14 +1666,16 @@ async def webhook_gatebox(request: Request, db: Session = Depends(get_db)):
         success_statuses = ("PAID", "COMPLETED", "CONCLUIDO", "APROVADO", "PAID_OUT", "SUCCESS")
         if not deposit and not withdrawal and status_val in success_statuses:
             try:
-                gateway = get_active_pix_gateway(db)
+                gateway = await db.run_sync(get_active_pix_gateway)
                 client = get_payment_client(gateway)
                 if isinstance(client, GateboxAPI):
                     # Depósitos PENDING: encontrar qual foi pago
-                    pending_deposits = db.query(Deposit).filter(
-                        Deposit.status == TransactionStatus.PENDING,
-                        Deposit.external_id.isnot(None),
-                    ).order_by(Deposit.created_at.desc()).limit(10).all()
+                    pending_deposits = (await db.execute(
+                        select(Deposit).where(
+                            Deposit.status == TransactionStatus.PENDING,
+                            Deposit.external_id.isnot(None),
+                        ).order_by(Deposit.created_at.desc()).limit(10)
+                    )).scalars().all()
                     for dep in pending_deposits:
                         if not dep.external_id:
                             continue
@@ -1657,10 +1688,12 @@ async def webhook_gatebox(request: Request, db: Session = Depends(get_db)):
                                 break
                     # Saques PENDING: se ainda não achou saque, consultar por external_id (webhook pode vir sem externalId)
                     if not withdrawal:
-                        pending_withdrawals = db.query(Withdrawal).filter(
-                            Withdrawal.status == TransactionStatus.PENDING,
-                            Withdrawal.external_id.isnot(None),
-                        ).order_by(Withdrawal.created_at.desc()).limit(10).all()
+                        pending_withdrawals = (await db.execute(
+                            select(Withdrawal).where(
+                                Withdrawal.status == TransactionStatus.PENDING,
+                                Withdrawal.external_id.isnot(None),
+                            ).order_by(Withdrawal.created_at.desc()).limit(10)
+                        )).scalars().all()
                         for w in pending_withdrawals:
                             if not w.external_id:
                                 continue
@@ -1681,13 +1714,15 @@ async def webhook_gatebox(request: Request, db: Session = Depends(get_db)):
         fail_statuses = _GATEBOX_WITHDRAWAL_FAIL_STATUSES
         if not withdrawal and status_val in fail_statuses and is_cashout:
             try:
-                gateway = get_active_pix_gateway(db)
+                gateway = await db.run_sync(get_active_pix_gateway)
                 client = get_payment_client(gateway)
                 if isinstance(client, GateboxAPI):
-                    pending_withdrawals = db.query(Withdrawal).filter(
-                        Withdrawal.status == TransactionStatus.PENDING,
-                        Withdrawal.external_id.isnot(None),
-                    ).order_by(Withdrawal.created_at.desc()).limit(10).all()
+                    pending_withdrawals = (await db.execute(
+                        select(Withdrawal).where(
+                            Withdrawal.status == TransactionStatus.PENDING,
+                            Withdrawal.external_id.isnot(None),
+                        ).order_by(Withdrawal.created_at.desc()).limit(10)
+                    )).scalars().all()
                     for w in pending_withdrawals:
                         if not w.external_id:
                             continue
@@ -1703,21 +1738,23 @@ async def webhook_gatebox(request: Request, db: Session = Depends(get_db)):
             except Exception as e:
                 logger.warning("[Webhook Gatebox] Fallback falha (PENDING por external_id) falhou: %s", e)
         if withdrawal and status_val in fail_statuses:
-            return await _process_gatebox_withdrawal_fail(data, withdrawal, db, reason="cashout_fail")
+            return await db.run_sync(lambda s: _process_gatebox_withdrawal_fail(data, withdrawal, s, reason="cashout_fail"))
 
         if deposit and withdrawal:
-            return await _process_gatebox_cashout(data, withdrawal, db) if is_cashout else await _process_gatebox_cashin(data, deposit, db)
+            if is_cashout:
+                return await db.run_sync(lambda s: _process_gatebox_cashout(data, withdrawal, s))
+            return await db.run_sync(lambda s: _process_gatebox_cashin(data, deposit, s))
         if deposit:
-            return await _process_gatebox_cashin(data, deposit, db)
+            return await db.run_sync(lambda s: _process_gatebox_cashin(data, deposit, s))
         if withdrawal:
-            return await _process_gatebox_cashout(data, withdrawal, db)
+            return await db.run_sync(lambda s: _process_gatebox_cashout(data, withdrawal, s))
         return {"status": "received", "message": "Transação não encontrada (depósito ou saque)"}
     except Exception as e:
         logger.exception("[Webhook Gatebox] Erro ao processar webhook: %s", e)
         return {"status": "error", "message": str(e)}
 
 
-async def _process_gatebox_cashin(data: dict, deposit: Deposit, db: Session) -> dict:
+def _process_gatebox_cashin(data: dict, deposit: Deposit, db: Session) -> dict:
     """Processa webhook Gatebox de cash-in (depósito). Credita saldo uma única vez (idempotente)."""
     status_val = (data.get("status") or data.get("statusTransaction") or (data.get("data") or {}).get("status") or "").upper()
     if status_val in ("PAID", "COMPLETED", "CONCLUIDO", "APROVADO", "APPROVED", "PAID_OUT", "SUCCESS"):
@@ -1727,7 +1764,8 @@ async def _process_gatebox_cashin(data: dict, deposit: Deposit, db: Session) ->
             if user:
                 logger.info("[Webhook Gatebox] Creditando saldo: deposit_id=%s, user_id=%s, amount=%s", deposit.id, user.id, deposit.amount)
                 db.refresh(user)
-                user.balance += deposit.amount
+                wallet.adjust(db, user, deposit.amount)
+                wallet_ledger.record(db, user.id, wallet_ledger.KIND_DEPOSIT, deposit.amount, reference=f"deposit:{deposit.id}")
                 db.flush()  # Enviar depósito ao DB antes do bônus (apply_promotion_bonus faz db.refresh e perderia o valor)
                 bonus_amount = apply_promotion_bonus(db, user, deposit)
                 update_affiliate_on_deposit_approved(db, user, deposit)
@@ -1760,7 +1798,7 @@ _GATEBOX_WITHDRAWAL_FAIL_STATUSES = (
 )
 
 
-async def _process_gatebox_withdrawal_fail(
+def _process_gatebox_withdrawal_fail(
     data: dict, withdrawal: Withdrawal, db: Session, reason: str = "rejection"
 ) -> dict:
     """
@@ -1771,7 +1809,8 @@ async def _process_gatebox_withdrawal_fail(
         user = db.query(User).filter(User.id == withdrawal.user_id).first()
         if user:
             db.refresh(user)
-            user.balance += withdrawal.amount
+            wallet.adjust(db, user, withdrawal.amount)
+            wallet_ledger.record(db, user.id, wallet_ledger.KIND_WITHDRAWAL_REFUND, withdrawal.amount, reference=f"withdrawal:{withdrawal.id}")
             notification = Notification(
                 title="Saque não realizado",
                 message=f"O saque de R$ {withdrawal.amount:.2f} foi devolvido à sua carteira. Saldo atual: R$ {float(user.balance):.2f}",
@@ -1792,14 +1831,14 @@ async def _process_gatebox_withdrawal_fail(
     return {"status": "ok", "message": "Falha/reversão de saque processada; valor devolvido à carteira"}
 
 
-async def _process_gatebox_cashout(data: dict, withdrawal: Withdrawal, db: Session) -> dict:
+def _process_gatebox_cashout(data: dict, withdrawal: Withdrawal, db: Session) -> dict:
     """Processa webhook Gatebox de cash-out (saque). Sucesso = APPROVED; falha = devolve saldo."""
     status_val = (data.get("status") or data.get("statusTransaction") or (data.get("data") or {}).get("status") or "").upper()
     if status_val in ("COMPLETED", "SUCCESS", "PAID_OUT", "APROVADO", "APPROVED", "PAID"):
         if withdrawal.status != TransactionStatus.APPROVED:
             withdrawal.status = TransactionStatus.APPROVED
     elif status_val in _GATEBOX_WITHDRAWAL_FAIL_STATUSES:
-        return await _process_gatebox_withdrawal_fail(data, withdrawal, db, reason="cashout_fail")
+        return _process_gatebox_withdrawal_fail(data, withdrawal, db, reason="cashout_fail")
     metadata = json.loads(withdrawal.metadata_json) if withdrawal.metadata_json else {}
     metadata["webhook_data"] = data
     metadata["webhook_received_at"] = datetime.utcnow().isoformat()
@@ -1808,19 +1847,20 @@ async def _process_gatebox_cashout(data: dict, withdrawal: Withdrawal, db: Sessi
     return {"status": "ok", "message": "Webhook processado"}
 
 
-async def _process_gatebox_reversal(data: dict, deposit: Deposit, db: Session) -> dict:
+def _process_gatebox_reversal(data: dict, deposit: Deposit, db: Session) -> dict:
     """
     Processa reversão/estorno de depósito (PIX_REVERSAL ou PIX_REFUND sobre depósito).
     Debita o valor da carteira do usuário (só se o depósito estava aprovado) e marca como rejeitado.
     """
     if deposit.status == TransactionStatus.APPROVED:
-        user = db.query(User).filter(User.id == deposit.user_id).first()
+        # Estorno limitado ao saldo atual: a linha fica travada até o commit, então nenhum
+        # débito/crédito concorrente muda o saldo entre a leitura e o UPDATE
+        user = db.query(User).filter(User.id == deposit.user_id).with_for_update().populate_existing().first()
         if user:
-            db.refresh(user)
-            to_debit = min(deposit.amount, float(user.balance))
-            user.balance -= to_debit
-            if user.balance < 0:
-                user.balance = 0
+            balance_before = float(user.balance)
+            to_debit = min(deposit.amount, balance_before)
+            wallet.adjust(db, user, -to_debit)
+            wallet_ledger.record(db, user.id, wallet_ledger.KIND_DEPOSIT_REVERSAL, float(user.balance) - balance_before, reference=f"deposit:{deposit.id}")
             notification = Notification(
                 title="Depósito revertido",
                 message=f"O depósito de R$ {deposit.amount:.2f} foi revertido/estornado. Saldo atual: R$ {float(user.balance):.2f}",
@@ -1842,14 +1882,19 @@ async def _process_gatebox_reversal(data: dict, deposit: Deposit, db: Session) -
 
 
 @webhook_router.post("/gatebox/pix-cashin")
-async def webhook_gatebox_pix_cashin(request: Request, db: Session = Depends(get_db)):
+async def webhook_gatebox_pix_cashin(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Webhook para notificações de PIX Cash-in (depósitos) da Gatebox.
     Preferir a URL única: {WEBHOOK_BASE_URL}/api/webhooks/gatebox (uma URL para todos os eventos).
     Payload esperado (ex.): externalId, transactionId, status (ex.: PAID, COMPLETED, CONCLUIDO).
     """
+    raw_body = await request.body()
+    return await db.run_sync(_webhook_gatebox_pix_cashin, raw_body)
+
+
+def _webhook_gatebox_pix_cashin(db: Session, raw_body: bytes) -> dict:
     try:
-        data = await request.json()
+        data = json.loads(raw_body)
         external_id = data.get("externalId") or data.get("external_id")
         transaction_id = data.get("transactionId") or data.get("transaction_id")
         if not external_id and not transaction_id:
@@ -1861,21 +1906,26 @@ async def webhook_gatebox_pix_cashin(request: Request, db: Session = Depends(get
             deposit = db.query(Deposit).filter(Deposit.external_id == transaction_id).first()
         if not deposit:
             return {"status": "received", "message": "Depósito não encontrado"}
-        return await _process_gatebox_cashin(data, deposit, db)
+        return _process_gatebox_cashin(data, deposit, db)
     except Exception as e:
         print(f"[Webhook Gatebox pix-cashin] Erro: {e}")
         return {"status": "error", "message": str(e)}
 
 
 @webhook_router.post("/gatebox/pix-cashout")
-async def webhook_gatebox_pix_cashout(request: Request, db: Session = Depends(get_db)):
+async def webhook_gatebox_pix_cashout(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Webhook para notificações de PIX Cash-out (saques) da Gatebox.
     Preferir a URL única: {WEBHOOK_BASE_URL}/api/webhooks/gatebox (uma URL para todos os eventos).
     Payload esperado: externalId ou transactionId, status (ex.: COMPLETED, SUCCESS, ERROR, CANCELLED).
     """
+    raw_body = await request.body()
+    return await db.run_sync(_webhook_gatebox_pix_cashout, raw_body)
+
+
+def _webhook_gatebox_pix_cashout(db: Session, raw_body: bytes) -> dict:
     try:
-        data = await request.json()
+        data = json.loads(raw_body)
         external_id = data.get("externalId") or data.get("external_id")
         transaction_id = data.get("transactionId") or data.get("transaction_id")
         if not external_id and not transaction_id:
@@ -1887,19 +1937,23 @@ async def webhook_gatebox_pix_cashout(request: Request, db: Session = Depends(ge
             withdrawal = db.query(Withdrawal).filter(Withdrawal.external_id == transaction_id).first()
         if not withdrawal:
             return {"status": "received", "message": "Saque não encontrado"}
-        return await _process_gatebox_cashout(data, withdrawal, db)
+        return _process_gatebox_cashout(data, withdrawal, db)
     except Exception as e:
         print(f"[Webhook Gatebox pix-cashout] Erro: {e}")
         return {"status": "error", "message": str(e)}
 
 
 @webhook_router.post("/suitpay/pix-cashout")
-async def webhook_pix_cashout(request: Request, db: Session = Depends(get_db)):
+async def webhook_pix_cashout(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Webhook para receber notificações de PIX Cash-out (saques) da SuitPay
     """
+    raw_body = await request.body()
+    return await db.run_sync(_webhook_pix_cashout, raw_body, dict(request.headers))
+
+
+def _webhook_pix_cashout(db: Session, raw_body: bytes, headers: dict) -> dict:
     try:
-        raw_body = await request.body()
         data = json.loads(raw_body, parse_float=Decimal)
         
         # Buscar gateway PIX ativo para validar hash
@@ -1931,7 +1985,7 @@ async def webhook_pix_cashout(request: Request, db: Session = Depends(get_db)):
             data.copy(),
             client_secret,
             raw_body=raw_body,
-            headers=dict(request.headers),
+            headers=headers,
             allow_missing_hash=True,
         ):
             raise HTTPException(status_code=401, detail="Hash inválido")
@@ -1953,7 +2007,8 @@ async def webhook_pix_cashout(request: Request, db: Session = Depends(get_db)):
                 if user:
                     db.refresh(user)  # Garantir dados atualizados
                     balance_before = float(user.balance)
-                    user.balance += withdrawal.amount
+                    wallet.adjust(db, user, withdrawal.amount)
+                    wallet_ledger.record(db, user.id, wallet_ledger.KIND_WITHDRAWAL_REFUND, withdrawal.amount, reference=f"withdrawal:{withdrawal.id}")
                     balance_after = float(user.balance)
                     print(f"[Webhook SuitPay PIX Cash-out] 💰 Saldo revertido para usuário:")
                     print(f"[Webhook SuitPay PIX Cash-out]   - Saldo anterior: R$ {balance_before:.2f}")
@@ -2091,7 +2146,7 @@ async def reconcile_sarrix_deposit_by_id(db: Session, deposit_id: int) -> dict:
     st = (item.get("status") or "").lower()
     if st in ("succeeded", "approved", "paid", "completed"):
         payload = {"status": "COMPLETED", "transaction": {"id": tx_id}, "reference": {"transaction_ref": tx_id}}
-        return await _process_gatebox_cashin(payload, deposit, db)
+        return _process_gatebox_cashin(payload, deposit, db)
     return {
         "ok": False,
         "message": f"Transação ainda não paga na SarrixPay (status={item.get('status')!r})",
@@ -2178,7 +2233,7 @@ def _cyber_find_withdrawal(db: Session, d: dict) -> Optional[Withdrawal]:
 
 
 @webhook_router.post("/cyberpay")
-async def webhook_cyberpay(request: Request, db: Session = Depends(get_db)):
+async def webhook_cyberpay(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Webhook Cyber Payment (Escale Cyber).
     Configure no painel: {WEBHOOK_BASE_URL}/api/webhooks/cyberpay
@@ -2186,8 +2241,12 @@ async def webhook_cyberpay(request: Request, db: Session = Depends(get_db)):
     pix.out.confirmation, pix.out.failure, pix.out.reversal (e processing como ACK).
     """
     body_bytes = await request.body()
-    secret = _cyber_get_webhook_secret(db)
     sig = request.headers.get("X-Webhook-Signature") or request.headers.get("x-webhook-signature")
+    return await db.run_sync(_webhook_cyberpay, body_bytes, sig)
+
+
+def _webhook_cyberpay(db: Session, body_bytes: bytes, sig: Optional[str]) -> dict:
+    secret = _cyber_get_webhook_secret(db)
     if secret and not _cyber_verify_signature(body_bytes, secret, sig):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Assinatura de webhook inválida")
 
@@ -2206,7 +2265,7 @@ async def webhook_cyberpay(request: Request, db: Session = Depends(get_db)):
                 return {"status": "received", "message": "Depósito não encontrado"}
             payload = dict(d)
             payload["status"] = "APPROVED"
-            return await _process_gatebox_cashin(payload, deposit, db)
+            return _process_gatebox_cashin(payload, deposit, db)
 
         if event_type in ("pix.in.expired", "pix.in.failed"):
             deposit = _cyber_find_deposit(db, d)
@@ -2225,7 +2284,7 @@ async def webhook_cyberpay(request: Request, db: Session = Depends(get_db)):
                 return {"status": "received", "message": "Depósito não encontrado"}
             rev = dict(d)
             rev["status"] = "REFUNDED"
-            return await _process_gatebox_reversal(rev, deposit, db)
+            return _process_gatebox_reversal(rev, deposit, db)
 
         if event_type == "pix.out.confirmation":
             withdrawal = _cyber_find_withdrawal(db, d)
@@ -2233,13 +2292,13 @@ async def webhook_cyberpay(request: Request, db: Session = Depends(get_db)):
                 return {"status": "received", "message": "Saque não encontrado"}
             out = dict(d)
             out["status"] = "COMPLETED"
-            return await _process_gatebox_cashout(out, withdrawal, db)
+            return _process_gatebox_cashout(out, withdrawal, db)
 
         if event_type in ("pix.out.failure", "pix.out.reversal"):
             withdrawal = _cyber_find_withdrawal(db, d)
             if not withdrawal:
                 return {"status": "received", "message": "Saque não encontrado"}
-            return await _process_gatebox_withdrawal_fail(data, withdrawal, db, reason=event_type)
+            return _process_gatebox_withdrawal_fail(data, withdrawal, db, reason=event_type)
 
         if event_type in ("pix.in.processing", "pix.out.processing", "pix.in.reversal.processing"):
             return {"status": "ok", "message": "ack"}
@@ -2253,14 +2312,19 @@ async def webhook_cyberpay(request: Request, db: Session = Depends(get_db)):
 
 
 @webhook_router.post("/sarrixpay")
-async def webhook_sarrixpay(request: Request, db: Session = Depends(get_db)):
+async def webhook_sarrixpay(request: Request, db: AsyncSession = Depends(get_async_db)):
     """
     Webhook SarrixPay — eventos normalizados (pix_in.* / pix_out.*).
     Configure no painel SarrixPay: ``{WEBHOOK_BASE_URL}/api/webhooks/sarrixpay``
     Resposta recomendada: HTTP 200 em até ~5 s; eventos podem ser reentregues (idempotência).
     """
+    raw_body = await request.body()
+    return await db.run_sync(_webhook_sarrixpay, raw_body)
+
+
+def _webhook_sarrixpay(db: Session, raw_body: bytes) -> dict:
     try:
-        data = await request.json()
+        data = json.loads(raw_body)
         event = (data.get("event") or "").strip().lower()
         transaction = data.get("transaction") or {}
         reference = data.get("reference") or {}
@@ -2282,12 +2346,12 @@ async def webhook_sarrixpay(request: Request, db: Session = Depends(get_db)):
             if event == "pix_in.succeeded":
                 payload = dict(data)
                 payload["status"] = "COMPLETED"
-                return await _process_gatebox_cashin(payload, deposit, db)
+                return _process_gatebox_cashin(payload, deposit, db)
             if event == "pix_in.refunded":
                 if deposit.status == TransactionStatus.APPROVED:
                     user = db.query(User).filter(User.id == deposit.user_id).first()
-                    if user and float(user.balance) >= float(deposit.amount):
-                        user.balance -= deposit.amount
+                    if user and wallet.adjust(db, user, -deposit.amount, min_balance=deposit.amount).ok:
+                        wallet_ledger.record(db, user.id, wallet_ledger.KIND_DEPOSIT_REVERSAL, -deposit.amount, reference=f"deposit:{deposit.id}")
                 deposit.status = TransactionStatus.CANCELLED
                 metadata = json.loads(deposit.metadata_json) if deposit.metadata_json else {}
                 metadata["webhook_data"] = data
@@ -2311,9 +2375,9 @@ async def webhook_sarrixpay(request: Request, db: Session = Depends(get_db)):
             if event == "pix_out.succeeded":
                 payload = dict(data)
                 payload["status"] = "COMPLETED"
-                return await _process_gatebox_cashout(payload, withdrawal, db)
+                return _process_gatebox_cashout(payload, withdrawal, db)
             if event in ("pix_out.failed", "pix_out.canceled", "pix_out.refunded"):
-                return await _process_gatebox_withdrawal_fail(
+                return _process_gatebox_withdrawal_fail(
                     data, withdrawal, db, reason=event
                 )
             metadata = json.loads(withdrawal.metadata_json) if withdrawal.metadata_json else {}
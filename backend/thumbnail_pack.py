@@ -0,0 +1,245 @@
+"""
+Pacote único (memory-mapped) com as miniaturas .webp dos jogos IGameWin.
+
+As ~milhares de miniaturas de igamewin_games_to_viper/igamewin são empacotadas num único arquivo
+por um passo de build; o backend o abre com mmap na inicialização e serve cada imagem como uma
+fatia (memoryview) do mapeamento, sem abrir arquivos nem copiar bytes por requisição.
+
+As imagens são endereçadas pelo hash do conteúdo: a URL pública é
+/api/public/media/thumbnails/<hash>.webp, o ETag é o próprio hash e a resposta pode ser guardada
+para sempre (immutable). Uma imagem alterada ganha outra URL no próximo build; imagens idênticas
+são gravadas uma única vez.
+
+Formato do arquivo:
+    [imagens concatenadas][índice JSON][rodapé: offset do índice (u64 LE) + MAGIC (8 bytes)]
+    índice = {"version": 1, "files": {nome: hash}, "blobs": {hash: [offset, tamanho]}}
+
+Build (a partir de backend/, numa cópia completa do repositório):
+    python thumbnail_pack.py
+    python thumbnail_pack.py --src ../igamewin_games_to_viper/igamewin --out igamewin_thumbnails.pack
+
+O pacote não vai para o git e as imagens de origem ficam fora do contexto do Docker (backend/):
+ele é publicado como artefato de release e baixado no build da imagem (build arg
+THUMBNAIL_PACK_URL no Dockerfile / variável no nixpacks), que o valida antes de instalar:
+    python thumbnail_pack.py --fetch https://.../igamewin_thumbnails.pack
+Passo a passo em DEPLOY-GUIDE.md.
+
+Sem o pacote (THUMBNAIL_PACK_PATH inexistente) o catálogo mantém as URLs originais dos banners.
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCE_DIR = os.path.join(BACKEND_DIR, "..", "igamewin_games_to_viper", "igamewin")
+PACK_PATH = os.getenv("THUMBNAIL_PACK_PATH", os.path.join(BACKEND_DIR, "igamewin_thumbnails.pack"))
+
+URL_PREFIX = "/api/public/media/thumbnails/"
+EXTENSION = ".webp"
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+MAGIC = b"LUXTHMB1"
+_FOOTER = struct.Struct("<Q8s")
+
+
+class ThumbnailPack:
+    """Pacote aberto com mmap; get() devolve fatias sem cópia."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        size = len(self._mmap)
+        if size < _FOOTER.size:
+            raise ValueError("arquivo menor que o rodapé")
+        index_offset, magic = _FOOTER.unpack_from(self._mmap, size - _FOOTER.size)
+        if magic != MAGIC or index_offset > size - _FOOTER.size:
+            raise ValueError("rodapé inválido (não é um pacote de miniaturas)")
+        index = json.loads(self._mmap[index_offset:size - _FOOTER.size])
+        self.files: Dict[str, str] = index["files"]
+        self.blobs: Dict[str, Tuple[int, int]] = {digest: (o, n) for digest, (o, n) in index["blobs"].items()}
+        self.size = size
+        self._view = memoryview(self._mmap)
+
+    def get(self, digest: str) -> Optional[memoryview]:
+        entry = self.blobs.get(digest)
+        if entry is None:
+            return None
+        offset, length = entry
+        return self._view[offset:offset + length]
+
+    def digest_for(self, name: str) -> Optional[str]:
+        return self.files.get(name)
+
+    def close(self) -> None:
+        self._view.release()
+        self._mmap.close()
+
+
+_pack: Optional[ThumbnailPack] = None
+_stats: Dict[str, int] = {
+    "served": 0,
+    "not_modified": 0,
+    "not_found": 0,
+    "bytes_served": 0,
+}
+
+
+def load(path: str = PACK_PATH) -> bool:
+    """Abre o pacote (inicialização). False se não existe ou é inválido; as URLs originais são mantidas."""
+    global _pack
+    if not os.path.exists(path):
+        print(f"[Thumbnails] Pacote não encontrado em {path}; banners servidos pelas URLs originais "
+              "(build da imagem sem THUMBNAIL_PACK_URL? veja DEPLOY-GUIDE.md)")
+        return False
+    try:
+        _pack = ThumbnailPack(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[Thumbnails] Pacote inválido em {path}: {e}")
+        return False
+    print(f"[Thumbnails] Pacote carregado: {len(_pack.files)} arquivos, {len(_pack.blobs)} imagens, "
+          f"{_pack.size / 1024 / 1024:.1f} MB")
+    return True
+
+
+def loaded() -> bool:
+    return _pack is not None
+
+
+def url_for(path: Optional[str]) -> Optional[str]:
+    """
+    URL com hash para um banner que aponta para uma miniatura empacotada
+    ('/igamewin/171.webp', 'igamewin/171.webp' ou '171.webp'); None se não está no pacote.
+    """
+    pack = _pack
+    if pack is None or not path or "://" in path:
+        return None
+    digest = pack.digest_for(path.rsplit("/", 1)[-1])
+    return f"{URL_PREFIX}{digest}{EXTENSION}" if digest else None
+
+
+def lookup(digest: str) -> Optional[memoryview]:
+    """Bytes da imagem (fatia do mmap) pelo hash, ou None."""
+    pack = _pack
+    body = pack.get(digest) if pack is not None else None
+    if body is None:
+        _stats["not_found"] += 1
+    return body
+
+
+def record_served(body: Optional[memoryview]) -> None:
+    """Contabiliza uma resposta: 200 com o corpo ou 304 (body=None)."""
+    if body is None:
+        _stats["not_modified"] += 1
+    else:
+        _stats["served"] += 1
+        _stats["bytes_served"] += len(body)
+
+
+def stats() -> Dict[str, Any]:
+    pack = _pack
+    return {
+        **_stats,
+        "loaded": pack is not None,
+        "path": pack.path if pack is not None else PACK_PATH,
+        "files": len(pack.files) if pack is not None else 0,
+        "images": len(pack.blobs) if pack is not None else 0,
+        "pack_bytes": pack.size if pack is not None else 0,
+    }
+
+
+def _metric_lines() -> List[str]:
+    return (
+        metrics.counter_samples(
+            "thumbnail_responses_total",
+            "Respostas de miniaturas do pacote por resultado",
+            [({"outcome": outcome}, _stats[outcome]) for outcome in ("served", "not_modified", "not_found")],
+        )
+        + metrics.counter_samples("thumbnail_bytes_served_total", "Bytes de miniaturas enviados", [({}, _stats["bytes_served"])])
+    )
+
+
+metrics.register_collector(_metric_lines)
+
+
+# ========== BUILD ==========
+
+def build(source_dir: str = DEFAULT_SOURCE_DIR, out_path: str = PACK_PATH) -> Dict[str, Any]:
+    """Empacota os .webp de source_dir em out_path (gravado em arquivo temporário e trocado no final)."""
+    started = time.monotonic()
+    names = sorted(name for name in os.listdir(source_dir) if name.lower().endswith(EXTENSION))
+    files: Dict[str, str] = {}
+    blobs: Dict[str, Tuple[int, int]] = {}
+    offset = 0
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as out:
+        for name in names:
+            with open(os.path.join(source_dir, name), "rb") as f:
+                data = f.read()
+            digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+            files[name] = digest
+            if digest not in blobs:
+                out.write(data)
+                blobs[digest] = (offset, len(data))
+                offset += len(data)
+        index = json.dumps({"version": 1, "files": files, "blobs": blobs}, separators=(",", ":")).encode("utf-8")
+        out.write(index)
+        out.write(_FOOTER.pack(offset, MAGIC))
+    os.replace(tmp_path, out_path)
+    return {
+        "files": len(files),
+        "images": len(blobs),
+        "bytes": offset + len(index) + _FOOTER.size,
+        "seconds": round(time.monotonic() - started, 2),
+        "path": out_path,
+    }
+
+
+def fetch(url: str, out_path: str = PACK_PATH, timeout: float = 120.0) -> Dict[str, Any]:
+    """Baixa um pacote publicado (artefato de release), valida o formato e o instala em out_path."""
+    started = time.monotonic()
+    tmp_path = out_path + ".tmp"
+    with urllib.request.urlopen(url, timeout=timeout) as response, open(tmp_path, "wb") as out:
+        while True:
+            chunk = response.read(1024 * 1024)
+            if not chunk:
+                break
+            out.write(chunk)
+    try:
+        pack = ThumbnailPack(tmp_path)
+    except (OSError, ValueError, KeyError):
+        os.remove(tmp_path)
+        raise
+    result = {
+        "files": len(pack.files),
+        "images": len(pack.blobs),
+        "bytes": pack.size,
+        "seconds": round(time.monotonic() - started, 2),
+        "path": out_path,
+    }
+    pack.close()
+    os.replace(tmp_path, out_path)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Empacota as miniaturas .webp dos jogos num único arquivo")
+    parser.add_argument("--src", default=DEFAULT_SOURCE_DIR, help="Diretório com os .webp")
+    parser.add_argument("--out", default=PACK_PATH, help="Arquivo de saída")
+    parser.add_argument("--fetch", metavar="URL", help="Baixa e valida um pacote já publicado em vez de empacotar")
+    args = parser.parse_args()
+    result = fetch(args.fetch, args.out) if args.fetch else build(args.src, args.out)
+    print(f"[Thumbnails] {result['files']} arquivos ({result['images']} imagens distintas), "
+          f"{result['bytes'] / 1024 / 1024:.1f} MB em {result['seconds']}s -> {result['path']}")
+
+
+if __name__ == "__main__":
+    main()
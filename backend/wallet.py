@@ -0,0 +1,204 @@
+"""
+Motor de carteira do modo Seamless (/gold_api).
+
+Cada operação (debit, credit, debit_credit) é um único UPDATE condicional com RETURNING:
+a divisão bônus/saldo real, a verificação de saldo suficiente e a redução do rollover
+acontecem no SQL, sobre os valores atuais da linha. Não há SELECT antes nem depois.
+
+Concorrência:
+- PostgreSQL: o UPDATE trava a linha do usuário até o commit; um UPDATE concorrente espera
+  e reavalia o WHERE (saldo suficiente) sobre a versão já commitada (READ COMMITTED).
+- SQLite (só desenvolvimento): o lock de escrita do banco é obtido antes de qualquer leitura,
+  serializando os débitos.
+Em ambos os casos não há lost update entre dois spins simultâneos do mesmo usuário.
+
+adjust() aplica a mesma regra aos créditos/estornos fora do /gold_api (depósitos, saques,
+bônus, comissões): incremento no SQL em vez de `user.balance += x` no Python.
+"""
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from sqlalchemy import case, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models import User
+
+INVALID_USER = "INVALID_USER"
+INSUFFICIENT_USER_FUNDS = "INSUFFICIENT_USER_FUNDS"
+
+
+class WalletResult(NamedTuple):
+    ok: bool
+    user_id: Optional[int] = None
+    balance: float = 0.0
+    bonus_balance: float = 0.0
+    bonus_used: float = 0.0  # Parte da aposta paga com bônus (para o ledger)
+    error: Optional[str] = None
+
+
+def _bonus_used_expr(bet: float):
+    """Parte da aposta coberta pelo bônus: min(max(bonus_balance, 0), bet), calculada no SQL."""
+    return case(
+        (User.bonus_balance <= 0, 0.0),
+        (User.bonus_balance >= bet, bet),
+        else_=User.bonus_balance,
+    )
+
+
+def _wagering_expr(bet: float):
+    """Rollover pendente após a aposta: max(0, restante - bet); inalterado se já zerado."""
+    return case(
+        (User.bonus_wagering_remaining <= 0, User.bonus_wagering_remaining),
+        (User.bonus_wagering_remaining > bet, User.bonus_wagering_remaining - bet),
+        else_=0.0,
+    )
+
+
+def _apply(db: Session, user_code: str, bet: float, win: float) -> WalletResult:
+    """
+    Debita `bet` (primeiro do bônus, depois do saldo real) e credita `win` (sempre sacável)
+    em um único statement. Não faz commit: o chamador controla a transação.
+    """
+    bet = max(float(bet or 0.0), 0.0)
+    win = max(float(win or 0.0), 0.0)
+
+    values = {"updated_at": datetime.utcnow()}
+    where = [User.username == user_code]
+    if bet > 0:
+        bonus_used = _bonus_used_expr(bet)
+        # Todas as expressões do SET leem os valores antigos da linha (PostgreSQL e SQLite)
+        values["balance"] = User.balance - (bet - bonus_used) + win
+        values["bonus_balance"] = User.bonus_balance - bonus_used
+        values["bonus_wagering_remaining"] = _wagering_expr(bet)
+        where.append(User.balance + bonus_used >= bet)
+    else:
+        values["balance"] = User.balance + win
+
+    dialect = db.get_bind().dialect
+    returning = [User.id, User.balance, User.bonus_balance]
+    old_bonus = None
+    if bet > 0 and dialect.name == "postgresql":
+        # Ainda um único statement: a CTE trava a linha (FOR UPDATE) e expõe o bônus anterior,
+        # necessário para registrar no ledger quanto da aposta saiu do bônus
+        locked = (
+            select(User.id.label("id"), User.bonus_balance.label("old_bonus"))
+            .where(User.username == user_code)
+            .with_for_update()
+            .cte("locked")
+        )
+        where.append(User.id == locked.c.id)
+        returning.append(locked.c.old_bonus)
+    elif bet > 0:
+        # SQLite (desenvolvimento): o driver só abre a transação (BEGIN) antes de um DML, então um
+        # SELECT solto leria fora do lock de escrita. O UPDATE inócuo abaixo obtém o lock primeiro;
+        # a leitura do bônus seguinte já não pode ser alterada por um débito concorrente.
+        db.execute(
+            update(User).where(User.username == user_code)
+            .values(updated_at=values["updated_at"]).execution_options(synchronize_session=False)
+        )
+        old_bonus = db.execute(select(User.bonus_balance).where(User.username == user_code)).scalar()
+
+    stmt = update(User).where(*where).values(**values).execution_options(synchronize_session=False)
+
+    if dialect.update_returning:
+        row = db.execute(stmt.returning(*returning)).first()
+    else:
+        # Fallback para bancos sem UPDATE ... RETURNING (SQLite < 3.35): a leitura ocorre na mesma transação
+        result = db.execute(stmt)
+        row = None
+        if result.rowcount:
+            row = db.execute(
+                select(User.id, User.balance, User.bonus_balance).where(User.username == user_code)
+            ).first()
+
+    if row is not None:
+        if len(row) > 3:
+            old_bonus = row[3]
+        return WalletResult(
+            ok=True,
+            user_id=row[0],
+            balance=float(row[1]),
+            bonus_balance=float(row[2] or 0.0),
+            bonus_used=min(max(float(old_bonus or 0.0), 0.0), bet),
+        )
+
+    # Nenhuma linha atualizada: usuário inexistente ou saldo insuficiente (caminho raro)
+    current = db.execute(
+        select(User.id, User.balance, User.bonus_balance).where(User.username == user_code)
+    ).first()
+    if current is None:
+        return WalletResult(ok=False, error=INVALID_USER)
+    return WalletResult(
+        ok=False,
+        user_id=current[0],
+        balance=float(current[1]),
+        bonus_balance=float(current[2] or 0.0),
+        error=INSUFFICIENT_USER_FUNDS,
+    )
+
+
+def debit(db: Session, user_code: str, bet: float) -> WalletResult:
+    """Aposta: reduz primeiro o bonus_balance, o restante sai do saldo real."""
+    return _apply(db, user_code, bet, 0.0)
+
+
+def credit(db: Session, user_code: str, win: float) -> WalletResult:
+    """Ganho: credita apenas o saldo real (ganhos são sempre sacáveis)."""
+    return _apply(db, user_code, 0.0, win)
+
+
+def debit_credit(db: Session, user_code: str, bet: float, win: float) -> WalletResult:
+    """Aposta e ganho na mesma rodada, aplicados em um único UPDATE."""
+    return _apply(db, user_code, bet, win)
+
+
+def adjust(
+    db: Session,
+    user: User,
+    balance_delta: float,
+    bonus_delta: float = 0.0,
+    min_balance: Optional[float] = None,
+) -> WalletResult:
+    """
+    Soma `balance_delta` / `bonus_delta` ao saldo de `user` com um UPDATE atômico
+    (balance = balance + delta), para créditos e estornos fora do /gold_api (depósitos, saques,
+    bônus, comissões). Nunca lê-modifica-grava no Python: um débito concorrente do /gold_api
+    não é sobrescrito. Com `min_balance`, só aplica se o saldo atual for >= min_balance.
+
+    Os novos valores são gravados no objeto `user` como já persistidos (sem marcá-lo como
+    alterado). Não faz commit: o chamador controla a transação.
+    """
+    values = {
+        "balance": User.balance + float(balance_delta or 0.0),
+        "updated_at": datetime.utcnow(),
+    }
+    if bonus_delta:
+        values["bonus_balance"] = User.bonus_balance + float(bonus_delta)
+    where = [User.id == user.id]
+    if min_balance is not None:
+        where.append(User.balance >= float(min_balance))
+
+    stmt = update(User).where(*where).values(**values).execution_options(synchronize_session=False)
+    if db.get_bind().dialect.update_returning:
+        row = db.execute(stmt.returning(User.balance, User.bonus_balance, User.updated_at)).first()
+    else:
+        row = None
+        if db.execute(stmt).rowcount:
+            row = db.execute(
+                select(User.balance, User.bonus_balance, User.updated_at).where(User.id == user.id)
+            ).first()
+
+    if row is None:
+        db.refresh(user, ["balance", "bonus_balance"])
+        return WalletResult(
+            ok=False,
+            user_id=user.id,
+            balance=float(user.balance or 0.0),
+            bonus_balance=float(user.bonus_balance or 0.0),
+            error=INSUFFICIENT_USER_FUNDS,
+        )
+    set_committed_value(user, "balance", row[0])
+    set_committed_value(user, "bonus_balance", row[1])
+    set_committed_value(user, "updated_at", row[2])
+    return WalletResult(ok=True, user_id=user.id, balance=float(row[0]), bonus_balance=float(row[1] or 0.0))
@@ -0,0 +1,107 @@
+"""
+Journal de idempotência das transações do /gold_api.
+
+O IGameWin reenvia chamadas `transaction` quando não recebe resposta a tempo. Cada transação
+processada grava a resposta calculada em gold_api_transactions, na MESMA transação do banco que
+alterou o saldo. Um retry com o mesmo (agent_code, txn_id, txn_type) é respondido com uma leitura
+indexada, sem tocar na linha do usuário nem em bets.
+
+Linhas mais antigas que a janela de retenção são removidas periodicamente (prune_loop), mantendo
+a tabela pequena e quente em cache.
+"""
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from models import GoldApiTransaction
+
+# Retries do provider chegam em segundos/minutos; 72h cobre reprocessamentos manuais
+RETENTION_HOURS = float(os.getenv("GOLD_API_JOURNAL_RETENTION_HOURS", "72"))
+PRUNE_INTERVAL_SECONDS = int(os.getenv("GOLD_API_JOURNAL_PRUNE_INTERVAL_SECONDS", "3600"))
+
+
+def lookup(db: Session, agent_code: str, txn_id: str, txn_type: str) -> Optional[Dict[str, Any]]:
+    """Resposta já gravada para esta transação, ou None se ainda não foi processada."""
+    stored = db.execute(
+        select(GoldApiTransaction.response_json).where(
+            GoldApiTransaction.agent_code == agent_code,
+            GoldApiTransaction.txn_id == txn_id,
+            GoldApiTransaction.txn_type == txn_type,
+        )
+    ).scalar()
+    if stored is None:
+        return None
+    return json.loads(stored)
+
+
+def record(
+    db: Session,
+    agent_code: str,
+    txn_id: str,
+    txn_type: str,
+    user_code: str,
+    response: Dict[str, Any],
+    bet: Optional[Dict[str, Any]] = None,
+) -> GoldApiTransaction:
+    """
+    Registra a resposta no journal. Não faz commit: deve entrar no mesmo commit da alteração de
+    saldo. Um retry concorrente que chegue ao commit depois viola a chave única (IntegrityError).
+    `bet` é o registro de aposta entregue ao write-behind, guardado para recuperação após crash.
+    """
+    entry = GoldApiTransaction(
+        agent_code=agent_code,
+        txn_id=txn_id,
+        txn_type=txn_type,
+        user_code=user_code,
+        response_json=json.dumps(response),
+        bet_json=json.dumps(bet) if bet is not None else None,
+        bet_persisted=bet is None,
+    )
+    db.add(entry)
+    return entry
+
+
+def prune(db: Session, retention_hours: float = RETENTION_HOURS) -> int:
+    """
+    Remove entradas fora da janela de retenção. Entradas cuja aposta ainda não foi persistida
+    pelo write-behind são mantidas. Retorna o número de linhas removidas.
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=retention_hours)
+    deleted = db.execute(
+        delete(GoldApiTransaction).where(
+            GoldApiTransaction.created_at < cutoff,
+            GoldApiTransaction.bet_persisted == True,
+        )
+    ).rowcount
+    db.commit()
+    return deleted or 0
+
+
+def _prune_once() -> int:
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return prune(db)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def prune_loop() -> None:
+    """Tarefa de fundo: poda o journal a cada PRUNE_INTERVAL_SECONDS."""
+    while True:
+        try:
+            deleted = await asyncio.to_thread(_prune_once)
+            if deleted:
+                print(f"[Gold API Journal] {deleted} transações antigas removidas (retenção: {RETENTION_HOURS}h)")
+        except Exception as e:
+            print(f"[Gold API Journal] Erro ao podar journal: {e}")
+        await asyncio.sleep(PRUNE_INTERVAL_SECONDS)
@@ -0,0 +1,266 @@
+"""
+Ledger append-only da carteira (wallet_entries) com snapshots periódicos (wallet_snapshots).
+
+Toda alteração de users.balance / users.bonus_balance grava uma WalletEntry com as variações,
+na mesma transação da alteração. O ledger nunca é atualizado nem apagado.
+
+Snapshots: a tarefa de fundo (snapshot_loop) consolida, para cada usuário com entradas novas,
+o saldo após a última entrada. Assim o saldo em um instante qualquer é um snapshot + a soma de
+uma cauda curta de entradas, sem varrer o histórico. O primeiro snapshot de um usuário é o saldo
+de abertura (entry_id=0): saldo atual menos todas as entradas, calculado em um único statement.
+
+Entradas mais novas que WALLET_SNAPSHOT_LAG_SECONDS não entram no snapshot: uma transação que
+obteve um id menor mas ainda não commitou não pode ficar para trás do snapshot.
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+import balance_cache
+from models import User, WalletEntry, WalletSnapshot
+
+SNAPSHOT_INTERVAL_SECONDS = int(os.getenv("WALLET_SNAPSHOT_INTERVAL_SECONDS", "900"))
+SNAPSHOT_LAG_SECONDS = int(os.getenv("WALLET_SNAPSHOT_LAG_SECONDS", "60"))
+_CHUNK_SIZE = 500
+
+# Tipos de entrada
+KIND_BET = "bet"
+KIND_WIN = "win"
+KIND_DEPOSIT = "deposit"
+KIND_DEPOSIT_REVERSAL = "deposit_reversal"
+KIND_WITHDRAWAL = "withdrawal"
+KIND_WITHDRAWAL_REFUND = "withdrawal_refund"
+KIND_PROMOTION_BONUS = "promotion_bonus"
+KIND_ADMIN_BONUS = "admin_bonus"
+KIND_ADMIN_ADJUSTMENT = "admin_adjustment"
+KIND_AFFILIATE_REVSHARE = "affiliate_revshare"
+KIND_AFFILIATE_CPA = "affiliate_cpa"
+KIND_MANAGER_REVSHARE = "manager_revshare"
+KIND_MANAGER_CPA = "manager_cpa"
+
+
+def record(
+    db: Session,
+    user_id: int,
+    kind: str,
+    balance_delta: float,
+    bonus_delta: float = 0.0,
+    reference: Optional[Any] = None,
+) -> Optional[WalletEntry]:
+    """
+    Registra uma alteração de saldo. Não faz commit: entra na transação do chamador.
+    Retorna a entrada (id após o flush; versão do saldo no balance_cache), ou None sem variação.
+    """
+    if not balance_delta and not bonus_delta:
+        return None
+    entry = WalletEntry(
+        user_id=user_id,
+        kind=kind,
+        balance_delta=float(balance_delta),
+        bonus_delta=float(bonus_delta or 0.0),
+        reference=str(reference) if reference is not None else None,
+    )
+    db.add(entry)
+    # Saldo mudou: o cache do user_balance é invalidado após o commit desta sessão
+    balance_cache.mark_dirty(db, user_id, entry)
+    return entry
+
+
+def _entry_dict(entry: WalletEntry) -> Dict[str, Any]:
+    return {
+        "id": entry.id,
+        "kind": entry.kind,
+        "balance_delta": float(entry.balance_delta),
+        "bonus_delta": float(entry.bonus_delta),
+        "reference": entry.reference,
+        "created_at": entry.created_at.isoformat(),
+    }
+
+
+def statement(db: Session, user_id: int, limit: int = 50, cursor: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Extrato paginado por keyset (mais recente primeiro). `cursor` é o id da última entrada da
+    página anterior; o custo de qualquer página é o mesmo da primeira.
+    """
+    query = select(WalletEntry).where(WalletEntry.user_id == user_id)
+    if cursor is not None:
+        query = query.where(WalletEntry.id < cursor)
+    entries = db.execute(query.order_by(WalletEntry.id.desc()).limit(limit + 1)).scalars().all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    return {
+        "entries": [_entry_dict(e) for e in entries],
+        "next_cursor": entries[-1].id if has_more and entries else None,
+    }
+
+
+def _opening_balances(db: Session, user_ids: Iterable[int]) -> Dict[int, tuple]:
+    """Saldo de abertura = saldo atual - soma de todas as entradas (um statement, leitura consistente)."""
+    balance_sum = (
+        select(func.coalesce(func.sum(WalletEntry.balance_delta), 0.0))
+        .where(WalletEntry.user_id == User.id)
+        .scalar_subquery()
+    )
+    bonus_sum = (
+        select(func.coalesce(func.sum(WalletEntry.bonus_delta), 0.0))
+        .where(WalletEntry.user_id == User.id)
+        .scalar_subquery()
+    )
+    rows = db.execute(
+        select(User.id, User.balance - balance_sum, User.bonus_balance - bonus_sum).where(User.id.in_(list(user_ids)))
+    ).all()
+    return {user_id: (float(balance), float(bonus or 0.0)) for user_id, balance, bonus in rows}
+
+
+def balance_at(db: Session, user_id: int, at: datetime) -> Dict[str, Any]:
+    """Saldo do usuário no instante `at`: um snapshot + a cauda de entradas até `at`."""
+    last_entry_id = db.execute(
+        select(func.max(WalletEntry.id)).where(WalletEntry.user_id == user_id, WalletEntry.created_at <= at)
+    ).scalar() or 0
+
+    snapshot = db.execute(
+        select(WalletSnapshot)
+        .where(WalletSnapshot.user_id == user_id, WalletSnapshot.entry_id <= last_entry_id)
+        .order_by(WalletSnapshot.entry_id.desc())
+        .limit(1)
+    ).scalar()
+    if snapshot is not None:
+        base_entry_id = snapshot.entry_id
+        base_balance, base_bonus = float(snapshot.balance), float(snapshot.bonus_balance)
+    else:
+        # Usuário ainda sem snapshot: calcula a abertura na hora (varre as entradas dele uma vez)
+        base_entry_id = 0
+        base_balance, base_bonus = _opening_balances(db, [user_id]).get(user_id, (0.0, 0.0))
+
+    tail_balance, tail_bonus, tail_count = db.execute(
+        select(
+            func.coalesce(func.sum(WalletEntry.balance_delta), 0.0),
+            func.coalesce(func.sum(WalletEntry.bonus_delta), 0.0),
+            func.count(WalletEntry.id),
+        ).where(
+            WalletEntry.user_id == user_id,
+            WalletEntry.id > base_entry_id,
+            WalletEntry.id <= last_entry_id,
+        )
+    ).one()
+    return {
+        "user_id": user_id,
+        "at": at.isoformat(),
+        "balance": round(base_balance + float(tail_balance), 2),
+        "bonus_balance": round(base_bonus + float(tail_bonus), 2),
+        "snapshot_entry_id": base_entry_id,
+        "last_entry_id": last_entry_id,
+        "tail_entries": tail_count,
+    }
+
+
+def take_snapshots(db: Session, lag_seconds: int = SNAPSHOT_LAG_SECONDS) -> int:
+    """
+    Cria snapshots para usuários com entradas novas desde a última rodada. Retorna quantos.
+
+    A marca d'água é o maior entry_id já consolidado (global), então a rodada inteira é um único
+    commit: se um lote falhar, nenhum snapshot da rodada é gravado e a próxima refaz todos os
+    usuários (um commit por lote subiria a marca e pularia para sempre os usuários do lote falho).
+    """
+    watermark = db.execute(select(func.max(WalletSnapshot.entry_id))).scalar() or 0
+    upper = db.execute(
+        select(func.max(WalletEntry.id)).where(
+            WalletEntry.created_at < datetime.utcnow() - timedelta(seconds=lag_seconds)
+        )
+    ).scalar()
+    if not upper or upper <= watermark:
+        return 0
+
+    deltas = db.execute(
+        select(
+            WalletEntry.user_id,
+            func.sum(WalletEntry.balance_delta),
+            func.sum(WalletEntry.bonus_delta),
+            func.max(WalletEntry.id),
+        )
+        .where(WalletEntry.id > watermark, WalletEntry.id <= upper)
+        .group_by(WalletEntry.user_id)
+    ).all()
+
+    created = 0
+    for i in range(0, len(deltas), _CHUNK_SIZE):
+        chunk = deltas[i:i + _CHUNK_SIZE]
+        user_ids = [row[0] for row in chunk]
+        latest = (
+            select(WalletSnapshot.user_id, func.max(WalletSnapshot.entry_id).label("entry_id"))
+            .where(WalletSnapshot.user_id.in_(user_ids))
+            .group_by(WalletSnapshot.user_id)
+            .subquery()
+        )
+        previous = {
+            s.user_id: (float(s.balance), float(s.bonus_balance))
+            for s in db.execute(
+                select(WalletSnapshot).join(
+                    latest,
+                    (WalletSnapshot.user_id == latest.c.user_id) & (WalletSnapshot.entry_id == latest.c.entry_id),
+                )
+            ).scalars()
+        }
+
+        # Usuários sem snapshot: abertura + todas as entradas até a última deste lote
+        missing = [uid for uid in user_ids if uid not in previous]
+        full_sums = {}
+        if missing:
+            opening = _opening_balances(db, missing)
+            for uid in missing:
+                balance, bonus = opening.get(uid, (0.0, 0.0))
+                db.add(WalletSnapshot(user_id=uid, entry_id=0, balance=balance, bonus_balance=bonus))
+                created += 1
+            full_sums = {
+                uid: (float(b or 0.0), float(bb or 0.0))
+                for uid, b, bb in db.execute(
+                    select(WalletEntry.user_id, func.sum(WalletEntry.balance_delta), func.sum(WalletEntry.bonus_delta))
+                    .where(WalletEntry.user_id.in_(missing), WalletEntry.id <= upper)
+                    .group_by(WalletEntry.user_id)
+                ).all()
+            }
+            previous.update(opening)
+
+        for user_id, balance_delta, bonus_delta, last_id in chunk:
+            base_balance, base_bonus = previous.get(user_id, (0.0, 0.0))
+            if user_id in full_sums:
+                balance_delta, bonus_delta = full_sums[user_id]
+            db.add(WalletSnapshot(
+                user_id=user_id,
+                entry_id=last_id,
+                balance=base_balance + float(balance_delta or 0.0),
+                bonus_balance=base_bonus + float(bonus_delta or 0.0),
+            ))
+            created += 1
+        db.flush()
+    db.commit()
+    return created
+
+
+def _snapshot_once() -> int:
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        return take_snapshots(db)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def snapshot_loop() -> None:
+    """Tarefa de fundo: consolida snapshots a cada SNAPSHOT_INTERVAL_SECONDS."""
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL_SECONDS)
+        try:
+            created = await asyncio.to_thread(_snapshot_once)
+            if created:
+                print(f"[Wallet Ledger] {created} snapshots de saldo criados")
+        except Exception as e:
+            print(f"[Wallet Ledger] Erro ao criar snapshots: {e}")